@@ -0,0 +1,111 @@
+class AvailabilityIndex:
+    """Индекс доступности календаря в памяти.
+
+    Для каждого месяца хранятся две битовые маски (бит N-1 - день N):
+    рабочие дни и дни с оплаченными бронированиями. Свободные дни месяца -
+    это work & ~booked, то есть одна операция над целыми числами.
+    Database обновляет индекс точечно при каждой записи, меняющей доступность.
+    Наружу (в поток event loop) отдается только snapshot(): живой индекс
+    меняется в потоке базы, и обход его словарей мог бы сломаться посередине.
+    """
+
+    def __init__(self):
+        self._work = {}  # (год, месяц) -> маска рабочих дней
+        self._booked = {}  # (год, месяц) -> маска забронированных дней
+        self._frozen = False
+
+    @classmethod
+    def load(cls, work_days, booked_dates):
+        """Строит индекс из списков дат YYYY-MM-DD"""
+        index = cls()
+        for work_date in work_days:
+            index.set_work_day(work_date, True)
+        for booked_date in booked_dates:
+            index.set_booked(booked_date, True)
+        return index
+
+    @staticmethod
+    def _parse(date_iso):
+        """'YYYY-MM-DD' -> ((год, месяц), бит дня)"""
+        year, month, day = int(date_iso[:4]), int(date_iso[5:7]), int(date_iso[8:10])
+        return (year, month), 1 << (day - 1)
+
+    def snapshot(self, year=None, month=None):
+        """Неизменяемая копия индекса: целиком или только маски месяца (year, month)"""
+        snapshot = AvailabilityIndex()
+        if year is None:
+            snapshot._work = dict(self._work)
+            snapshot._booked = dict(self._booked)
+        else:
+            for masks, copy in ((self._work, snapshot._work), (self._booked, snapshot._booked)):
+                if (year, month) in masks:
+                    copy[(year, month)] = masks[(year, month)]
+        snapshot._frozen = True
+        return snapshot
+
+    def _set(self, masks, date_iso, value):
+        if self._frozen:
+            raise TypeError("Снимок индекса доступности не изменяется")
+        key, bit = AvailabilityIndex._parse(date_iso)
+        mask = masks.get(key, 0)
+        mask = mask | bit if value else mask & ~bit
+        if mask:
+            masks[key] = mask
+        else:
+            masks.pop(key, None)
+
+    def set_work_day(self, date_iso, is_work_day):
+        """Отмечает день рабочим или нерабочим"""
+        self._set(self._work, date_iso, is_work_day)
+
+    def set_booked(self, date_iso, is_booked):
+        """Отмечает день занятым или свободным"""
+        self._set(self._booked, date_iso, is_booked)
+
+    def is_work_day(self, date_iso):
+        key, bit = self._parse(date_iso)
+        return bool(self._work.get(key, 0) & bit)
+
+    def is_booked(self, date_iso):
+        key, bit = self._parse(date_iso)
+        return bool(self._booked.get(key, 0) & bit)
+
+    def is_free(self, date_iso):
+        """Рабочий день без оплаченного бронирования"""
+        return self.is_work_day(date_iso) and not self.is_booked(date_iso)
+
+    def work_mask(self, year, month):
+        return self._work.get((year, month), 0)
+
+    def booked_mask(self, year, month):
+        return self._booked.get((year, month), 0)
+
+    def free_mask(self, year, month):
+        """Маска свободных дней месяца"""
+        return self.work_mask(year, month) & ~self.booked_mask(year, month)
+
+    def free_count(self, year, month):
+        """Количество свободных дней в месяце"""
+        return self.free_mask(year, month).bit_count()
+
+    @staticmethod
+    def days(mask):
+        """Номера дней, отмеченных в маске, по возрастанию"""
+        days = []
+        while mask:
+            low_bit = mask & -mask
+            days.append(low_bit.bit_length())
+            mask ^= low_bit
+        return days
+
+    def free_days(self, year, month):
+        """Свободные дни месяца"""
+        return self.days(self.free_mask(year, month))
+
+    def work_days(self, year, month):
+        """Рабочие дни месяца"""
+        return self.days(self.work_mask(year, month))
+
+    def months(self):
+        """Месяцы (год, месяц), в которых есть рабочие дни, по возрастанию"""
+        return sorted(self._work)
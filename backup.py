@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime
+import logging
+import os
+import sqlite3
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def list_snapshots(backup_dir=None):
+    """Возвращает пути к снимкам базы, от новых к старым"""
+    backup_dir = backup_dir or config.BACKUP_DIR
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted((name for name in os.listdir(backup_dir)
+                    if name.startswith('bookings-') and name.endswith('.db')), reverse=True)
+    return [os.path.join(backup_dir, name) for name in names]
+
+
+def rotate_snapshots(backup_dir=None, keep=None):
+    """Удаляет старые снимки, оставляя keep последних. Возвращает удаленные пути"""
+    keep = config.BACKUP_KEEP if keep is None else keep
+    removed = list_snapshots(backup_dir)[keep:]
+    for path in removed:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Не удалось удалить старый снимок {path}: {e}")
+    return removed
+
+
+def create_snapshot(source_path=None, backup_dir=None, keep=None, pages=None):
+    """Делает согласованный снимок базы через SQLite backup API.
+
+    Копирование идет отдельным подключением порциями по pages страниц
+    с паузой config.BACKUP_STEP_SLEEP между ними, поэтому общее подключение
+    бота не занято, а писатели успевают добраться до диска. Чтение выполняется внутри одной
+    транзакции: в режиме WAL писатели не ждут резервного копирования, а снимок
+    соответствует моменту начала и не перезапускается при каждой записи.
+    Снимок пишется во временный файл и переименовывается только после проверки.
+    Возвращает путь к снимку.
+    """
+    source_path = source_path or config.DATABASE_PATH
+    backup_dir = backup_dir or config.BACKUP_DIR
+    pages = pages or config.BACKUP_PAGES_PER_STEP
+    if not os.path.isfile(source_path):
+        raise FileNotFoundError(f"Нет файла базы для резервного копирования: {source_path}")
+    os.makedirs(backup_dir, exist_ok=True)
+
+    path = os.path.join(backup_dir, f"bookings-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    tmp_path = path + '.tmp'
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        # sleep у backup() срабатывает только на BUSY/LOCKED, паузу между шагами делаем сами
+        if remaining:
+            time.sleep(config.BACKUP_STEP_SLEEP)
+
+    started = time.perf_counter()
+    source = sqlite3.connect(source_path, isolation_level=None,
+                             timeout=config.DB_BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        source.backup(target, pages=pages, progress=progress)
+        source.execute('COMMIT')
+
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"Снимок не прошел проверку: {check}")
+    except Exception:
+        target.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+    target.close()
+    os.replace(tmp_path, path)
+    rotate_snapshots(backup_dir, keep)
+
+    logger.info(f"Снимок базы сохранен в {path}: {steps} шагов, "
+                f"{time.perf_counter() - started:.2f} с")
+    return path
+
+
+async def create_snapshot_async(**kwargs):
+    """Делает снимок базы в отдельном потоке, не блокируя event loop"""
+    return await asyncio.to_thread(create_snapshot, **kwargs)
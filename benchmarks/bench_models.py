@@ -0,0 +1,45 @@
+"""Микробенчмарк: чтение строк кортежами и объектами Booking.
+
+Запуск из корня репозитория: python benchmarks/bench_models.py
+"""
+import os
+import sqlite3
+import sys
+import timeit
+from dataclasses import fields
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Booking  # noqa: E402
+
+ROWS = 10000
+
+
+def main():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f'CREATE TABLE bookings ({Booking.COLUMNS})')
+    conn.executemany(
+        f'INSERT INTO bookings VALUES ({", ".join("?" * len(fields(Booking)))})',
+        [(i, i, 'user', 'Имя', '2025-01-01', 'active', 1, 0, 0, 'p', '2025-01-01', None) for i in range(ROWS)]
+    )
+    query = f'SELECT {Booking.COLUMNS} FROM bookings'
+
+    def read_tuples():
+        return [(row[1], row[4], row[7]) for row in conn.execute(query)]
+
+    def read_objects():
+        cursor = conn.cursor()
+        cursor.row_factory = Booking.from_row
+        return [(row.user_id, row.booking_date, row.final_paid) for row in cursor.execute(query)]
+
+    for name, func in (('кортежи', read_tuples), ('Booking', read_objects)):
+        seconds = min(timeit.repeat(func, number=10, repeat=5)) / 10
+        print(f"{name:>8}: {seconds * 1000:.2f} мс на {ROWS} строк")
+
+    row = conn.execute(query).fetchone()
+    print(f"Размер строки: кортеж {sys.getsizeof(row)} байт, Booking {sys.getsizeof(Booking(*row))} байт")
+
+
+if __name__ == "__main__":
+    main()
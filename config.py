@@ -11,6 +11,31 @@ ADMIN_ID = 1049262607  # замените на ваш ID
 # Настройки ЮKassa
 YKASSA_SHOP_ID = "1189684"
 YKASSA_SECRET_KEY = "test_DLJOgncejANZ4ur9bX_QguVoeP3QbNNrZhxqXeF8J-A"
+YKASSA_API_URL = "https://api.yookassa.ru/v3"  # адрес API (для проверки можно указать локальную заглушку)
+YKASSA_TIMEOUT = 15  # общий таймаут запроса к ЮKassa, секунд
+YKASSA_CONNECT_TIMEOUT = 5  # таймаут установки соединения, секунд
+YKASSA_POOL_SIZE = 10  # сколько соединений с ЮKassa держать одновременно
+YKASSA_RETRY_ATTEMPTS = 3  # сколько раз повторять запрос после временной ошибки
+YKASSA_RETRY_BASE_DELAY = 0.5  # начальная пауза перед повтором, секунд
+YKASSA_RETRY_MAX_DELAY = 8  # максимальная пауза перед повтором, секунд
+
+# База данных
+DATABASE_BACKEND = "sqlite"  # sqlite - файл DATABASE_PATH (или ":memory:"), memory - все в памяти процесса
+DATABASE_PATH = "bookings.db"
+DB_CACHE_SIZE_KB = 16384  # кеш страниц SQLite, 16 МБ
+DB_MMAP_SIZE = 64 * 1024 * 1024  # отображение файла БД в память, 64 МБ
+DB_BUSY_TIMEOUT_MS = 5000  # сколько ждать освобождения блокировки
+DB_QUERY_STATS = True  # собирать статистику выполнения SQL (команда /db_stats)
+DB_SLOW_QUERY_MS = 50  # запросы дольше этого порога пишутся в лог
+DB_CHECK_QUERY_PLANS = False  # отладка: при запуске проверять планы горячих запросов (в CI это делает тест)
+ARCHIVE_AFTER_DAYS = 90  # через сколько дней после даты съемки закрытые записи уходят в архив
+ARCHIVE_HOUR = 4  # время ежедневного переноса в архив (4 утра)
+RECONCILE_HOUR = 5  # время ежедневной сверки базы с Google Sheets (5 утра)
+BACKUP_DIR = "backups"  # каталог снимков базы
+BACKUP_KEEP = 7  # сколько последних снимков хранить
+BACKUP_HOUR = 3  # время ежедневного снимка (3 утра)
+BACKUP_PAGES_PER_STEP = 256  # страниц за один шаг backup API
+BACKUP_STEP_SLEEP = 0.005  # пауза между шагами backup API (после каждых BACKUP_PAGES_PER_STEP страниц), секунды
 
 # Google Sheets
 SPREADSHEET_ID = "15FQvcGYrorzf1vXLa992RiRuIJFxzLVyy2CSkitJjVg"  # из URL таблицы
@@ -55,8 +80,32 @@ PROJECTS = {
     }
 }
 
+# Сколько минут дата держится за клиентом, пока он оплачивает предоплату
+DATE_HOLD_TTL_MINUTES = 30
+
 # Настройки напоминаний
 REMINDER_HOUR = 9  # время отправки напоминаний (9 утра)
+BRIEF_REMINDER_DAYS = 3  # напоминать о брифе за столько дней до проекта
+
+# Google Sheets
+SHEETS_CACHE_TTL = 60  # сколько секунд снимок таблицы считается свежим
+SHEETS_FULL_RESYNC_INTERVAL = 3600  # раз во сколько секунд перечитывать таблицу целиком
+SHEETS_FLUSH_INTERVAL = 2  # раз во сколько секунд отправлять накопленные изменения
+SHEETS_FLUSH_BATCH = 50  # отправлять сразу, если накопилось столько изменений
+SHEETS_CALL_TIMEOUT = 30  # сколько секунд ждать результата вызова Google Sheets
+SHEETS_READS_PER_MINUTE = 50  # лимит чтений в минуту (квота Google - 60 на пользователя)
+SHEETS_WRITES_PER_MINUTE = 50  # лимит записей в минуту (квота Google - 60 на пользователя)
+SHEETS_QUOTA_BURST = 10  # сколько запросов можно сделать подряд без ожидания
+SHEETS_RETRY_ATTEMPTS = 5  # сколько раз повторять запрос после 429, 5xx и сетевых ошибок
+SHEETS_RETRY_BASE_DELAY = 1  # предел паузы перед первым повтором, секунд (дальше удваивается)
+SHEETS_RETRY_MAX_DELAY = 32  # максимальный предел паузы между повторами, секунд
+SHEETS_RECONNECT_MIN = 5  # пауза перед повторным подключением, секунд (дальше удваивается)
+SHEETS_RECONNECT_MAX = 300  # максимальная пауза между попытками подключения, секунд
+SHEETS_RECONNECT_AFTER_FAILURES = 5  # переподключаться после стольких ошибок подряд
+SHEETS_OUTBOX_INTERVAL = 5  # раз во сколько секунд реле проверяет outbox
+SHEETS_OUTBOX_BATCH = 50  # сколько событий доставлять за один проход
+SHEETS_OUTBOX_RETRY_BASE = 5  # задержка первой повторной попытки, секунд (дальше удваивается)
+SHEETS_OUTBOX_RETRY_MAX = 600  # максимальная задержка между попытками, секунд
 
 # Настройки календаря
 MONTHS_TO_SHOW = 3  # Показывать 3 месяца вперед
@@ -1,94 +1,244 @@
+import asyncio
+import functools
+import json
 import sqlite3
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 import logging
-import config  # ДОБАВИЛИ ИМПОРТ CONFIG
+from contextlib import contextmanager
+import config
+import migrations
+from availability import AvailabilityIndex
+from repository import (BookingRepository, ACTIVE_PAID_FILTERS, BOOKING_FLAG_FILTERS, BOOKING_STATUSES,
+                        TODAY_UNPAID_FILTERS, UPCOMING_NO_BRIEF_FILTERS, check_booking_changes,
+                        OUTBOX_ADD_BOOKING, OUTBOX_BOOKING_STATUS, SHEET_PAYMENT_STATUSES,
+                        SHEET_PROJECT_COMPLETED, outbox_key)
+from query_stats import InstrumentedConnection
+from models import Booking, Payment, WorkDay, ChatSession, BookingCounters, OutboxEvent
 
 logger = logging.getLogger(__name__)
 
-
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('bookings.db', check_same_thread=False)
-        self.create_tables()
-
-    def create_tables(self):
-        """Создает таблицы в базе данных"""
+# Запросы горячих методов. Их же проверяет check_query_plans, поэтому
+# метод и проверка плана не могут разойтись
+SQL_IS_DATE_AVAILABLE = '''
+    SELECT COUNT(*) FROM bookings
+    WHERE booking_date = ? AND status = 'active' AND deposit_paid = TRUE
+'''
+SQL_BOOKED_DATES = '''
+    SELECT booking_date FROM bookings
+    WHERE deposit_paid = TRUE AND status = 'active'
+'''
+SQL_USER_BOOKINGS = f'''
+    SELECT {Booking.COLUMNS} FROM bookings WHERE user_id = ? ORDER BY booking_date DESC
+'''
+SQL_USER_BOOKING_DATE = '''
+    SELECT booking_date FROM bookings
+    WHERE user_id = ? AND deposit_paid = TRUE
+    ORDER BY created_at DESC LIMIT 1
+'''
+SQL_PENDING_PAYMENTS = f'''
+    SELECT {Payment.COLUMNS}
+    FROM payments WHERE status = 'pending'
+'''
+SQL_DUE_OUTBOX_EVENTS = f'''
+    SELECT {OutboxEvent.COLUMNS} FROM sheets_outbox AS event
+    WHERE sent_at IS NULL AND next_attempt_at <= CURRENT_TIMESTAMP
+      AND NOT EXISTS (SELECT 1 FROM sheets_outbox AS earlier
+                      WHERE earlier.sent_at IS NULL AND earlier.user_id = event.user_id
+                        AND earlier.booking_date = event.booking_date AND earlier.id < event.id)
+    ORDER BY next_attempt_at, id LIMIT ?
+'''
+
+
+def bookings_between_query(start=None, end=None, **filters):
+    """Запрос get_bookings_between: (SQL, параметры).
+
+    Фильтры (BOOKING_FLAG_FILTERS, BOOKING_STATUSES) подставляются
+    в запрос литералами, чтобы планировщик мог использовать частичные индексы
+    """
+    conditions = []
+    params = []
+
+    if start is not None:
+        conditions.append('booking_date >= ?')
+        params.append(str(start))
+    if end is not None:
+        conditions.append('booking_date <= ?')
+        params.append(str(end))
+
+    for name, value in filters.items():
+        if name in BOOKING_FLAG_FILTERS:
+            conditions.append(f"{name} = {'TRUE' if value else 'FALSE'}")
+        elif name == 'status':
+            if value not in BOOKING_STATUSES:
+                raise ValueError(f"Неизвестный статус бронирования: {value}")
+            conditions.append(f"status = '{value}'")
+        elif name == 'user_id':
+            conditions.append('user_id = ?')
+            params.append(value)
+        else:
+            raise ValueError(f"Неизвестный фильтр бронирований: {name}")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT {Booking.COLUMNS} FROM bookings
+        {where}
+        ORDER BY booking_date
+    ''', params
+
+
+# Горячие запросы, которые не должны превращаться в полный просмотр таблицы
+HOT_QUERIES = {
+    'is_date_available': (SQL_IS_DATE_AVAILABLE, ('2025-01-01',)),
+    'get_booked_dates': (SQL_BOOKED_DATES, ()),
+    'get_active_paid_bookings': bookings_between_query(**ACTIVE_PAID_FILTERS),
+    'get_upcoming_bookings': bookings_between_query('2025-01-01', '2025-01-31', **UPCOMING_NO_BRIEF_FILTERS),
+    'get_today_bookings': bookings_between_query('2025-01-01', '2025-01-01', **TODAY_UNPAID_FILTERS),
+    'get_user_bookings': (SQL_USER_BOOKINGS, (1,)),
+    'get_user_booking_date': (SQL_USER_BOOKING_DATE, (1,)),
+    'get_pending_payments': (SQL_PENDING_PAYMENTS, ()),
+    'get_due_outbox_events': (SQL_DUE_OUTBOX_EVENTS, (50,)),
+}
+
+
+class Database(BookingRepository):
+    def __init__(self, path=None):
+        self.path = path or config.DATABASE_PATH
+        factory = InstrumentedConnection if config.DB_QUERY_STATS else sqlite3.Connection
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, factory=factory)
+        self._transaction_depth = 0
+        self._availability = None
+        self.configure()
+        migrations.migrate(self.conn, self.path)
+
+    def configure(self):
+        """Настраивает SQLite: WAL-журнал, кеш, mmap и ожидание блокировок"""
         cursor = self.conn.cursor()
+        # WAL: читатели не блокируют писателя, commit не переписывает всю БД
+        cursor.execute('PRAGMA journal_mode = WAL')
+        # В режиме WAL NORMAL безопасен и убирает fsync на каждом commit
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        # Отрицательное значение - размер кеша в килобайтах
+        cursor.execute(f'PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}')
+        cursor.execute(f'PRAGMA mmap_size = {config.DB_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA busy_timeout = {config.DB_BUSY_TIMEOUT_MS}')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+
+    @contextmanager
+    def transaction(self):
+        """Объединяет несколько операций в одну транзакцию с одним commit.
+
+        Методы, вызванные внутри, не коммитят сами - commit выполняется
+        один раз при выходе, при ошибке все изменения откатываются.
+        Вложенные транзакции присоединяются к внешней.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.rollback()
+                # Индекс мог получить изменения, которые откатились - перестроим его
+                self._availability = None
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.commit()
+
+    def _cursor(self, model=None):
+        """Курсор, который возвращает строки как объекты model (Booking, Payment...)"""
+        cursor = self.conn.cursor()
+        if model is not None:
+            cursor.row_factory = model.from_row
+        return cursor
+
+    def _get_availability(self):
+        """Живой индекс доступности календаря, загружается при первом обращении"""
+        if self._availability is None:
+            self._availability = AvailabilityIndex.load(self.get_available_work_days(), self.get_booked_dates())
+        return self._availability
+
+    def get_availability(self, year=None, month=None):
+        """Снимок индекса доступности: весь календарь или один месяц.
+
+        Копия делается в потоке базы, поэтому клавиатуры в event loop не видят
+        индекс посреди обновления.
+        """
+        return self._get_availability().snapshot(year, month)
+
+    def _refresh_availability(self, *dates):
+        """Точечно обновляет индекс доступности для измененных дат"""
+        if self._availability is None:
+            return
+        cursor = self.conn.cursor()
+        for date_iso in dates:
+            cursor.execute('''
+                SELECT
+                    EXISTS(SELECT 1 FROM work_days WHERE work_date = ? AND is_available = TRUE),
+                    EXISTS(SELECT 1 FROM bookings
+                           WHERE booking_date = ? AND status = 'active' AND deposit_paid = TRUE)
+            ''', (date_iso, date_iso))
+            is_work_day, is_booked = cursor.fetchone()
+            self._availability.set_work_day(date_iso, is_work_day)
+            self._availability.set_booked(date_iso, is_booked)
+
+    def close(self):
+        """Закрывает подключение к базе"""
+        self.conn.close()
+
+    def _commit(self):
+        """Коммитит изменения, если не открыта внешняя транзакция"""
+        if self._transaction_depth == 0:
+            self.conn.commit()
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                full_name TEXT,
-                booking_date TEXT,
-                status TEXT DEFAULT 'active',
-                deposit_paid BOOLEAN DEFAULT FALSE,
-                final_paid BOOLEAN DEFAULT FALSE,
-                brief_completed BOOLEAN DEFAULT FALSE,
-                payment_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                payment_id TEXT UNIQUE,
-                amount REAL,
-                payment_type TEXT,
-                status TEXT DEFAULT 'pending',
-                booking_date TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS support_chats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                full_name TEXT,
-                active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Новая таблица для рабочих дней
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS work_days (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                work_date TEXT UNIQUE,
-                is_available BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-                CREATE TABLE IF NOT EXISTS active_chats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER UNIQUE,
-                    admin_id INTEGER,
-                    booking_date TEXT,
-                    chat_started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    FOREIGN KEY (user_id) REFERENCES bookings (user_id)
-                )
-            ''')
-
-        self.conn.commit()
-
-    def add_booking(self, user_id, username, full_name, booking_date):
-        """Добавляет бронирование в базу"""
+    def explain(self, query, params=()):
+        """Возвращает план выполнения запроса (EXPLAIN QUERY PLAN)"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO bookings (user_id, username, full_name, booking_date, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, username, full_name, booking_date, "active"))
-        self.conn.commit()
+        cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+        return [row[3] for row in cursor.fetchall()]
+
+    def check_query_plans(self):
+        """Проверяет, что горячие запросы используют индексы.
+
+        Возвращает словарь {имя запроса: план} для запросов,
+        которые выполняются полным просмотром таблицы.
+        """
+        full_scans = {}
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = self.explain(query, params)
+            if any(step.startswith('SCAN') and 'INDEX' not in step for step in plan):
+                full_scans[name] = plan
+                logger.warning(f"Запрос {name} выполняется без индекса: {plan}")
+        return full_scans
+
+    def add_booking(self, user_id, username, full_name, booking_date, payment_id=None):
+        """Добавляет бронирование в базу и событие добавления строки в Google Sheets"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO bookings (user_id, username, full_name, booking_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, username, full_name, booking_date, "active"))
+            self.add_outbox_event(OUTBOX_ADD_BOOKING, user_id, booking_date, {
+                'username': username, 'full_name': full_name, 'payment_id': payment_id})
         return cursor.lastrowid
 
+    def save_deposit_booking(self, user_id, username, full_name, booking_date, payment_id):
+        """Бронирование под платеж предоплаты: повторный платеж не добавляет вторую строку"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id FROM bookings
+                WHERE user_id = ? AND booking_date = ? AND status = 'active' AND deposit_paid = FALSE
+                ORDER BY id DESC LIMIT 1
+            ''', (user_id, booking_date))
+            row = cursor.fetchone()
+            booking_id = row[0] if row else self.add_booking(user_id, username, full_name, booking_date, payment_id)
+            cursor.execute('UPDATE bookings SET payment_id = ? WHERE id = ?', (payment_id, booking_id))
+        return booking_id
+
     def save_payment_info(self, user_id, payment_id, amount, booking_date, payment_type):
         """Сохраняет информацию о платеже"""
         cursor = self.conn.cursor()
@@ -96,65 +246,177 @@ class Database:
             INSERT INTO payments (user_id, payment_id, amount, payment_type, booking_date)
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, payment_id, amount, payment_type, booking_date))
-        self.conn.commit()
+        self._commit()
 
     def update_payment_status(self, payment_id, status):
-        """Обновляет статус платежа"""
+        """Обновляет статус платежа (платеж и бронирование - одной транзакцией)"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+
+            # Сначала обновляем статус в таблице payments
+            cursor.execute('''
+                UPDATE payments SET status = ? WHERE payment_id = ?
+            ''', (status, payment_id))
+
+            if status == 'succeeded':
+                # Ищем соответствующее бронирование
+                payment_info = self.get_payment_info(payment_id)
+                if payment_info:
+                    user_id, payment_type, booking_date = payment_info.user_id, payment_info.payment_type, payment_info.booking_date
+                    logger.info(f"Обновление бронирования: user_id={user_id}, type={payment_type}, date={booking_date}")
+
+                    if payment_type == 'deposit':
+                        # Обновляем статус предоплаты
+                        cursor.execute('''
+                            UPDATE bookings SET deposit_paid = TRUE 
+                            WHERE user_id = ? AND booking_date = ?
+                        ''', (user_id, booking_date))
+                        logger.info(f"Предоплата подтверждена для user_id={user_id}, date={booking_date}")
+                    elif payment_type == 'final':
+                        # Обновляем статус финальной оплаты
+                        cursor.execute('''
+                            UPDATE bookings SET final_paid = TRUE 
+                            WHERE user_id = ? AND booking_date = ?
+                        ''', (user_id, booking_date))
+                        logger.info(f"Финальная оплата подтверждена для user_id={user_id}, date={booking_date}")
+
+                    if payment_type in SHEET_PAYMENT_STATUSES:
+                        self.add_outbox_event(OUTBOX_BOOKING_STATUS, user_id, booking_date,
+                                              {'status': SHEET_PAYMENT_STATUSES[payment_type]})
+
+                    # Дата закреплена оплаченной бронью - блокировка больше не нужна
+                    cursor.execute('DELETE FROM date_holds WHERE booking_date = ?', (booking_date,))
+                    self._refresh_availability(booking_date)
+
+            elif status in ('canceled', 'failed', 'refunded'):
+                # Платеж не прошел - освобождаем дату для других клиентов
+                cursor.execute('DELETE FROM date_holds WHERE payment_id = ?', (payment_id,))
+
+    # БЛОКИРОВКИ ДАТ НА ВРЕМЯ ОПЛАТЫ
+
+    def hold_date(self, booking_date, user_id, ttl_minutes=None):
+        """Атомарно занимает дату на время оплаты.
+
+        Возвращает True, если блокировка получена (или продлена тем же пользователем).
+        При продлении привязанный платеж сохраняется - повторное нажатие
+        "Оплатить" покажет его же (get_hold_payment), а не создаст второй.
+        Чужую блокировку можно перехватить только после истечения TTL и только
+        если ее платеж не ожидает оплаты и не прошел.
+        """
+        ttl_minutes = config.DATE_HOLD_TTL_MINUTES if ttl_minutes is None else ttl_minutes
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM bookings
+                WHERE booking_date = ? AND status = 'active' AND deposit_paid = TRUE
+            ''', (booking_date,))
+            if cursor.fetchone()[0] > 0:
+                return False
+
+            cursor.execute('''
+                INSERT INTO date_holds (booking_date, user_id, expires_at)
+                VALUES (?, ?, datetime('now', ?))
+                ON CONFLICT (booking_date) DO UPDATE SET
+                    user_id = excluded.user_id,
+                    payment_id = CASE WHEN date_holds.user_id = excluded.user_id
+                                      THEN date_holds.payment_id END,
+                    expires_at = excluded.expires_at,
+                    created_at = CURRENT_TIMESTAMP
+                WHERE date_holds.user_id = excluded.user_id
+                   OR (date_holds.expires_at <= datetime('now')
+                       AND NOT EXISTS (SELECT 1 FROM payments
+                                       WHERE payments.payment_id = date_holds.payment_id
+                                         AND payments.status IN ('pending', 'succeeded')))
+            ''', (booking_date, user_id, f'+{ttl_minutes} minutes'))
+            acquired = cursor.rowcount > 0
+
+        if acquired:
+            logger.info(f"Дата {booking_date} заблокирована для пользователя {user_id}")
+        else:
+            logger.info(f"Дата {booking_date} уже заблокирована другим пользователем")
+        return acquired
+
+    def attach_payment_to_hold(self, booking_date, user_id, payment_id):
+        """Привязывает созданный платеж к блокировке даты"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE date_holds SET payment_id = ?
+            WHERE booking_date = ? AND user_id = ?
+        ''', (payment_id, booking_date, user_id))
+        self._commit()
+
+    def get_hold_payment(self, booking_date, user_id):
+        """Платеж, привязанный к блокировке даты пользователя и ожидающий оплаты, или None"""
+        cursor = self._cursor(Payment)
+        cursor.execute(f'''
+            SELECT {Payment.COLUMNS} FROM payments
+            WHERE payment_id = (SELECT payment_id FROM date_holds WHERE booking_date = ? AND user_id = ?)
+              AND status = 'pending'
+        ''', (booking_date, user_id))
+        return cursor.fetchone()
+
+    def release_hold(self, booking_date, user_id):
+        """Снимает блокировку даты, если она принадлежит пользователю"""
         cursor = self.conn.cursor()
+        cursor.execute('''
+            DELETE FROM date_holds WHERE booking_date = ? AND user_id = ?
+        ''', (booking_date, user_id))
+        self._commit()
+
+    def release_expired_holds(self):
+        """Снимает истекшие блокировки, платеж которых не ожидает оплаты и не прошел.
+
+        Блокировка с еще не оплаченным платежом держится, пока ЮKassa не отменит
+        платеж (его статус обновит check_pending_payments). Возвращает
+        список освобожденных дат.
+        """
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                DELETE FROM date_holds
+                WHERE expires_at <= datetime('now')
+                  AND NOT EXISTS (SELECT 1 FROM payments
+                                  WHERE payments.payment_id = date_holds.payment_id
+                                    AND payments.status IN ('pending', 'succeeded'))
+                RETURNING booking_date
+            ''')
+            released = [row[0] for row in cursor.fetchall()]
 
-        # Сначала обновляем статус в таблице payments
+        if released:
+            logger.info(f"Сняты истекшие блокировки дат: {released}")
+        return released
+
+    def get_date_holds(self):
+        """Действующие блокировки дат {booking_date: user_id}; истекшие без платежа не считаются"""
+        cursor = self.conn.cursor()
         cursor.execute('''
-            UPDATE payments SET status = ? WHERE payment_id = ?
-        ''', (status, payment_id))
-
-        if status == 'succeeded':
-            # Ищем соответствующее бронирование
-            payment_info = self.get_payment_info(payment_id)
-            if payment_info:
-                user_id, payment_type, booking_date = payment_info[0], payment_info[3], payment_info[4]
-                logger.info(f"Обновление бронирования: user_id={user_id}, type={payment_type}, date={booking_date}")
-
-                if payment_type == 'deposit':
-                    # Обновляем статус предоплаты
-                    cursor.execute('''
-                        UPDATE bookings SET deposit_paid = TRUE 
-                        WHERE user_id = ? AND booking_date = ?
-                    ''', (user_id, booking_date))
-                    logger.info(f"Предоплата подтверждена для user_id={user_id}, date={booking_date}")
-                elif payment_type == 'final':
-                    # Обновляем статус финальной оплаты
-                    cursor.execute('''
-                        UPDATE bookings SET final_paid = TRUE 
-                        WHERE user_id = ? AND booking_date = ?
-                    ''', (user_id, booking_date))
-                    logger.info(f"Финальная оплата подтверждена для user_id={user_id}, date={booking_date}")
-
-        self.conn.commit()
+            SELECT booking_date, user_id FROM date_holds
+            WHERE expires_at > datetime('now')
+               OR EXISTS (SELECT 1 FROM payments
+                          WHERE payments.payment_id = date_holds.payment_id
+                            AND payments.status IN ('pending', 'succeeded'))
+        ''')
+        return dict(cursor.fetchall())
 
     def get_payment_info(self, payment_id):
         """Получает информацию о платеже"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT user_id, payment_id, amount, payment_type, booking_date 
+        cursor = self._cursor(Payment)
+        cursor.execute(f'''
+            SELECT {Payment.COLUMNS}
             FROM payments WHERE payment_id = ?
         ''', (payment_id,))
         return cursor.fetchone()
 
     def get_user_bookings(self, user_id):
         """Получает бронирования пользователя"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM bookings WHERE user_id = ? ORDER BY booking_date DESC
-        ''', (user_id,))
+        cursor = self._cursor(Booking)
+        cursor.execute(SQL_USER_BOOKINGS, (user_id,))
         return cursor.fetchall()
 
     def is_date_available(self, booking_date):
         """Проверяет доступна ли дата в формате YYYY-MM-DD"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE booking_date = ? AND status = 'active' AND deposit_paid = TRUE
-        ''', (booking_date,))
+        cursor.execute(SQL_IS_DATE_AVAILABLE, (booking_date,))
         count = cursor.fetchone()[0]
 
         # Также проверяем в Google Sheets через локальную логику
@@ -162,49 +424,178 @@ class Database:
         logger.info(f"Проверка даты {booking_date}: найдено {count} оплаченных бронирований")
         return count == 0
 
-    def mark_project_completed(self, user_id, booking_date):
-        """Отмечает проект как завершенный"""
+    def delete_booking(self, user_id, booking_date):
+        """Удаляет бронирование пользователя на указанную дату"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE bookings SET status = 'completed' 
-            WHERE user_id = ? AND booking_date = ?
-        ''', (user_id, booking_date))
-        self.conn.commit()
-        logger.info(f"Проект отмечен завершенным: user_id={user_id}, date={booking_date}")
+        cursor.execute('DELETE FROM bookings WHERE user_id = ? AND booking_date = ?',
+                       (user_id, booking_date))
+        self._commit()
+        self._refresh_availability(booking_date)
 
-    def mark_brief_completed(self, user_id):
-        """Отмечает бриф как заполненный"""
+    def get_booked_dates(self):
+        """Получает даты активных бронирований с предоплатой (YYYY-MM-DD)"""
+        cursor = self.conn.cursor()
+        cursor.execute(SQL_BOOKED_DATES)
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_bookings_between(self, start=None, end=None, **filters):
+        """Получает бронирования с датой в диапазоне [start, end] одним запросом.
+
+        start/end - date или строка YYYY-MM-DD, None - без ограничения.
+        Фильтры: user_id, status и булевы deposit_paid, final_paid, brief_completed,
+        например get_bookings_between(today, today, deposit_paid=True, final_paid=False)
+        """
+        cursor = self._cursor(Booking)
+        cursor.execute(*bookings_between_query(start, end, **filters))
+        return cursor.fetchall()
+
+    def get_project_status(self, user_id):
+        """Получает статус последнего проекта пользователя"""
+        cursor = self._cursor(Booking)
+        cursor.execute(f'''
+            SELECT {Booking.COLUMNS}
+            FROM all_bookings WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
+        ''', (user_id,))
+        return cursor.fetchone()
+
+    def has_completed_project(self, user_id):
+        """Проверяет, есть ли у пользователя завершенный проект"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            UPDATE bookings SET brief_completed = TRUE WHERE user_id = ?
+            SELECT status FROM all_bookings
+            WHERE user_id = ? AND status = 'completed'
+            LIMIT 1
         ''', (user_id,))
-        self.conn.commit()
+        return cursor.fetchone() is not None
 
-    def get_today_bookings(self):
-        """Получает бронирования на сегодня с предоплатой но без финальной оплаты"""
+    def is_final_paid(self, user_id, booking_date):
+        """Проверяет, оплачена ли финальная часть бронирования"""
         cursor = self.conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
         cursor.execute('''
-            SELECT * FROM bookings 
-            WHERE booking_date = ? AND deposit_paid = TRUE AND final_paid = FALSE
-        ''', (today,))
+            SELECT final_paid FROM bookings 
+            WHERE user_id = ? AND booking_date = ?
+        ''', (user_id, booking_date))
+        result = cursor.fetchone()
+        return bool(result and result[0])
+
+    def get_pending_payments(self):
+        """Получает ожидающие платежи"""
+        cursor = self._cursor(Payment)
+        cursor.execute(SQL_PENDING_PAYMENTS)
         return cursor.fetchall()
 
-    def get_upcoming_bookings(self, days=7):
-        """Получает предстоящие бронирования"""
+    def get_counters(self, period='all'):
+        """Получает счетчики бронирований за период: 'all', 'month:YYYY-MM' или 'week:YYYY-Www'
+
+        Неделя - по ISO 8601, как date.isocalendar(). Счетчики ведутся триггерами
+        (миграции 4 и 9), поэтому чтение - один поиск по ключу
+        """
+        cursor = self._cursor(BookingCounters)
+        cursor.execute(f'''
+            SELECT {BookingCounters.COLUMNS} FROM booking_counters WHERE period = ?
+        ''', (period,))
+        return cursor.fetchone() or BookingCounters(period, 0, 0, 0, 0, 0)
+
+    def get_stats(self):
+        """Получает статистику по бронированиям"""
+        counters = self.get_counters()
+
         cursor = self.conn.cursor()
-        from datetime import datetime, timedelta
+        cursor.execute('SELECT COUNT(*) FROM work_days')
+        work_days = cursor.fetchone()[0]
+
+        return {
+            'total_bookings': counters.total,
+            'active_bookings': counters.active_paid,
+            'completed_bookings': counters.completed,
+            'paid_deposit': counters.deposit_paid,
+            'paid_final': counters.final_paid,
+            'work_days': work_days,
+        }
+
+    def get_stats_by_period(self, kind='month', limit=6):
+        """Получает счетчики по последним периодам (kind - 'month' или 'week') по дате съемки"""
+        if kind not in ('month', 'week'):
+            raise ValueError(f"Неизвестный тип периода: {kind}")
+
+        cursor = self._cursor(BookingCounters)
+        cursor.execute(f'''
+            SELECT {BookingCounters.COLUMNS} FROM booking_counters
+            WHERE period >= ? AND period < ? AND total > 0
+            ORDER BY period DESC
+            LIMIT ?
+        ''', (f'{kind}:', f'{kind};', limit))
+        return cursor.fetchall()
+
+    def archive_closed_records(self, older_than_days=None):
+        """Переносит закрытые бронирования и платежи в архивные таблицы
+
+        Закрытыми считаются отмененные бронирования, завершенные с финальной оплатой
+        и брошенные без предоплаты, если дата съемки старше older_than_days дней,
+        а также платежи в конечном статусе, созданные раньше этого срока.
+        Возвращает количество перенесенных бронирований и платежей.
+        """
+        if older_than_days is None:
+            older_than_days = config.ARCHIVE_AFTER_DAYS
+        cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+
+        closed_bookings = '''
+            booking_date < ? AND (status = 'cancelled'
+                                  OR (status = 'completed' AND final_paid = TRUE)
+                                  OR deposit_paid = FALSE)
+        '''
+        closed_payments = '''
+            created_at < ? AND status IN ('succeeded', 'canceled', 'failed', 'refunded')
+        '''
+
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO bookings_archive ({Booking.COLUMNS})
+                SELECT {Booking.COLUMNS} FROM bookings WHERE {closed_bookings}
+            ''', (cutoff,))
+            cursor.execute(f'DELETE FROM bookings WHERE {closed_bookings}', (cutoff,))
+            bookings_moved = cursor.rowcount
+
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO payments_archive ({Payment.COLUMNS})
+                SELECT {Payment.COLUMNS} FROM payments WHERE {closed_payments}
+            ''', (cutoff,))
+            cursor.execute(f'DELETE FROM payments WHERE {closed_payments}', (cutoff,))
+            payments_moved = cursor.rowcount
+
+            # Доставленные в таблицу события больше не нужны
+            cursor.execute('''
+                DELETE FROM sheets_outbox WHERE sent_at IS NOT NULL AND sent_at < ?
+            ''', (cutoff,))
+            events_deleted = cursor.rowcount
 
-        upcoming_bookings = []
-        for i in range(days + 1):
-            target_date = (datetime.now() + timedelta(days=i)).strftime("%Y-%m-%d")
+        if bookings_moved or payments_moved:
+            logger.info(f"В архив перенесено бронирований: {bookings_moved}, платежей: {payments_moved}")
+        if events_deleted:
+            logger.info(f"Удалено доставленных событий для Google Sheets: {events_deleted}")
+        return bookings_moved, payments_moved
+
+    def mark_project_completed(self, user_id, booking_date):
+        """Отмечает проект как завершенный"""
+        with self.transaction():
+            cursor = self.conn.cursor()
             cursor.execute('''
-                SELECT * FROM bookings 
-                WHERE booking_date = ? AND deposit_paid = TRUE AND brief_completed = FALSE
-            ''', (target_date,))
-            upcoming_bookings.extend(cursor.fetchall())
+                UPDATE bookings SET status = 'completed' 
+                WHERE user_id = ? AND booking_date = ?
+            ''', (user_id, booking_date))
+            self.add_outbox_event(OUTBOX_BOOKING_STATUS, user_id, booking_date,
+                                  {'status': SHEET_PROJECT_COMPLETED})
+        self._refresh_availability(booking_date)
+        logger.info(f"Проект отмечен завершенным: user_id={user_id}, date={booking_date}")
 
-        return upcoming_bookings
+    def mark_brief_completed(self, user_id):
+        """Отмечает бриф как заполненный"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE bookings SET brief_completed = TRUE WHERE user_id = ?
+        ''', (user_id,))
+        self._commit()
 
     def mark_date_as_booked(self, booking_date):
         """Отмечает дату как забронированную в базе данных"""
@@ -213,37 +604,158 @@ class Database:
             UPDATE bookings SET status = 'booked' 
             WHERE booking_date = ? AND deposit_paid = TRUE
         ''', (booking_date,))
-        self.conn.commit()
+        self._commit()
+        self._refresh_availability(booking_date)
 
     def get_user_booking_date(self, user_id):
         """Получает дату бронирования пользователя"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT booking_date FROM bookings 
-            WHERE user_id = ? AND deposit_paid = TRUE 
-            ORDER BY created_at DESC LIMIT 1
-        ''', (user_id,))
+        cursor.execute(SQL_USER_BOOKING_DATE, (user_id,))
         result = cursor.fetchone()
         return result[0] if result else None
 
     def get_user_active_booking(self, user_id):
         """Получает активное бронирование пользователя (без проверки оплаты)"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM bookings 
+        cursor = self._cursor(Booking)
+        cursor.execute(f'''
+            SELECT {Booking.COLUMNS} FROM bookings 
             WHERE user_id = ? AND status = 'active'
             ORDER BY created_at DESC LIMIT 1
         ''', (user_id,))
         return cursor.fetchone()
 
+    def set_sheet_row(self, user_id, booking_date, sheet_row):
+        """Сохраняет номер строки бронирования в Google Sheets"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE bookings SET sheet_row = ? WHERE user_id = ? AND booking_date = ?
+        ''', (sheet_row, user_id, booking_date))
+        self._commit()
+
+    def get_sheet_row(self, user_id, booking_date):
+        """Получает номер строки бронирования в Google Sheets (None - неизвестен)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT sheet_row FROM bookings WHERE user_id = ? AND booking_date = ?
+        ''', (user_id, booking_date))
+        result = cursor.fetchone()
+        return result[0] if result else None
+
     def get_all_user_bookings(self, user_id):
         """Получает все бронирования пользователя (для отладки)"""
+        cursor = self._cursor(Booking)
+        cursor.execute(f'''
+            SELECT {Booking.COLUMNS} FROM all_bookings WHERE user_id = ? ORDER BY created_at DESC
+        ''', (user_id,))
+        return cursor.fetchall()
+
+    # ИСХОДЯЩИЕ СОБЫТИЯ ДЛЯ GOOGLE SHEETS
+
+    def add_outbox_event(self, operation, user_id, booking_date, payload=None):
+        """Ставит событие для Google Sheets в outbox (в текущей транзакции)"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT * FROM bookings WHERE user_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
+            INSERT OR IGNORE INTO sheets_outbox (idempotency_key, operation, user_id, booking_date, payload)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (outbox_key(operation, user_id, booking_date, payload), operation, user_id, booking_date,
+              json.dumps(payload or {}, ensure_ascii=False)))
+        self._commit()
+        return cursor.rowcount > 0
+
+    def get_due_outbox_events(self, limit=50):
+        """Получает события, которые пора отправить в Google Sheets.
+
+        От каждого бронирования берется только самое раннее неотправленное
+        событие, чтобы статус не попал в таблицу раньше самой строки;
+        порядок между разными бронированиями не важен.
+        """
+        cursor = self._cursor(OutboxEvent)
+        cursor.execute(SQL_DUE_OUTBOX_EVENTS, (limit,))
+        return cursor.fetchall()
+
+    def complete_outbox_event(self, event_id, sheet_row=None):
+        """Отмечает событие доставленным и сохраняет номер строки бронирования"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE sheets_outbox SET sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?
+            ''', (event_id,))
+            if sheet_row:
+                cursor.execute('''
+                    UPDATE bookings SET sheet_row = ?
+                    WHERE (user_id, booking_date) = (SELECT user_id, booking_date FROM sheets_outbox WHERE id = ?)
+                ''', (sheet_row, event_id))
+
+    def retry_outbox_event(self, event_id, error, delay_seconds):
+        """Увеличивает счетчик попыток и откладывает следующую попытку"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE sheets_outbox
+            SET attempts = attempts + 1, last_error = ?, next_attempt_at = datetime('now', ?)
+            WHERE id = ?
+        ''', (str(error), f'+{int(delay_seconds)} seconds', event_id))
+        self._commit()
+
+    def get_pending_outbox_bookings(self):
+        """Бронирования, события которых еще не доставлены в Google Sheets"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT user_id, booking_date FROM sheets_outbox WHERE sent_at IS NULL
+        ''')
+        return set(cursor.fetchall())
+
+    def get_outbox_stats(self):
+        """Количество неотправленных событий, из них с ошибками, самое старое и последняя ошибка"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*), COUNT(CASE WHEN attempts > 0 THEN 1 END), MIN(created_at)
+            FROM sheets_outbox WHERE sent_at IS NULL
+        ''')
+        pending, failing, oldest = cursor.fetchone()
+        cursor.execute('''
+            SELECT last_error FROM sheets_outbox
+            WHERE sent_at IS NULL AND last_error IS NOT NULL ORDER BY id DESC LIMIT 1
+        ''')
+        result = cursor.fetchone()
+        return {'pending': pending, 'failing': failing, 'oldest': oldest,
+                'last_error': result[0] if result else None}
+
+    def get_archived_bookings(self):
+        """Получает все бронирования из архива"""
+        cursor = self._cursor(Booking)
+        cursor.execute(f'''
+            SELECT {Booking.COLUMNS} FROM bookings_archive
+        ''')
         return cursor.fetchall()
 
+    def update_booking(self, user_id, booking_date, **changes):
+        """Меняет поля бронирования (для сверки с Google Sheets, событие в outbox не ставится)"""
+        check_booking_changes(changes)
+        if not changes:
+            return
+
+        # Имена полей проверены выше, в запрос подставляются только они
+        assignments = ', '.join(f'{name} = ?' for name in changes)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            UPDATE bookings SET {assignments} WHERE user_id = ? AND booking_date = ?
+        ''', (*changes.values(), user_id, booking_date))
+        self._commit()
+        self._refresh_availability(booking_date)
+
+    def import_booking(self, user_id, username, full_name, booking_date, **changes):
+        """Добавляет бронирование из Google Sheets (сверка): строка уже в таблице, событие в outbox не ставится"""
+        check_booking_changes(changes)
+        fields = {'user_id': user_id, 'username': username, 'full_name': full_name,
+                  'booking_date': booking_date, 'status': 'active', **changes}
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            INSERT INTO bookings ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})
+        ''', tuple(fields.values()))
+        self._commit()
+        self._refresh_availability(booking_date)
+        return cursor.lastrowid
+
     # НОВЫЕ МЕТОДЫ ДЛЯ РАБОЧИХ ДНЕЙ
 
     def add_work_day(self, work_date):
@@ -253,36 +765,27 @@ class Database:
             cursor.execute('''
                 INSERT OR IGNORE INTO work_days (work_date) VALUES (?)
             ''', (work_date,))
-            self.conn.commit()
+            self._commit()
+            self._refresh_availability(work_date)
             logger.info(f"Добавлен рабочий день: {work_date}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления рабочего дня {work_date}: {e}")
             return False
 
-    def add_work_days_for_month(self, year, month):
-        """Добавляет все рабочие дни для указанного месяца"""
-        cursor = self.conn.cursor()
-        try:
-            import calendar
-            cal = calendar.monthcalendar(year, month)
-
-            work_days_added = 0
-            for week in cal:
-                for i, day in enumerate(week):
-                    if day != 0 and i in config.WORK_DAYS:  # Проверяем день недели
-                        work_date = f"{year}-{month:02d}-{day:02d}"
-                        cursor.execute('''
-                            INSERT OR IGNORE INTO work_days (work_date) VALUES (?)
-                        ''', (work_date,))
-                        work_days_added += 1
+    def add_work_days(self, dates):
+        """Добавляет рабочие дни списком одним executemany в одной транзакции
 
-            self.conn.commit()
-            logger.info(f"Добавлено {work_days_added} рабочих дней для {year}-{month:02d}")
-            return work_days_added
-        except Exception as e:
-            logger.error(f"Ошибка добавления рабочих дней для месяца {year}-{month:02d}: {e}")
-            return 0
+        Возвращает количество действительно добавленных (новых) дней.
+        """
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.executemany('''
+                INSERT OR IGNORE INTO work_days (work_date) VALUES (?)
+            ''', ((work_date,) for work_date in dates))
+            added = cursor.rowcount
+        self._refresh_availability(*dates)
+        return added
 
     def remove_work_day(self, work_date):
         """Удаляет рабочий день"""
@@ -301,7 +804,8 @@ class Database:
             cursor.execute('''
                 DELETE FROM work_days WHERE work_date = ?
             ''', (work_date,))
-            self.conn.commit()
+            self._commit()
+            self._refresh_availability(work_date)
             logger.info(f"Удален рабочий день: {work_date}")
             return True, "Рабочий день удален"
         except Exception as e:
@@ -318,6 +822,14 @@ class Database:
         ''')
         return [row[0] for row in cursor.fetchall()]
 
+    def get_work_day(self, work_date):
+        """Получает рабочий день со всеми полями"""
+        cursor = self._cursor(WorkDay)
+        cursor.execute(f'''
+            SELECT {WorkDay.COLUMNS} FROM work_days WHERE work_date = ?
+        ''', (work_date,))
+        return cursor.fetchone()
+
     def get_all_work_days(self):
         """Получает все рабочие дни (для админки)"""
         cursor = self.conn.cursor()
@@ -345,7 +857,7 @@ class Database:
                 INSERT OR REPLACE INTO active_chats (user_id, admin_id, booking_date, is_active)
                 VALUES (?, ?, ?, TRUE)
             ''', (user_id, admin_id, booking_date))
-            self.conn.commit()
+            self._commit()
             logger.info(f"Начат чат с пользователем {user_id}")
             return True
         except Exception as e:
@@ -359,7 +871,7 @@ class Database:
             cursor.execute('''
                 UPDATE active_chats SET is_active = FALSE WHERE user_id = ?
             ''', (user_id,))
-            self.conn.commit()
+            self._commit()
             logger.info(f"Чат с пользователем {user_id} завершен")
             return True
         except Exception as e:
@@ -368,56 +880,120 @@ class Database:
 
     def get_active_chat(self, user_id):
         """Получает активный чат пользователя"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM active_chats WHERE user_id = ? AND is_active = TRUE
+        cursor = self._cursor(ChatSession)
+        cursor.execute(f'''
+            SELECT {ChatSession.COLUMNS} FROM active_chats WHERE user_id = ? AND is_active = TRUE
         ''', (user_id,))
         return cursor.fetchone()
 
-    def is_chat_active(self, user_id):
-        """Проверяет, активен ли чат с пользователем"""
-        return self.get_active_chat(user_id) is not None
-
-    def initialize_work_days(self):
-        """Инициализирует рабочие дни для ближайших 3 месяцев при первом запуске"""
+    def get_setting(self, key, default=None):
+        """Читает служебную настройку из таблицы settings"""
         cursor = self.conn.cursor()
+        cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+        result = cursor.fetchone()
+        return result[0] if result else default
 
-        # Проверяем, есть ли уже рабочие дни
-        cursor.execute('SELECT COUNT(*) FROM work_days')
-        count = cursor.fetchone()[0]
-
-        if count == 0:
-            logger.info("Инициализация рабочих дней для ближайших 3 месяцев...")
-
-            from datetime import datetime, timedelta
-            import calendar
-
-            today = datetime.now()
-            work_days_added = 0
-
-            # Добавляем рабочие дни для ближайших 3 месяцев
-            for i in range(config.MONTHS_TO_SHOW):
-                month_date = today.replace(day=1) + timedelta(days=32 * i)
-                month_date = month_date.replace(day=1)
-                year = month_date.year
-                month = month_date.month
-
-                # Получаем календарь месяца
-                cal = calendar.monthcalendar(year, month)
-
-                for week in cal:
-                    for day_idx, day in enumerate(week):
-                        if day != 0 and day_idx in config.WORK_DAYS:  # Проверяем день недели
-                            # Проверяем, что дата не в прошлом
-                            date_obj = datetime(year, month, day)
-                            if date_obj >= today.replace(hour=0, minute=0, second=0, microsecond=0):
-                                work_date = f"{year}-{month:02d}-{day:02d}"
-                                cursor.execute('''
-                                    INSERT OR IGNORE INTO work_days (work_date) VALUES (?)
-                                ''', (work_date,))
-                                work_days_added += 1
-
-            self.conn.commit()
-            logger.info(f"Добавлено {work_days_added} рабочих дней для ближайших {config.MONTHS_TO_SHOW} месяцев")
-
-        return count
\ No newline at end of file
+    def set_setting(self, key, value):
+        """Сохраняет служебную настройку в таблицу settings"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO settings (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (key, value))
+        self._commit()
+
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database.
+
+    Все запросы выполняются в отдельном потоке, чтобы синхронный sqlite3
+    (и особенно commit с fsync) не блокировал event loop бота.
+    Любой метод Database доступен как корутина: await db.add_booking(...)
+    """
+
+    def __init__(self, database=None):
+        self.db = database or create_database()
+        # Один поток - все запросы к соединению выполняются последовательно
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет синхронную функцию в потоке базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def in_transaction(self, func, *args, **kwargs):
+        """Выполняет func(db, ...) в одной транзакции с одним commit.
+
+        Вся функция выполняется в потоке базы целиком, поэтому запросы
+        других хендлеров не попадут внутрь транзакции.
+        """
+        def unit_of_work():
+            with self.db.transaction():
+                return func(self.db, *args, **kwargs)
+
+        return await self.run(unit_of_work)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Кешируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, method)
+        return method
+
+    def close(self):
+        """Дожидается завершения запросов и закрывает соединение"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
+
+
+def create_database(backend=None, path=None):
+    """Создает хранилище по config.DATABASE_BACKEND: 'sqlite' (файл или ':memory:') или 'memory'"""
+    backend = backend or config.DATABASE_BACKEND
+    if backend == 'sqlite':
+        return Database(path)
+    if backend == 'memory':
+        from memory_database import MemoryDatabase
+        return MemoryDatabase()
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
+
+
+class DatabaseManager:
+    """Единственное на процесс подключение к базе данных.
+
+    Соединение открывается один раз (таблицы проверяются тоже один раз),
+    а хендлеры получают его через DatabaseMiddleware.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.DATABASE_PATH
+        self._database = None
+
+    @property
+    def database(self):
+        """Возвращает общее подключение, открывая его при первом обращении"""
+        if self._database is None:
+            self.connect()
+        return self._database
+
+    def connect(self):
+        """Открывает подключение к базе данных"""
+        if self._database is None:
+            self._database = AsyncDatabase(create_database(path=self.path))
+            logger.info(f"Подключение к базе данных открыто: {config.DATABASE_BACKEND} {self.path}")
+        return self._database
+
+    def close(self):
+        """Закрывает подключение к базе данных"""
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+            logger.info("Подключение к базе данных закрыто")
+
+
+db_manager = DatabaseManager()
@@ -3,17 +3,296 @@ from google.oauth2.service_account import Credentials
 from datetime import datetime
 import config
 import logging
+import re
+import threading
+import time
+from sheets_quota import SheetsQuota
 
 logger = logging.getLogger(__name__)
 
-# Импортируем db здесь чтобы избежать циклического импорта
-from database import Database
+HEADERS = [
+    'Дата создания', 'ID пользователя', 'Username', 'Имя',
+    'Дата брони', 'Статус брифа', 'Статус оплаты', 'ID платежа',
+    'Сумма предоплаты', 'Сумма финальная', 'Заполнен бриф', 'Телефон', 'Email'
+]
+
+# Статусы оплаты, при которых дата считается занятой
+BOOKED_PAYMENT_STATUSES = ('Предоплата получена', 'Полная оплата')
+
+# Колонки, которые бот читает из таблицы; остальные только записываются
+READ_COLUMNS = ('ID пользователя', 'Дата брони', 'Статус оплаты')
+
+# Как таблица разбирает записываемые значения - одинаково на всех путях записи.
+# RAW: строка "05.01.2025" остается строкой, а не превращается в дату с форматом листа
+VALUE_INPUT_OPTION = 'RAW'
+
+# Номер строки из ответа append_row: "'Лист1'!A5:M5" -> 5
+_UPDATED_ROW = re.compile(r'![A-Z]+(\d+)')
+
+# Метаданные файла таблицы в Drive: по modifiedTime видно, менялась ли она
+DRIVE_FILE_URL = 'https://www.googleapis.com/drive/v3/files/{}'
+
+
+def sheet_date(booking_date):
+    """Приводит дату брони к формату таблицы DD.MM.YYYY"""
+    if isinstance(booking_date, str) and '-' in booking_date:
+        return datetime.strptime(booking_date, "%Y-%m-%d").strftime("%d.%m.%Y")
+    if hasattr(booking_date, 'strftime'):
+        return booking_date.strftime("%d.%m.%Y")
+    return booking_date
+
+
+def column_letter(col):
+    """Буква колонки: column_letter(7) -> 'G'"""
+    letters = ''
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def a1(row, col):
+    """Адрес ячейки в нотации A1: a1(5, 7) -> 'G5'"""
+    return f"{column_letter(col)}{row}"
+
+
+def booking_row(user_data, booking_date, payment_id=None, payment_status="Предоплата ожидается"):
+    """Строка таблицы (колонки HEADERS) для нового бронирования"""
+    return [
+        datetime.now().strftime("%d.%m.%Y %H:%M"),
+        user_data['user_id'],
+        user_data.get('username', ''),
+        user_data.get('full_name', ''),
+        sheet_date(booking_date),  # Дата в формате dd.mm.yyyy
+        "Ожидает заполнения брифа",
+        payment_status,
+        payment_id or "",
+        config.DEPOSIT_AMOUNT,
+        config.FINAL_AMOUNT,
+        "Нет",  # Заполнен бриф
+        "", "",  # Телефон, Email
+    ]
+
+
+class SheetWriteQueue:
+    """Очередь отложенной записи в таблицу (write-behind).
+
+    Изменения ячеек накапливаются и схлопываются: повторная запись в ту же
+    ячейку заменяет предыдущую. Соседние ячейки строки уходят одним диапазоном.
+    Все накопленное отправляется одним batch_update (и одним append_rows для
+    новых строк) раз в SHEETS_FLUSH_INTERVAL секунд или сразу при накоплении
+    SHEETS_FLUSH_BATCH изменений. close() дописывает остаток при остановке.
+    Если запись отправляет SheetsWorker, собственный поток не запускается
+    (auto_flush = False).
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self._cells = {}  # (строка, колонка) -> значение
+        self._rows = []  # новые строки для append_rows
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.auto_flush = True
+        self.metrics = {
+            'flushes': 0, 'errors': 0, 'cells_written': 0, 'rows_appended': 0,
+            'coalesced': 0, 'last_batch': 0, 'max_batch': 0,
+            'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0,
+        }
+
+    def __len__(self):
+        with self._condition:
+            return len(self._cells) + len(self._rows)
+
+    def update_cells(self, row, values):
+        """Ставит в очередь запись значений {колонка: значение} в строку row"""
+        with self._condition:
+            for col, value in values.items():
+                if (row, col) in self._cells:
+                    self.metrics['coalesced'] += 1
+                self._cells[(row, col)] = value
+        self._enqueued()
+
+    def append_rows(self, rows):
+        """Ставит в очередь добавление строк в конец таблицы"""
+        with self._condition:
+            self._rows.extend(rows)
+        self._enqueued()
+
+    def _enqueued(self):
+        with self._condition:
+            if self.auto_flush and self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="sheets-flush", daemon=True)
+                self._thread.start()
+            if len(self._cells) + len(self._rows) >= config.SHEETS_FLUSH_BATCH:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed:
+                    self._condition.wait(config.SHEETS_FLUSH_INTERVAL)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    @staticmethod
+    def _ranges(cells):
+        """Группирует ячейки в диапазоны из соседних колонок одной строки"""
+        ranges = []
+        for (row, col), value in sorted(cells.items()):
+            last = ranges[-1] if ranges else None
+            if last and last['row'] == row and last['end'] == col - 1:
+                last['end'] = col
+                last['values'].append(value)
+            else:
+                ranges.append({'row': row, 'start': col, 'end': col, 'values': [value]})
+        return [{'range': f"{a1(item['row'], item['start'])}:{a1(item['row'], item['end'])}"
+                 if item['end'] > item['start'] else a1(item['row'], item['start']),
+                 'values': [item['values']]} for item in ranges]
+
+    def flush(self):
+        """Отправляет накопленные изменения; при ошибке возвращает их в очередь"""
+        with self._flush_lock:
+            with self._condition:
+                cells, self._cells = self._cells, {}
+                rows, self._rows = self._rows, []
+            if not cells and not rows:
+                return True
+
+            sheet = self.sheets.sheet
+            started = time.perf_counter()
+            appending = []
+            try:
+                if sheet is None:
+                    raise ConnectionError("Google Sheets не подключен")
+                if rows:
+                    appending, rows = rows, []
+                    # Строки не возвращаются в очередь: дошли ли они, неизвестно,
+                    # а повтор мог бы их задвоить. Недописанное добавит сверка
+                    self.sheets.quota.append(sheet.append_rows, appending, value_input_option=VALUE_INPUT_OPTION)
+                    self.metrics['rows_appended'] += len(appending)
+                    appending = []
+                if cells:
+                    self.sheets.quota.write(sheet.batch_update, self._ranges(cells),
+                                            value_input_option=VALUE_INPUT_OPTION)
+                    self.metrics['cells_written'] += len(cells)
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error(f"Ошибка записи пакета в Google Sheets ({len(cells)} ячеек, {len(rows)} строк): {e}")
+                if appending:
+                    logger.warning(f"{len(appending)} строк могли не дойти до таблицы, их допишет сверка")
+                with self._condition:
+                    # Более новые значения, пришедшие во время записи, важнее
+                    self._cells = {**cells, **self._cells}
+                    self._rows = rows + self._rows
+                return False
+
+            self.sheets.wrote()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            batch = len(cells) + len(rows)
+            self.metrics['flushes'] += 1
+            self.metrics['last_batch'] = batch
+            self.metrics['max_batch'] = max(self.metrics['max_batch'], batch)
+            self.metrics['last_flush_ms'] = elapsed_ms
+            self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], elapsed_ms)
+            self.metrics['total_flush_ms'] += elapsed_ms
+            logger.info(f"Пакет записан в Google Sheets: {batch} изменений за {elapsed_ms:.0f} мс")
+            return True
 
-db = Database()
+    def pending_cells(self):
+        """Копия еще не записанных изменений ячеек {(строка, колонка): значение}"""
+        with self._condition:
+            return dict(self._cells)
+
+    def close(self):
+        """Останавливает фоновую запись, дописав все накопленное"""
+        with self._condition:
+            self._closed = True
+            thread = self._thread
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
+
+
+class SheetReader:
+    """Чтение таблицы по колонкам READ_COLUMNS вместо get_all_records.
+
+    batch_get забирает три нужные колонки из тринадцати и только строки,
+    начиная с заданной, поэтому обновление снимка читает лишь новые строки.
+    modified_time() позволяет вовсе не читать значения, если файл не менялся.
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.letters = [column_letter(HEADERS.index(name) + 1) for name in READ_COLUMNS]
+        self.metrics = {
+            'full_reads': 0, 'delta_reads': 0, 'unchanged': 0, 'edits_detected': 0,
+            'rows_read': 0, 'cells_read': 0,
+        }
+
+    def read_rows(self, start_row):
+        """Записи {колонка: значение} всех строк таблицы начиная с start_row"""
+        value_ranges = self.sheets.quota.read(self.sheets.sheet.batch_get,
+                                              [f"{letter}{start_row}:{letter}" for letter in self.letters])
+        # Пустые ячейки в конце колонки API не возвращает - колонки бывают разной длины
+        length = max((len(values) for values in value_ranges), default=0)
+        records = []
+        for i in range(length):
+            record = {}
+            for name, values in zip(READ_COLUMNS, value_ranges):
+                cells = values[i] if i < len(values) else []
+                record[name] = cells[0] if cells else ''
+            records.append(record)
+        self.metrics['rows_read'] += length
+        self.metrics['cells_read'] += length * len(READ_COLUMNS)
+        return records
+
+    def modified_time(self):
+        """Время последнего изменения файла таблицы или None, если узнать не удалось"""
+        try:
+            response = self.sheets.client.request('get', DRIVE_FILE_URL.format(config.SPREADSHEET_ID),
+                                                  params={'fields': 'modifiedTime'})
+            return response.json().get('modifiedTime')
+        except Exception as e:
+            logger.warning(f"Не удалось узнать время изменения таблицы: {e}")
+            return None
 
 
 class GoogleSheets:
     def __init__(self):
+        # Снимок колонок READ_COLUMNS: проверяется не чаще раза в SHEETS_CACHE_TTL секунд
+        self._records = None
+        self._records_loaded_at = 0.0
+        self._booked_dates = None
+        self._refresh_lock = threading.Lock()
+        # Все запросы к Sheets API проходят через общий лимит с повторами
+        self.quota = SheetsQuota()
+        self.reader = SheetReader(self)
+        # Состояние на момент последней сверки с таблицей: время изменения файла,
+        # число собственных записей после нее и время последнего полного чтения
+        self._synced_modified = None
+        self._writes_since_sync = 0
+        self._full_sync_at = 0.0
+        # Индекс строк: (user_id, DD.MM.YYYY) -> номер строки, user_id -> первая строка
+        self._row_index = {}
+        self._user_rows = {}
+        self.writes = SheetWriteQueue(self)
+        # Конструктор не обращается к Google: подключение делает connect(),
+        # SheetsWorker вызывает его в фоне уже после запуска бота
+        self.client = None
+        self.sheet = None
+        self.state = 'disconnected'  # disconnected, connecting, connected
+        self.connected_at = None
+        self.last_connect_error = None
+
+    def connect(self):
+        """Авторизуется, открывает таблицу и проверяет заголовки; при ошибке бросает исключение"""
+        self.state = 'connecting'
         try:
             scope = ['https://spreadsheets.google.com/feeds',
                      'https://www.googleapis.com/auth/drive']
@@ -24,215 +303,319 @@ class GoogleSheets:
             self.client = gspread.auth.authorize(creds)
 
             # Открываем таблицу
-            self.sheet = self.client.open_by_key(config.SPREADSHEET_ID).sheet1
-
-            # Инициализируем заголовки если таблица пустая
-            self._initialize_headers()
+            self.sheet = self.quota.read(self.client.open_by_key, config.SPREADSHEET_ID).sheet1
 
         except Exception as e:
-            logger.error(f"Ошибка инициализации Google Sheets: {e}")
-            # Создаем заглушку чтобы бот мог работать
-            self.sheet = None
+            self.disconnect()
+            self.last_connect_error = f"{datetime.now():%d.%m %H:%M:%S} {e}"
+            logger.error(f"Ошибка подключения к Google Sheets: {e}")
+            raise
+
+        # Инициализируем заголовки если таблица пустая
+        self._initialize_headers()
+
+        # Пока связи не было, таблицу могли изменить - снимок перечитаем
+        self.invalidate_cache()
+        self.state = 'connected'
+        self.connected_at = datetime.now()
+        self.last_connect_error = None
+        logger.info("Google Sheets подключен")
+
+    def disconnect(self):
+        """Сбрасывает подключение: до следующего connect() таблица недоступна"""
+        self.client = None
+        self.sheet = None
+        self.state = 'disconnected'
 
     def _initialize_headers(self):
         """Инициализирует заголовки если таблица пустая"""
         try:
-            # Пробуем прочитать данные
-            data = self.sheet.get_all_values()
-
-            # Если таблица пустая или нет данных
-            if not data or len(data) == 0:
-                headers = [
-                    'Дата создания', 'ID пользователя', 'Username', 'Имя',
-                    'Дата брони', 'Статус брифа', 'Статус оплаты', 'ID платежа',
-                    'Сумма предоплаты', 'Сумма финальная', 'Заполнен бриф', 'Телефон', 'Email'
-                ]
-                self.sheet.append_row(headers)
+            # Для проверки хватает первой строки, весь лист не читаем
+            headers = self.quota.read(self.sheet.row_values, 1)
+
+            if not headers:
+                self.quota.append(self.sheet.append_row, HEADERS, value_input_option=VALUE_INPUT_OPTION)
                 logger.info("Заголовки таблицы инициализированы")
             else:
                 logger.info("Таблица уже содержит данные")
 
         except Exception as e:
+            # Вслепую не дописываем: в непустой таблице заголовки оказались бы посреди данных.
+            # Проверка повторится при следующем подключении
             logger.error(f"Ошибка инициализации заголовков: {e}")
-            # Создаем заголовки в любом случае
-            try:
-                headers = [
-                    'Дата создания', 'ID пользователя', 'Username', 'Имя',
-                    'Дата брони', 'Статус брифа', 'Статус оплаты', 'ID платежа',
-                    'Сумма предоплаты', 'Сумма финальная', 'Заполнен бриф', 'Телефон', 'Email'
-                ]
-                self.sheet.append_row(headers)
-            except:
-                pass
 
     # Все остальные методы остаются без изменений...
     def is_connected(self):
         """Проверяет подключение к Google Sheets"""
         return self.sheet is not None
 
+    def _cache_is_fresh(self):
+        return (self._records is not None
+                and time.monotonic() - self._records_loaded_at < config.SHEETS_CACHE_TTL)
+
+    def _get_records(self):
+        """Возвращает снимок записей таблицы, обновляя его по истечении TTL.
+
+        Одновременные читатели ждут одно обновление и берут его результат,
+        а не делают каждый свой запрос к таблице.
+        """
+        if self._cache_is_fresh():
+            return self._records
+
+        with self._refresh_lock:
+            if not self._cache_is_fresh():
+                self._refresh_records()
+                self._records_loaded_at = time.monotonic()
+            return self._records
+
+    def _refresh_records(self):
+        """Сверяет снимок с таблицей: дочитывает новые строки, целиком - только после правки.
+
+        Правкой считается изменение последней известной строки (строки удаляли,
+        вставляли или редактировали) и изменение файла, которое не объясняется
+        ни новыми строками, ни собственными записями. Раз в
+        SHEETS_FULL_RESYNC_INTERVAL секунд таблица все равно читается целиком.
+        """
+        # Свои изменения сначала дописываем, чтобы сравнивать с актуальной таблицей
+        self.writes.flush()
+        modified = self.reader.modified_time()
+
+        if (self._records is None
+                or time.monotonic() - self._full_sync_at >= config.SHEETS_FULL_RESYNC_INTERVAL):
+            self._full_resync(modified)
+            return
+
+        if modified is not None and modified == self._synced_modified:
+            self.reader.metrics['unchanged'] += 1
+            return
+
+        # Перечитываем и последнюю известную строку: по ней видно, не сдвигались ли строки
+        known = len(self._records)
+        rows = self.reader.read_rows(known + 1 if known else 2)
+        if known:
+            last = rows[0] if rows else {}
+            if any(str(self._records[-1].get(name, '')) != str(last.get(name, '')) for name in READ_COLUMNS):
+                self._edit_detected("изменилась последняя известная строка")
+                return
+            rows = rows[1:]
+
+        if not rows and not self._writes_since_sync and modified is not None:
+            self._edit_detected("таблица изменена без новых строк")
+            return
+
+        self.reader.metrics['delta_reads'] += 1
+        for i, record in enumerate(rows, start=known + 2):
+            self._records.append(record)
+            self._index_row(i, record['ID пользователя'], record['Дата брони'])
+        if rows:
+            self._booked_dates = None
+            logger.info(f"Снимок Google Sheets дополнен: {len(rows)} новых строк, всего {len(self._records)}")
+        self._synced(modified)
+
+    def _edit_detected(self, reason):
+        self.reader.metrics['edits_detected'] += 1
+        logger.info(f"Правка таблицы ({reason}), перечитываем снимок целиком")
+        self._full_resync(self.reader.modified_time())
+
+    def _full_resync(self, modified):
+        """Читает колонки READ_COLUMNS целиком и перестраивает индекс"""
+        self._records = self.reader.read_rows(2)
+        self.reader.metrics['full_reads'] += 1
+        self._full_sync_at = time.monotonic()
+        # Незаписанные изменения важнее прочитанного: они попадут в таблицу следующим пакетом
+        for (row, col), value in self.writes.pending_cells().items():
+            if 0 <= row - 2 < len(self._records) and HEADERS[col - 1] in READ_COLUMNS:
+                self._records[row - 2][HEADERS[col - 1]] = value
+        self._booked_dates = None
+        self._index_records(self._records)
+        self._synced(modified)
+        logger.info(f"Снимок Google Sheets прочитан целиком: {len(self._records)} записей")
+
+    def _synced(self, modified):
+        self._synced_modified = modified
+        self._writes_since_sync = 0
+
+    def read_all(self):
+        """Перечитывает таблицу целиком (для сверки с базой) и возвращает копию снимка"""
+        with self._refresh_lock:
+            self.writes.flush()
+            self._full_resync(self.reader.modified_time())
+            self._records_loaded_at = time.monotonic()
+            return list(self._records)
+
+    def wrote(self):
+        """Отмечает собственную запись в таблицу - такое изменение файла не считается правкой"""
+        self._writes_since_sync += 1
+
+    def invalidate_cache(self):
+        """Сбрасывает снимок таблицы - следующий запрос перечитает ее целиком"""
+        with self._refresh_lock:
+            self._records = None
+            self._booked_dates = None
+            self._synced_modified = None
+
+    def _index_records(self, records):
+        """Перестраивает индекс строк по снимку таблицы"""
+        self._row_index = {}
+        self._user_rows = {}
+        for i, record in enumerate(records, start=2):  # start=2 потому что первая строка - заголовки
+            self._index_row(i, record.get('ID пользователя', ''), record.get('Дата брони', ''))
+
+    def _index_row(self, row_index, user_id, booking_date):
+        user_id = str(user_id)
+        self._row_index[(user_id, str(booking_date))] = row_index
+        self._user_rows.setdefault(user_id, row_index)
+
+    def find_row(self, user_id, booking_date, sheet_row=None):
+        """Номер строки бронирования: из аргумента (сохранен в базе), из индекса
+        или, если индекс о строке не знает, из перечитанного снимка таблицы"""
+        if sheet_row:
+            return sheet_row
+        key = (str(user_id), sheet_date(booking_date))
+        row_index = self._row_index.get(key)
+        if row_index is None and not self._cache_is_fresh():
+            self._get_records()
+            row_index = self._row_index.get(key)
+        return row_index
+
+    def _update_cached_record(self, row_index, values):
+        """Точечно обновляет запись снимка после собственной записи в таблицу"""
+        if self._records is not None and 0 <= row_index - 2 < len(self._records):
+            self._records[row_index - 2].update(values)
+            self._booked_dates = None
+
     def find_booking_row(self, booking_date, user_id=None):
-        """Находит строку с бронированием по дате или пользователю"""
+        """Находит строку с бронированием по пользователю или по дате"""
         if not self.is_connected():
             return None
 
         try:
-            records = self.sheet.get_all_records()
-            for i, record in enumerate(records, start=2):
-                if user_id and str(record.get('ID пользователя', '')) == str(user_id):
-                    return i
-                # Преобразуем дату к формату таблицы (dd.mm.yyyy)
-                record_date = record.get('Дата брони', '')
+            self._get_records()
+            if user_id:
+                row_index = self._user_rows.get(str(user_id))
+                if row_index:
+                    return row_index
+            for (_, record_date), row_index in sorted(self._row_index.items(), key=lambda item: item[1]):
                 if record_date == booking_date:
-                    return i
+                    return row_index
             return None
         except Exception as e:
             logger.error(f"Ошибка поиска бронирования: {e}")
             return None
 
     def add_booking(self, user_data, booking_date, payment_id=None):
-        """Добавляет бронирование в таблицу"""
+        """Добавляет бронирование в таблицу и возвращает номер новой строки
+
+        Номер стоит сохранить в базе (db.set_sheet_row), чтобы обновлять
+        строку без поиска. None - если записать не удалось.
+        """
         if not self.is_connected():
             logger.warning("Google Sheets не подключен, бронирование не сохранено")
-            return False
+            return None
 
         try:
             # Преобразуем дату к формату dd.mm.yyyy для Google Sheets
             booking_date_str = booking_date.strftime("%d.%m.%Y")
 
-            row = [
-                datetime.now().strftime("%d.%m.%Y %H:%M"),
-                user_data['user_id'],
-                user_data.get('username', ''),
-                user_data.get('full_name', ''),
-                booking_date_str,  # Используем отформатированную дату
-                "Ожидает заполнения брифа",
-                "Предоплата ожидается",
-                payment_id or "",
-                config.DEPOSIT_AMOUNT,
-                config.FINAL_AMOUNT,
-                "Нет",  # Заполнен бриф
-                "", "",  # Телефон, Email
-            ]
-            self.sheet.append_row(row)
-            logger.info(f"Бронирование добавлено: {booking_date_str} для пользователя {user_data['user_id']}")
-            return True
+            row = booking_row(user_data, booking_date, payment_id)
+            response = self.quota.append(self.sheet.append_row, row, value_input_option=VALUE_INPUT_OPTION)
+            self.wrote()
+            match = _UPDATED_ROW.search(str((response or {}).get('updates', {}).get('updatedRange', '')))
+            row_index = int(match.group(1)) if match else None
+            # Строку добавляем в снимок, только если перед ней нет еще не прочитанных строк;
+            # иначе ее вместе с ними дочитает следующее обновление снимка
+            if self._records is not None and row_index in (None, len(self._records) + 2):
+                self._records.append({name: row[HEADERS.index(name)] for name in READ_COLUMNS})
+                row_index = row_index or len(self._records) + 1
+            if row_index:
+                self._index_row(row_index, user_data['user_id'], booking_date_str)
+            logger.info(f"Бронирование добавлено: {booking_date_str} для пользователя {user_data['user_id']}, строка {row_index}")
+            return row_index
         except Exception as e:
             logger.error(f"Ошибка добавления бронирования: {e}")
-            return False
+            return None
+
+    def cached_booked_dates(self):
+        """Занятые даты из текущего снимка без обращения к Google: (даты, свежий ли снимок)
+
+        Даты - None, если таблица еще ни разу не читалась.
+        """
+        records = self._records
+        if records is None:
+            return None, False
+        fresh = self._cache_is_fresh()
+        return list(self._parse_booked_dates(records)), fresh
+
+    def _parse_booked_dates(self, records):
+        """Разбирает занятые даты снимка; результат запоминается до смены снимка"""
+        booked_dates = self._booked_dates
+        if booked_dates is None:
+            booked_dates = []
+            for record in records:
+                # Проверяем что запись не пустая и содержит нужные поля
+                if not record or not isinstance(record, dict):
+                    continue
+                date_str = str(record.get('Дата брони', '')).strip()
+                if date_str and record.get('Статус оплаты', '') in BOOKED_PAYMENT_STATUSES:
+                    # Убедимся, что дата в правильном формате DD.MM.YYYY
+                    try:
+                        datetime.strptime(date_str, "%d.%m.%Y")
+                        booked_dates.append(date_str)
+                    except ValueError:
+                        logger.warning(f"Некорректный формат даты в таблице: {date_str}")
+            self._booked_dates = booked_dates
+            logger.info(f"Забронированные даты из Google Sheets: {booked_dates}")
+        return booked_dates
 
     def get_booked_dates(self):
-        """Получает все забронированные даты"""
+        """Получает все забронированные даты (DD.MM.YYYY) из снимка таблицы"""
         if not self.is_connected():
             return []
 
         try:
-            records = self.sheet.get_all_records()
-            booked_dates = []
-
-            # Пропускаем первую строку (заголовки)
-            for i, record in enumerate(records):
-                # Проверяем что запись не пустая и содержит нужные поля
-                if record and isinstance(record, dict):
-                    date_str = record.get('Дата брони', '')
-                    status = record.get('Статус оплаты', '')
-
-                    # Проверяем что date_str не пустой и статус подходящий
-                    if date_str and date_str.strip() and status in ['Предоплата получена', 'Полная оплата']:
-                        # Убедимся, что дата в правильном формате
-                        try:
-                            # Проверяем формат даты (должен быть DD.MM.YYYY)
-                            datetime.strptime(date_str.strip(), "%d.%m.%Y")
-                            booked_dates.append(date_str.strip())
-                        except ValueError:
-                            logger.warning(f"Некорректный формат даты в таблице: {date_str}")
-                            continue
-
-            logger.info(f"Забронированные даты из Google Sheets: {booked_dates}")
-            return booked_dates
+            # Копия: вызывающий код дописывает в список даты из базы
+            return list(self._parse_booked_dates(self._get_records()))
         except Exception as e:
             logger.error(f"Ошибка получения забронированных дат: {e}")
             return []
 
-    def update_booking_status(self, user_id, booking_date, status="Предоплата получена"):
-        """Обновляет статус бронирования в Google Sheets"""
-        if not self.is_connected():
-            logger.warning("Google Sheets не подключен")
-            return False
-
-        try:
-            # Преобразуем дату к формату dd.mm.yyyy для поиска
-            if isinstance(booking_date, str) and '-' in booking_date:
-                # Если дата в формате YYYY-MM-DD, преобразуем в DD.MM.YYYY
-                date_obj = datetime.strptime(booking_date, "%Y-%m-%d")
-                booking_date_search = date_obj.strftime("%d.%m.%Y")
-            else:
-                booking_date_search = booking_date
-
-            # Ищем строку по user_id и booking_date
-            records = self.sheet.get_all_records()
-            logger.info(f"Всего записей в таблице: {len(records)}")
-
-            for i, record in enumerate(records, start=2):  # start=2 потому что первая строка - заголовки
-                record_user_id = str(record.get('ID пользователя', ''))
-                record_booking_date = record.get('Дата брони', '')
-
-                logger.info(f"Запись {i}: user_id={record_user_id}, date={record_booking_date}")
-
-                if (record_user_id == str(user_id) and
-                        record_booking_date == booking_date_search):
-
-                    # Обновляем статус в зависимости от типа статуса
-                    if status == "Проект завершен":
-                        # При завершении проекта обновляем несколько полей
-                        self.sheet.update_cell(i, 7, "Проект завершен")  # Колонка 7 - Статус оплаты
-                        self.sheet.update_cell(i, 6, "Проект завершен")  # Колонка 6 - Статус брифа
-                        self.sheet.update_cell(i, 11, "Да")  # Колонка 11 - Заполнен бриф
-                        logger.info(f"Проект отмечен завершенным для строки {i}")
+    def update_booking_status(self, user_id, booking_date, status="Предоплата получена", sheet_row=None):
+        """Обновляет статус бронирования в Google Sheets
 
-                    elif status == "Предоплата получена":
-                        # Обновляем только статус оплаты для предоплаты
-                        self.sheet.update_cell(i, 7, status)  # Колонка 7 - Статус оплаты
-                        logger.info(f"Статус обновлен для строки {i}: {status}")
-
-                    elif status == "Полная оплата":
-                        # Обновляем статус для финальной оплаты
-                        self.sheet.update_cell(i, 7, status)  # Колонка 7 - Статус оплаты
-                        logger.info(f"Статус обновлен для строки {i}: {status}")
-
-                    else:
-                        # Для других статусов обновляем только статус оплаты
-                        self.sheet.update_cell(i, 7, status)
-                        logger.info(f"Статус обновлен для строки {i}: {status}")
-
-                    return True
-
-            logger.warning(f"Не найдена запись для user_id={user_id}, date={booking_date_search}")
-            return False
-
-        except Exception as e:
-            logger.error(f"Ошибка обновления статуса бронирования: {e}")
-            return False
-
-    def update_payment_status(self, user_id, status="Предоплата получена", final_payment=False):
-        """Обновляет статус оплаты по ID пользователя"""
+        sheet_row - номер строки, сохраненный в базе при добавлении; без него
+        строка берется из индекса, и таблица не перечитывается.
+        """
         if not self.is_connected():
             logger.warning("Google Sheets не подключен")
             return False
 
         try:
-            # Получаем booking_date из базы данных
-            booking = db.get_user_active_booking(user_id)
-            if not booking:
-                logger.warning(f"Не найдено активных бронирований для пользователя {user_id}")
+            row_index = self.find_row(user_id, booking_date, sheet_row)
+            if row_index is None:
+                logger.warning(f"Не найдена запись для user_id={user_id}, date={sheet_date(booking_date)}")
                 return False
 
-            booking_date = booking[4]  # booking_date field
-            logger.info(f"Обновление статуса для пользователя {user_id}, дата {booking_date}")
+            if status == "Проект завершен":
+                # При завершении проекта обновляем несколько полей
+                self.writes.update_cells(row_index, {
+                    7: "Проект завершен",  # Колонка 7 - Статус оплаты
+                    6: "Проект завершен",  # Колонка 6 - Статус брифа
+                    11: "Да",  # Колонка 11 - Заполнен бриф
+                })
+                self._update_cached_record(row_index, {'Статус оплаты': "Проект завершен",
+                                                       'Статус брифа': "Проект завершен",
+                                                       'Заполнен бриф': "Да"})
+                logger.info(f"Проект отмечен завершенным для строки {row_index}")
+            else:
+                # Для оплат и остальных статусов обновляем только статус оплаты
+                self.writes.update_cells(row_index, {7: status})  # Колонка 7 - Статус оплаты
+                self._update_cached_record(row_index, {'Статус оплаты': status})
+                logger.info(f"Статус обновлен для строки {row_index}: {status}")
 
-            return self.update_booking_status(user_id, booking_date, status)
+            return True
 
         except Exception as e:
-            logger.error(f"Ошибка обновления статуса оплаты: {e}")
+            logger.error(f"Ошибка обновления статуса бронирования: {e}")
             return False
 
     def mark_brief_completed(self, user_id):
@@ -243,8 +626,8 @@ class GoogleSheets:
         try:
             row_index = self.find_booking_row(None, user_id)
             if row_index:
-                self.sheet.update_cell(row_index, 6, "Бриф заполнен")
-                self.sheet.update_cell(row_index, 11, "Да")
+                self.writes.update_cells(row_index, {6: "Бриф заполнен", 11: "Да"})
+                self._update_cached_record(row_index, {'Статус брифа': "Бриф заполнен", 'Заполнен бриф': "Да"})
                 logger.info(f"Бриф отмечен заполненным для пользователя {user_id}")
                 return True
             return False
@@ -252,6 +635,10 @@ class GoogleSheets:
             logger.error(f"Ошибка отметки брифа: {e}")
             return False
 
+    def close(self):
+        """Дописывает отложенные изменения в таблицу"""
+        self.writes.close()
+
     def get_today_bookings(self):
         """Получает бронирования на сегодня"""
         if not self.is_connected():
@@ -259,7 +646,7 @@ class GoogleSheets:
 
         try:
             today = datetime.now().strftime("%d.%m.%Y")
-            records = self.sheet.get_all_records()
+            records = self._get_records()
             today_bookings = []
 
             for record in records:
@@ -2,7 +2,6 @@ from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton,
                            InlineKeyboardMarkup, InlineKeyboardButton)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime, timedelta
-import calendar
 import config
 
 
@@ -27,26 +26,19 @@ def get_russian_month_name(date_obj):
     return months_ru[date_obj.month]
 
 
-def get_months_keyboard():
-    """Клавиатура выбора месяцев - теперь только доступные месяцы с рабочими днями"""
-    builder = InlineKeyboardBuilder()
-    today = datetime.now()
+def get_months_keyboard(availability):
+    """Клавиатура выбора месяцев - теперь только доступные месяцы с рабочими днями
 
-    # Получаем все рабочие дни
-    from database import Database
-    db = Database()
-    work_days = db.get_available_work_days()
+    availability - снимок индекса доступности из db.get_availability()
+    """
+    builder = InlineKeyboardBuilder()
 
-    # Собираем уникальные месяцы из рабочих дней
-    available_months = set()
-    for work_day in work_days:
-        date_obj = datetime.strptime(work_day, "%Y-%m-%d")
-        month_key = date_obj.strftime("%Y-%m")
-        available_months.add(month_key)
+    # Месяцы с рабочими днями берем из индекса, без разбора каждой даты
+    available_months = availability.months()
 
     # Добавляем кнопки для доступных месяцев
-    for month_key in sorted(available_months):
-        year, month = map(int, month_key.split('-'))
+    for year, month in available_months:
+        month_key = f"{year}-{month:02d}"
         month_date = datetime(year, month, 1)
         month_name = f"{get_russian_month_name(month_date)} {year}"
 
@@ -63,39 +55,35 @@ def get_months_keyboard():
     return builder.as_markup()
 
 
-def get_days_keyboard(year_month, booked_dates):
-    """Клавиатура выбора дней для конкретного месяца"""
+def get_days_keyboard(year_month, booked_dates, availability):
+    """Клавиатура выбора дней для конкретного месяца
+
+    booked_dates - занятые даты DD.MM.YYYY из Google Sheets,
+    availability - снимок индекса доступности из db.get_availability(год, месяц)
+    """
     builder = InlineKeyboardBuilder()
     year, month = map(int, year_month.split('-'))
-
-    # Получаем рабочие дни из базы
-    from database import Database
-    db = Database()
-    work_days = db.get_available_work_days()
-
-    # Получаем календарь месяца
-    cal = calendar.monthcalendar(year, month)
-
-    for week in cal:
-        for day in week:
-            if day != 0:
-                date_obj = datetime(year, month, day)
-                date_iso = date_obj.strftime("%Y-%m-%d")  # Формат для callback
-                date_str = date_obj.strftime("%d.%m.%Y")  # Формат для сравнения с booked_dates
-                weekday_ru = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"][date_obj.weekday()]
-
-                # Проверяем, является ли день рабочим
-                if date_iso in work_days:
-                    if date_str in booked_dates:
-                        builder.button(
-                            text=f"❌ {day:02d} ({weekday_ru})",
-                            callback_data="occupied"
-                        )
-                    else:
-                        builder.button(
-                            text=f"✅ {day:02d} ({weekday_ru})",
-                            callback_data=f"book_{date_iso}"
-                        )
+    booked_dates = set(booked_dates)
+    free_mask = availability.free_mask(year, month)
+
+    # Обходим только рабочие дни месяца
+    for day in availability.work_days(year, month):
+        date_obj = datetime(year, month, day)
+        date_iso = date_obj.strftime("%Y-%m-%d")  # Формат для callback
+        date_str = date_obj.strftime("%d.%m.%Y")  # Формат для сравнения с booked_dates
+        weekday_ru = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"][date_obj.weekday()]
+
+        # День занят, если на него есть оплаченная бронь в базе или в таблице
+        if not free_mask & (1 << (day - 1)) or date_str in booked_dates:
+            builder.button(
+                text=f"❌ {day:02d} ({weekday_ru})",
+                callback_data="occupied"
+            )
+        else:
+            builder.button(
+                text=f"✅ {day:02d} ({weekday_ru})",
+                callback_data=f"book_{date_iso}"
+            )
 
     builder.button(text="🔙 Назад к месяцам", callback_data="back_to_months")
     builder.adjust(3)
@@ -212,45 +200,30 @@ def get_admin_months_keyboard(action="add"):
     return builder.as_markup()
 
 
-def get_admin_days_keyboard(year_month):
-    """Клавиатура выбора дней для удаления (для админа)"""
+def get_admin_days_keyboard(year_month, availability):
+    """Клавиатура выбора дней для удаления (для админа)
+
+    availability - снимок индекса доступности из db.get_availability(год, месяц)
+    """
     builder = InlineKeyboardBuilder()
     year, month = map(int, year_month.split('-'))
-
-    # Получаем рабочие дни и забронированные даты
-    from database import Database
-    db = Database()
-    work_days = db.get_all_work_days()
-
-    # Получаем забронированные даты
-    booked_dates = db.conn.cursor().execute('''
-        SELECT booking_date FROM bookings 
-        WHERE deposit_paid = TRUE AND status = 'active'
-    ''').fetchall()
-    booked_dates_set = {row[0] for row in booked_dates}  # Используем формат YYYY-MM-DD
-
-    # Получаем календарь месяца
-    cal = calendar.monthcalendar(year, month)
-
-    for week in cal:
-        for day in week:
-            if day != 0:
-                date_obj = datetime(year, month, day)
-                date_iso = date_obj.strftime("%Y-%m-%d")
-                weekday_ru = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"][date_obj.weekday()]
-
-                # Проверяем, является ли день рабочим
-                if date_iso in work_days:
-                    if date_iso in booked_dates_set:  # Используем тот же формат для сравнения
-                        builder.button(
-                            text=f"❌ {day:02d} ({weekday_ru})",
-                            callback_data="admin_occupied"
-                        )
-                    else:
-                        builder.button(
-                            text=f"✅ {day:02d} ({weekday_ru})",
-                            callback_data=f"admin_remove_{date_iso}"  # ТОЛЬКО даты в формате YYYY-MM-DD
-                        )
+    booked_mask = availability.booked_mask(year, month)
+
+    for day in availability.work_days(year, month):
+        date_obj = datetime(year, month, day)
+        date_iso = date_obj.strftime("%Y-%m-%d")
+        weekday_ru = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"][date_obj.weekday()]
+
+        if booked_mask & (1 << (day - 1)):
+            builder.button(
+                text=f"❌ {day:02d} ({weekday_ru})",
+                callback_data="admin_occupied"
+            )
+        else:
+            builder.button(
+                text=f"✅ {day:02d} ({weekday_ru})",
+                callback_data=f"admin_remove_{date_iso}"  # ТОЛЬКО даты в формате YYYY-MM-DD
+            )
 
     builder.button(text="🔙 Назад к месяцам", callback_data="admin_remove_back")
     builder.adjust(3)
@@ -1,4 +1,5 @@
 import asyncio
+import html
 import logging
 import os
 from aiogram import Bot, Dispatcher, types, F, Router
@@ -8,13 +9,20 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramBadRequest
 from datetime import datetime
 import config
 from keyboards import *
 from google_sheets import GoogleSheets
 from payments import PaymentManager
-from database import Database
+from database import AsyncDatabase, db_manager
+from middlewares import DatabaseMiddleware
 from reminders import ReminderSystem
+from sheets_worker import SheetsWorker
+from sheets_outbox import SheetsOutboxRelay
+from reconciliation import reconcile_sheets
+from backup import create_snapshot_async, list_snapshots
+from query_stats import query_stats
 from aiogram.types import WebAppInfo
 import json
 from aiogram.types import Update
@@ -27,21 +35,21 @@ logger = logging.getLogger(__name__)
 storage = MemoryStorage()
 bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
 dp = Dispatcher(storage=storage)
-db = Database()
+dp.update.middleware(DatabaseMiddleware(db_manager))
 
-# ИНИЦИАЛИЗИРУЕМ РАБОЧИЕ ДНИ ПРИ ПЕРВОМ ЗАПУСКЕ
-db.initialize_work_days()
+# Google Sheets подключается в фоне после запуска бота (sheets_worker.start),
+# пока подключения нет - работаем только с локальной БД
+gsheets = GoogleSheets()
 
-try:
-    gsheets = GoogleSheets()
-    if not gsheets.is_connected():
-        logger.warning("Google Sheets не подключен, работаем только с локальной БД")
-except Exception as e:
-    logger.error(f"Ошибка инициализации Google Sheets: {e}")
-    gsheets = None
+# Все вызовы gspread идут через отдельный поток, хендлеры Google не ждут
+sheets_worker = SheetsWorker(gsheets)
+# Изменения попадают в таблицу из outbox базы: хендлер только пишет в базу
+outbox_relay = SheetsOutboxRelay(sheets_worker)
 
 payment_manager = PaymentManager()
-reminder_system = ReminderSystem(gsheets)
+# (user_id, дата), для которых платеж предоплаты создается прямо сейчас
+deposit_payments_in_progress = set()
+reminder_system = ReminderSystem(outbox_relay)
 
 
 # Состояния для FSM
@@ -92,7 +100,7 @@ async def cmd_start(message: Message):
 
 
 @dp.message(F.text == "🗓️ Забронировать день")
-async def book_day(message: Message):
+async def book_day(message: Message, db: AsyncDatabase):
     info_text = """
 📅 <b>Бронирование дня</b>
 
@@ -103,26 +111,17 @@ async def book_day(message: Message):
     """
 
     # Получаем забронированные даты из обоих источников
-    booked_dates = []
-    if gsheets:
-        booked_dates = gsheets.get_booked_dates()
+    booked_dates = await sheets_worker.get_booked_dates()
 
-    # Также получаем забронированные даты из локальной базы
-    from database import Database
-    db = Database()
-
-    # Получаем все активные бронирования с предоплатой
-    all_bookings = db.conn.cursor().execute('''
-        SELECT booking_date FROM bookings 
-        WHERE deposit_paid = TRUE AND status = 'active'
-    ''').fetchall()
+    # Также получаем забронированные даты из локальной базы (активные с предоплатой)
+    all_bookings = await db.get_booked_dates()
 
     # Добавляем даты из базы в формате DD.MM.YYYY
-    for booking in all_bookings:
-        date_obj = datetime.strptime(booking[0], "%Y-%m-%d")
+    for booking_date in all_bookings:
+        date_obj = datetime.strptime(booking_date, "%Y-%m-%d")
         booked_dates.append(date_obj.strftime("%d.%m.%Y"))
 
-    keyboard = get_months_keyboard()
+    keyboard = get_months_keyboard(await db.get_availability())
 
     if keyboard is None:
         await message.answer(
@@ -199,17 +198,10 @@ async def examples(message: Message):
 
 
 @dp.message(F.text == "👨‍💼 Поддержка")
-async def support(message: Message, state: FSMContext):
+async def support(message: Message, state: FSMContext, db: AsyncDatabase):
     # Проверяем, завершен ли проект у пользователя
     user_id = message.from_user.id
-    cursor = db.conn.cursor()
-    cursor.execute('''
-        SELECT status FROM bookings 
-        WHERE user_id = ? AND status = 'completed'
-        ORDER BY created_at DESC LIMIT 1
-    ''', (user_id,))
-
-    completed_project = cursor.fetchone()
+    completed_project = await db.has_completed_project(user_id)
 
     if completed_project:
         text = """
@@ -351,29 +343,28 @@ async def show_project(callback: CallbackQuery):
 # 📍 ИНЛАЙН КНОПКИ
 
 @dp.callback_query(F.data.startswith("month_"))
-async def select_month(callback: CallbackQuery):
+async def select_month(callback: CallbackQuery, db: AsyncDatabase):
     month_key = callback.data.split("_")[1]
 
     # Получаем забронированные даты только из Google Sheets
-    booked_dates = []
-    if gsheets:
-        booked_dates = gsheets.get_booked_dates()
+    booked_dates = await sheets_worker.get_booked_dates()
 
     # Логируем для отладки
     logger.info(f"Отображение календаря для {month_key}, забронированные даты: {booked_dates}")
 
+    year, month = map(int, month_key.split('-'))
     await callback.message.edit_text(
         "📅 Выберите доступную дату:",
-        reply_markup=get_days_keyboard(month_key, booked_dates)
+        reply_markup=get_days_keyboard(month_key, booked_dates, await db.get_availability(year, month))
     )
     await callback.answer()
 
 
 @dp.callback_query(F.data == "back_to_months")
-async def back_to_months(callback: CallbackQuery):
+async def back_to_months(callback: CallbackQuery, db: AsyncDatabase):
     await callback.message.edit_text(
         "Выберите месяц для просмотра доступных дат:",
-        reply_markup=get_months_keyboard()
+        reply_markup=get_months_keyboard(await db.get_availability())
     )
     await callback.answer()
 
@@ -409,10 +400,56 @@ async def select_date(callback: CallbackQuery):
     await callback.answer()
 
 
+async def show_deposit_payment(callback: CallbackQuery, date_str, confirmation_url):
+    """Показывает ссылку на оплату предоплаты"""
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    # РЕДАКТИРУЕМ текущее сообщение - УБИРАЕМ кнопку "Я оплатил"
+    await callback.message.edit_text(
+        f"💳 <b>Оплата предоплаты</b>\n\n"
+        f"Сумма: {config.DEPOSIT_AMOUNT} ₽\n"
+        f"Дата брони: {date_obj.strftime('%d.%m.%Y')}\n\n"
+        f"Для оплаты перейдите по ссылке:\n{confirmation_url}\n\n"
+        f"<i>После успешной оплаты бот автоматически подтвердит бронирование и отправит ссылку на бриф.</i>\n\n"
+        f"<b>Ожидаем подтверждения оплаты...</b> ⏳",
+        reply_markup=get_payment_keyboard(config.DEPOSIT_AMOUNT, date_str)
+    )
+
+
 @dp.callback_query(F.data.startswith("pay_deposit_"))
-async def process_deposit_payment(callback: CallbackQuery):
+async def process_deposit_payment(callback: CallbackQuery, db: AsyncDatabase):
     date_str = callback.data.split("_")[2]
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    key = (callback.from_user.id, date_str)
+
+    # Второе нажатие, пока создается первый платеж, не создает еще один
+    if key in deposit_payments_in_progress:
+        await callback.answer("⏳ Платеж уже создается, подождите несколько секунд")
+        return
+    deposit_payments_in_progress.add(key)
+    try:
+        await start_deposit_payment(callback, db, date_str)
+    finally:
+        deposit_payments_in_progress.discard(key)
+
+
+async def start_deposit_payment(callback: CallbackQuery, db: AsyncDatabase, date_str):
+    # Атомарно занимаем дату ДО создания платежа, чтобы двое не оплачивали один день
+    if not await db.hold_date(date_str, callback.from_user.id):
+        await callback.answer("❌ Эта дата уже занята. Выберите другую.", show_alert=True)
+        return
+
+    # Платеж по этой блокировке уже создан и ждет оплаты - показываем его же
+    pending = await db.get_hold_payment(date_str, callback.from_user.id)
+    if pending:
+        payment = await payment_manager.get_payment(pending.payment_id)
+        confirmation = getattr(payment, 'confirmation', None)
+        if payment and payment.status == 'pending' and getattr(confirmation, 'confirmation_url', None):
+            try:
+                await show_deposit_payment(callback, date_str, confirmation.confirmation_url)
+            except TelegramBadRequest:
+                # Сообщение уже показывает эту ссылку - Telegram не меняет его на такое же
+                pass
+            await callback.answer()
+            return
 
     # Создаем платеж
     payment = await payment_manager.create_payment(
@@ -423,41 +460,29 @@ async def process_deposit_payment(callback: CallbackQuery):
     )
 
     if payment:
-        # Сохраняем в базу
-        db.add_booking(
+        await db.attach_payment_to_hold(date_str, callback.from_user.id, payment.id)
+
+        # Сохраняем в базу; строка в Google Sheets добавится из outbox в фоне.
+        # Если бронь уже есть (прошлый платеж не удалось показать повторно), ей достается новый платеж
+        await db.save_deposit_booking(
             user_id=callback.from_user.id,
             username=callback.from_user.username,
             full_name=callback.from_user.full_name,
-            booking_date=date_str
+            booking_date=date_str,
+            payment_id=payment.id
         )
+        outbox_relay.notify()
 
-        # Добавляем в Google Sheets
-        if gsheets:
-            user_data = {
-                'user_id': callback.from_user.id,
-                'username': callback.from_user.username,
-                'full_name': callback.from_user.full_name
-            }
-            gsheets.add_booking(user_data, date_obj, payment.id)
-
-        # РЕДАКТИРУЕМ текущее сообщение - УБИРАЕМ кнопку "Я оплатил"
-        await callback.message.edit_text(
-            f"💳 <b>Оплата предоплаты</b>\n\n"
-            f"Сумма: {config.DEPOSIT_AMOUNT} ₽\n"
-            f"Дата брони: {date_obj.strftime('%d.%m.%Y')}\n\n"
-            f"Для оплаты перейдите по ссылке:\n{payment.confirmation.confirmation_url}\n\n"
-            f"<i>После успешной оплаты бот автоматически подтвердит бронирование и отправит ссылку на бриф.</i>\n\n"
-            f"<b>Ожидаем подтверждения оплаты...</b> ⏳",
-            reply_markup=get_payment_keyboard(config.DEPOSIT_AMOUNT, date_str)
-        )
+        await show_deposit_payment(callback, date_str, payment.confirmation.confirmation_url)
     else:
+        await db.release_hold(date_str, callback.from_user.id)
         await callback.message.edit_text("❌ Ошибка создания платежа. Попробуйте позже.")
 
     await callback.answer()
 
 
 @dp.message(Command("project_status"))
-async def check_project_status(message: Message):
+async def check_project_status(message: Message, db: AsyncDatabase):
     if message.from_user.id != config.ADMIN_ID:
         return
 
@@ -469,13 +494,7 @@ async def check_project_status(message: Message):
 
         user_id = int(parts[1])
 
-        cursor = db.conn.cursor()
-        cursor.execute('''
-            SELECT booking_date, status, deposit_paid, final_paid, brief_completed
-            FROM bookings WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
-        ''', (user_id,))
-
-        project = cursor.fetchone()
+        project = await db.get_project_status(user_id)
 
         if project:
             status_text = {
@@ -486,11 +505,11 @@ async def check_project_status(message: Message):
 
             await message.answer(
                 f"📊 <b>Статус проекта пользователя {user_id}</b>\n\n"
-                f"📅 Дата брони: {project[0]}\n"
-                f"📋 Статус: {status_text.get(project[1], project[1])}\n"
-                f"💰 Предоплата: {'✅ Оплачена' if project[2] else '❌ Не оплачена'}\n"
-                f"💰 Финальная оплата: {'✅ Оплачена' if project[3] else '❌ Не оплачена'}\n"
-                f"📝 Бриф: {'✅ Заполнен' if project[4] else '❌ Не заполнен'}\n"
+                f"📅 Дата брони: {project.booking_date}\n"
+                f"📋 Статус: {status_text.get(project.status, project.status)}\n"
+                f"💰 Предоплата: {'✅ Оплачена' if project.deposit_paid else '❌ Не оплачена'}\n"
+                f"💰 Финальная оплата: {'✅ Оплачена' if project.final_paid else '❌ Не оплачена'}\n"
+                f"📝 Бриф: {'✅ Заполнен' if project.brief_completed else '❌ Не заполнен'}\n"
             )
         else:
             await message.answer("❌ Проект не найден")
@@ -568,22 +587,20 @@ async def handle_webhook(update: Update):
 
 
 @dp.callback_query(F.data == "cancel_payment")
-async def cancel_booking(callback: CallbackQuery):
+async def cancel_booking(callback: CallbackQuery, db: AsyncDatabase):
     """Отменяет бронирование"""
     user_id = callback.from_user.id
     logger.info(f"Пользователь {user_id} отменил бронирование")
 
     # Удаляем последнее бронирование пользователя
-    bookings = db.get_user_bookings(user_id)
+    bookings = await db.get_user_bookings(user_id)
     if bookings:
         latest_booking = bookings[0]
-        booking_date = latest_booking[4]
+        booking_date = latest_booking.booking_date
 
-        # Удаляем бронирование из базы
-        cursor = db.conn.cursor()
-        cursor.execute('DELETE FROM bookings WHERE user_id = ? AND booking_date = ?',
-                       (user_id, booking_date))
-        db.conn.commit()
+        # Удаляем бронирование из базы и освобождаем дату
+        await db.delete_booking(user_id, booking_date)
+        await db.release_hold(booking_date, user_id)
 
         logger.info(f"Бронирование {booking_date} удалено для пользователя {user_id}")
 
@@ -591,20 +608,20 @@ async def cancel_booking(callback: CallbackQuery):
     await callback.message.edit_text(
         "❌ <b>Ваша бронь отменена</b>\n\n"
         "Может быть, выберете другую дату?",
-        reply_markup=get_months_keyboard()  # Возвращаем к выбору месяца
+        reply_markup=get_months_keyboard(await db.get_availability())  # Возвращаем к выбору месяца
     )
     await callback.answer()
 
 
 @dp.callback_query(F.data == "pay_final")
-async def process_final_payment(callback: CallbackQuery):
+async def process_final_payment(callback: CallbackQuery, db: AsyncDatabase):
     """Обработка финальной оплаты"""
     user_id = callback.from_user.id
-    bookings = db.get_user_bookings(user_id)
+    bookings = await db.get_user_bookings(user_id)
 
     if bookings:
         latest_booking = bookings[0]
-        booking_date = latest_booking[4]
+        booking_date = latest_booking.booking_date
 
         payment = await payment_manager.create_payment(
             amount=config.FINAL_AMOUNT,
@@ -660,22 +677,14 @@ async def show_ads_examples(callback: CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("deliver_"))
-async def deliver_project(callback: CallbackQuery, state: FSMContext):
+async def deliver_project(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Начало процесса отправки проекта клиенту"""
     parts = callback.data.split("_")
     user_id = int(parts[1])
     booking_date = parts[2]
 
     # Проверяем, оплачена ли финальная часть
-    cursor = db.conn.cursor()
-    cursor.execute('''
-        SELECT final_paid FROM bookings 
-        WHERE user_id = ? AND booking_date = ?
-    ''', (user_id, booking_date))
-
-    result = cursor.fetchone()
-
-    if not result or not result[0]:
+    if not await db.is_final_paid(user_id, booking_date):
         await callback.answer("❌ Финальная оплата еще не получена!", show_alert=True)
         return
 
@@ -784,7 +793,7 @@ async def handle_support_reply(message: Message, state: FSMContext):
 # 📍 ОБРАБОТКА ДОСТАВКИ ПРОЕКТА
 
 @dp.message(BookingState.waiting_for_delivery)
-async def handle_project_delivery(message: Message, state: FSMContext):
+async def handle_project_delivery(message: Message, state: FSMContext, db: AsyncDatabase):
     data = await state.get_data()
     target_user_id = data.get('target_user_id')
     booking_date = data.get('booking_date')
@@ -847,17 +856,9 @@ async def handle_project_delivery(message: Message, state: FSMContext):
                 "<i>Все материалы отправлены, проект завершен.</i>"
             )
 
-            # Обновляем статус в базе данных
-            cursor = db.conn.cursor()
-            cursor.execute('''
-                UPDATE bookings SET status = 'completed' 
-                WHERE user_id = ? AND booking_date = ?
-            ''', (target_user_id, booking_date))
-            db.conn.commit()
-
-            # Обновляем Google Sheets
-            if gsheets:
-                gsheets.update_booking_status(target_user_id, booking_date, "Проект завершен")
+            # Обновляем статус в базе данных, Google Sheets обновится из outbox
+            await db.mark_project_completed(target_user_id, booking_date)
+            outbox_relay.notify()
 
             await state.clear()
         else:
@@ -878,14 +879,14 @@ async def handle_project_delivery(message: Message, state: FSMContext):
 
 
 @dp.callback_query(F.data.startswith("start_chat_"))
-async def start_specialist_chat(callback: CallbackQuery, state: FSMContext):
+async def start_specialist_chat(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Специалист начинает диалог с пользователем"""
     parts = callback.data.split("_")
     user_id = int(parts[2])
     booking_date = parts[3]
 
     # Начинаем сессию чата
-    success = db.start_chat_session(user_id, callback.from_user.id, booking_date)
+    success = await db.start_chat_session(user_id, callback.from_user.id, booking_date)
 
     if success:
         # Уведомляем пользователя
@@ -920,12 +921,12 @@ async def start_specialist_chat(callback: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(F.data.startswith("end_chat_"))
-async def end_specialist_chat(callback: CallbackQuery, state: FSMContext):
+async def end_specialist_chat(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Специалист завершает диалог"""
     user_id = int(callback.data.split("_")[2])
 
     # Завершаем сессию чата
-    success = db.end_chat_session(user_id)
+    success = await db.end_chat_session(user_id)
 
     if success:
         # Уведомляем пользователя
@@ -953,12 +954,12 @@ async def end_specialist_chat(callback: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(F.data == "reply_to_specialist")
-async def user_reply_to_specialist(callback: CallbackQuery, state: FSMContext):
+async def user_reply_to_specialist(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Пользователь готов общаться со специалистом"""
     user_id = callback.from_user.id
 
     # Проверяем, активен ли чат
-    chat_session = db.get_active_chat(user_id)
+    chat_session = await db.get_active_chat(user_id)
 
     if chat_session:
         await callback.message.answer(
@@ -999,15 +1000,15 @@ async def handle_specialist_message(message: Message, state: FSMContext):
 
 
 @dp.message(BookingState.user_chat_active)
-async def handle_user_message_to_specialist(message: Message):
+async def handle_user_message_to_specialist(message: Message, db: AsyncDatabase):
     """Обрабатывает сообщения пользователя во время диалога"""
     user_id = message.from_user.id
 
     # Получаем информацию о активном чате
-    chat_session = db.get_active_chat(user_id)
+    chat_session = await db.get_active_chat(user_id)
 
     if chat_session:
-        admin_id = chat_session[2]  # admin_id field
+        admin_id = chat_session.admin_id
         try:
             # Пересылаем сообщение специалисту
             await bot.send_message(
@@ -1025,14 +1026,14 @@ async def handle_user_message_to_specialist(message: Message):
 
 
 @dp.callback_query(F.data.startswith("start_chat_"))
-async def start_specialist_chat(callback: CallbackQuery, state: FSMContext):
+async def start_specialist_chat(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Специалист начинает диалог с пользователем"""
     parts = callback.data.split("_")
     user_id = int(parts[2])
     booking_date = parts[3]
 
     # Начинаем сессию чата
-    success = db.start_chat_session(user_id, callback.from_user.id, booking_date)
+    success = await db.start_chat_session(user_id, callback.from_user.id, booking_date)
 
     if success:
         # Уведомляем пользователя
@@ -1067,12 +1068,12 @@ async def start_specialist_chat(callback: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(F.data.startswith("end_chat_"))
-async def end_specialist_chat(callback: CallbackQuery, state: FSMContext):
+async def end_specialist_chat(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Специалист завершает диалог"""
     user_id = int(callback.data.split("_")[2])
 
     # Завершаем сессию чата
-    success = db.end_chat_session(user_id)
+    success = await db.end_chat_session(user_id)
 
     if success:
         # Уведомляем пользователя
@@ -1100,12 +1101,12 @@ async def end_specialist_chat(callback: CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(F.data == "reply_to_specialist")
-async def user_reply_to_specialist(callback: CallbackQuery, state: FSMContext):
+async def user_reply_to_specialist(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Пользователь готов общаться со специалистом"""
     user_id = callback.from_user.id
 
     # Проверяем, активен ли чат
-    chat_session = db.get_active_chat(user_id)
+    chat_session = await db.get_active_chat(user_id)
 
     if chat_session:
         await callback.message.answer(
@@ -1146,15 +1147,15 @@ async def handle_specialist_message(message: Message, state: FSMContext):
 
 
 @dp.message(BookingState.user_chat_active)
-async def handle_user_message_to_specialist(message: Message):
+async def handle_user_message_to_specialist(message: Message, db: AsyncDatabase):
     """Обрабатывает сообщения пользователя во время диалога"""
     user_id = message.from_user.id
 
     # Получаем информацию о активном чате
-    chat_session = db.get_active_chat(user_id)
+    chat_session = await db.get_active_chat(user_id)
 
     if chat_session:
-        admin_id = chat_session[2]  # admin_id field
+        admin_id = chat_session.admin_id
         try:
             # Пересылаем сообщение специалисту
             await bot.send_message(
@@ -1171,17 +1172,17 @@ async def handle_user_message_to_specialist(message: Message):
         await message.answer("❌ Диалог со специалистом не активен")
 
 
-async def check_chat_active(message: Message) -> bool:
+async def check_chat_active(message: Message, db: AsyncDatabase) -> bool:
     """Проверяет, активен ли чат с пользователем"""
-    return db.is_chat_active(message.from_user.id)
+    return await db.is_chat_active(message.from_user.id)
 
 
 # Для пользователя - блокируем основные команды во время диалога
 @dp.message(
     F.text.in_(["🗓️ Забронировать день", "❓ Как всё проходит?", "💰 Услуги/оплата", "📊 Примеры работ", "👨‍💼 Поддержка"]))
-async def handle_commands_during_chat(message: Message):
+async def handle_commands_during_chat(message: Message, db: AsyncDatabase):
     """Блокирует основные команды во время активного диалога"""
-    if await check_chat_active(message):
+    if await check_chat_active(message, db):
         await message.answer(
             "⏸️ <b>Команды временно недоступны</b>\n\n"
             "В настоящее время вы находитесь в диалоге со специалистом. "
@@ -1194,9 +1195,9 @@ async def handle_commands_during_chat(message: Message):
 
 # Также добавим проверку для команды /start
 @dp.message(CommandStart())
-async def cmd_start_with_chat_check(message: Message):
+async def cmd_start_with_chat_check(message: Message, db: AsyncDatabase):
     """Обработчик /start с проверкой активного чата"""
-    if await check_chat_active(message):
+    if await check_chat_active(message, db):
         await message.answer(
             "⏸️ <b>Команды временно недоступны</b>\n\n"
             "В настоящее время вы находитесь в диалоге со специалистом. "
@@ -1245,24 +1246,13 @@ async def admin_panel(message: Message):
 
 
 @dp.message(Command("bookings"))
-async def show_bookings(message: Message):
+async def show_bookings(message: Message, db: AsyncDatabase):
     """Показывает все активные бронирования"""
     if message.from_user.id != config.ADMIN_ID:
         return
 
-    from database import Database
-    db = Database()
-
     # Получаем все активные бронирования с предоплатой
-    cursor = db.conn.cursor()
-    cursor.execute('''
-        SELECT user_id, username, full_name, booking_date, deposit_paid, final_paid, brief_completed
-        FROM bookings 
-        WHERE status = 'active' AND deposit_paid = TRUE
-        ORDER BY booking_date
-    ''')
-
-    bookings = cursor.fetchall()
+    bookings = await db.get_active_paid_bookings()
 
     if not bookings:
         await message.answer("📭 <b>Активных бронирований нет</b>")
@@ -1271,65 +1261,49 @@ async def show_bookings(message: Message):
     text = "📋 <b>Активные бронирования:</b>\n\n"
 
     for booking in bookings:
-        user_id, username, full_name, booking_date, deposit_paid, final_paid, brief_completed = booking
-        date_obj = datetime.strptime(booking_date, "%Y-%m-%d")
+        date_obj = datetime.strptime(booking.booking_date, "%Y-%m-%d")
         date_str = date_obj.strftime("%d.%m.%Y")
 
-        text += f"👤 <b>{full_name}</b>\n"
-        text += f"📱 @{username or 'нет'}\n"
-        text += f"🆔 {user_id}\n"
+        text += f"👤 <b>{booking.full_name}</b>\n"
+        text += f"📱 @{booking.username or 'нет'}\n"
+        text += f"🆔 {booking.user_id}\n"
         text += f"📅 {date_str}\n"
-        text += f"💰 Предоплата: {'✅' if deposit_paid else '❌'}\n"
-        text += f"💰 Финальная: {'✅' if final_paid else '❌'}\n"
-        text += f"📝 Бриф: {'✅' if brief_completed else '❌'}\n"
+        text += f"💰 Предоплата: {'✅' if booking.deposit_paid else '❌'}\n"
+        text += f"💰 Финальная: {'✅' if booking.final_paid else '❌'}\n"
+        text += f"📝 Бриф: {'✅' if booking.brief_completed else '❌'}\n"
         text += "─" * 30 + "\n"
 
     await message.answer(text)
 
 
 @dp.message(Command("stats"))
-async def show_stats(message: Message):
+async def show_stats(message: Message, db: AsyncDatabase):
     """Показывает статистику по бронированиям"""
     if message.from_user.id != config.ADMIN_ID:
         return
 
-    from database import Database
-    db = Database()
-
-    cursor = db.conn.cursor()
-
-    # Общее количество бронирований
-    cursor.execute('SELECT COUNT(*) FROM bookings')
-    total_bookings = cursor.fetchone()[0]
-
-    # Активные бронирования
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE status = "active" AND deposit_paid = TRUE')
-    active_bookings = cursor.fetchone()[0]
-
-    # Завершенные проекты
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE status = "completed"')
-    completed_bookings = cursor.fetchone()[0]
-
-    # Бронирования с предоплатой
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE deposit_paid = TRUE')
-    paid_deposit = cursor.fetchone()[0]
-
-    # Бронирования с финальной оплатой
-    cursor.execute('SELECT COUNT(*) FROM bookings WHERE final_paid = TRUE')
-    paid_final = cursor.fetchone()[0]
+    stats = await db.get_stats()
+    months = await db.get_stats_by_period('month', limit=3)
 
     text = f"""
 📊 <b>Статистика бота</b>
 
-📋 Всего бронирований: {total_bookings}
-🟢 Активных: {active_bookings}
-✅ Завершенных: {completed_bookings}
-💰 С предоплатой: {paid_deposit}
-💰 С финальной оплатой: {paid_final}
+📋 Всего бронирований: {stats['total_bookings']}
+🟢 Активных: {stats['active_bookings']}
+✅ Завершенных: {stats['completed_bookings']}
+💰 С предоплатой: {stats['paid_deposit']}
+💰 С финальной оплатой: {stats['paid_final']}
 
-💼 Рабочих дней в системе: {len(db.get_all_work_days())}
+💼 Рабочих дней в системе: {stats['work_days']}
     """
 
+    if months:
+        text += "\n📆 <b>По месяцам съемки:</b>\n"
+        for counters in months:
+            month = counters.period.split(':', 1)[1]
+            text += (f"{month}: {counters.total} всего, {counters.active_paid} активных, "
+                     f"{counters.completed} завершенных\n")
+
     await message.answer(text)
 
 
@@ -1400,17 +1374,14 @@ async def admin_add_month(callback: CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("admin_month_"))
-async def admin_process_month(callback: CallbackQuery):
+async def admin_process_month(callback: CallbackQuery, db: AsyncDatabase):
     """Обработка выбранного месяца для добавления"""
     month_key = callback.data.split("_")[2]
     year, month = map(int, month_key.split('-'))
     month_date = datetime(year, month, 1)
     month_name = f"{get_russian_month_name(month_date)} {year}"
 
-    from database import Database
-    db = Database()
-
-    work_days_added = db.add_work_days_for_month(year, month)
+    work_days_added = await db.add_work_days_for_month(year, month)
 
     if work_days_added > 0:
         await callback.message.edit_text(
@@ -1420,6 +1391,13 @@ async def admin_process_month(callback: CallbackQuery):
             f"Теперь эти дни доступны для бронирования клиентами.",
             reply_markup=get_admin_work_keyboard()
         )
+    elif (await db.get_availability(year, month)).work_mask(year, month):
+        await callback.message.edit_text(
+            f"ℹ️ <b>Месяц уже добавлен</b>\n\n"
+            f"Месяц: {month_name}\n\n"
+            f"Все рабочие дни этого месяца уже есть в календаре.",
+            reply_markup=get_admin_work_keyboard()
+        )
     else:
         await callback.message.edit_text(
             f"❌ <b>Ошибка добавления месяца</b>\n\n"
@@ -1447,17 +1425,14 @@ async def admin_add_day(callback: CallbackQuery, state: FSMContext):
 
 
 @dp.message(AdminWorkState.waiting_for_day)
-async def admin_process_day(message: Message, state: FSMContext):
+async def admin_process_day(message: Message, state: FSMContext, db: AsyncDatabase):
     """Обработка введенной даты"""
     try:
         # Парсим дату
         date_obj = datetime.strptime(message.text, "%d.%m.%Y")
         date_iso = date_obj.strftime("%Y-%m-%d")
 
-        from database import Database
-        db = Database()
-
-        success = db.add_work_day(date_iso)
+        success = await db.add_work_day(date_iso)
 
         if success:
             await message.answer(
@@ -1498,7 +1473,7 @@ async def admin_remove_day_menu(callback: CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("admin_remove_month_"))
-async def admin_select_month_for_remove(callback: CallbackQuery):
+async def admin_select_month_for_remove(callback: CallbackQuery, db: AsyncDatabase):
     """Выбор месяца для удаления дней"""
     month_key = callback.data.split("_")[3]  # admin_remove_month_2025-01
     year, month = map(int, month_key.split('-'))
@@ -1506,12 +1481,9 @@ async def admin_select_month_for_remove(callback: CallbackQuery):
     month_name = f"{get_russian_month_name(month_date)} {year}"
 
     # Проверяем, есть ли рабочие дни в этом месяце
-    from database import Database
-    db = Database()
-    work_days = db.get_all_work_days()
-    month_work_days = [d for d in work_days if d.startswith(month_key)]
+    availability = await db.get_availability(year, month)
 
-    if not month_work_days:
+    if not availability.work_mask(year, month):
         await callback.message.edit_text(
             f"❌ <b>В этом месяце нет рабочих дней</b>\n\n"
             f"Месяц: {month_name}\n\n"
@@ -1531,12 +1503,12 @@ async def admin_select_month_for_remove(callback: CallbackQuery):
 • <b>✅</b> - доступен для удаления
 • <b>❌</b> - есть активные бронирования (удалить нельзя)
     """
-    await callback.message.edit_text(text, reply_markup=get_admin_days_keyboard(month_key))
+    await callback.message.edit_text(text, reply_markup=get_admin_days_keyboard(month_key, availability))
     await callback.answer()
 
 
 @dp.callback_query(F.data.startswith("admin_remove_"))
-async def admin_process_remove_day(callback: CallbackQuery):
+async def admin_process_remove_day(callback: CallbackQuery, db: AsyncDatabase):
     """Обработка удаления дня - ТОЛЬКО для дат, не для месяцев"""
     # Проверяем, что это кнопка "назад"
     if callback.data == "admin_remove_back":
@@ -1556,10 +1528,7 @@ async def admin_process_remove_day(callback: CallbackQuery):
         date_obj = datetime.strptime(date_iso, "%Y-%m-%d")
         date_str = date_obj.strftime("%d.%m.%Y")
 
-        from database import Database
-        db = Database()
-
-        success, message_text = db.remove_work_day(date_iso)
+        success, message_text = await db.remove_work_day(date_iso)
 
         if success:
             await callback.message.edit_text(
@@ -1642,15 +1611,144 @@ async def process_refund(message: Message):
         await message.answer(f"❌ Ошибка: {e}")
 
 
+@dp.message(Command("backup"))
+async def backup_database(message: Message):
+    """Делает снимок базы данных по команде (только для админа)"""
+    if message.from_user.id != config.ADMIN_ID:
+        return
+
+    await message.answer("⏳ Делаю снимок базы...")
+    try:
+        path = await create_snapshot_async()
+        size_kb = os.path.getsize(path) // 1024
+        await message.answer(
+            f"✅ Снимок сохранен: <code>{path}</code> ({size_kb} КБ)\n"
+            f"📦 Хранится снимков: {len(list_snapshots())}"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования базы: {e}")
+        await message.answer(f"❌ Ошибка резервного копирования: {e}")
+
+
+@dp.message(Command("db_stats"))
+async def show_db_stats(message: Message):
+    """Показывает самые тяжелые SQL-запросы (только для админа)"""
+    if message.from_user.id != config.ADMIN_ID:
+        return
+
+    parts = message.text.split()
+    if len(parts) > 1 and parts[1] == "reset":
+        query_stats.reset()
+        await message.answer("✅ Статистика запросов сброшена")
+        return
+
+    statements = query_stats.top(10)
+    if not statements:
+        await message.answer("📭 Запросы еще не выполнялись")
+        return
+
+    text = "🗄️ <b>Самые тяжелые запросы</b> (по суммарному времени)\n\n"
+    for stats in statements:
+        sql = stats.sql if len(stats.sql) <= 120 else stats.sql[:117] + "..."
+        text += (f"<code>{html.escape(sql)}</code>\n"
+                 f"{stats.count} раз, всего {stats.total_time * 1000:.0f} мс, "
+                 f"p99 {stats.p99_ms:.1f} мс, строк {stats.rows}\n\n")
+
+    await message.answer(text)
+
+
+@dp.message(Command("sheets"))
+async def show_sheets_stats(message: Message, db: AsyncDatabase):
+    """Показывает состояние Google Sheets; /sheets reconnect - переподключиться (только для админа)"""
+    if message.from_user.id != config.ADMIN_ID:
+        return
+
+    parts = message.text.split()
+    if len(parts) > 1 and parts[1] == "reconnect":
+        sheets_worker.reconnect()
+        await message.answer("🔄 Переподключаемся к Google Sheets")
+        return
+
+    health = sheets_worker.health()
+    metrics = gsheets.writes.metrics
+    outbox = await db.get_outbox_stats()
+    reads = gsheets.reader.metrics
+    quota = gsheets.quota
+    flushes = metrics['flushes']
+    avg_ms = metrics['total_flush_ms'] / flushes if flushes else 0.0
+    last_success = health['last_success_at'].strftime('%d.%m %H:%M:%S') if health['last_success_at'] else '—'
+    connected_at = health['connected_at'].strftime('%d.%m %H:%M:%S') if health['connected_at'] else '—'
+    states = {'connected': 'есть', 'connecting': 'подключаемся', 'disconnected': 'нет'}
+    text = f"""
+📗 <b>Google Sheets</b>
+
+🔌 Подключение: {states.get(health['state'], health['state'])} (с {connected_at}), попыток: {health['connect_attempts']}, успешных: {health['connects']}
+❗ Ошибка подключения: {html.escape(health['last_connect_error'] or '—')}
+⚙️ Обработчик: {'работает' if health['running'] else 'остановлен'}, команд в очереди: {health['queued']}
+✅ Выполнено команд: {health['processed']}, ошибок: {health['failed']}
+🕒 Последний успех: {last_success}, задержка {health['last_latency_ms']:.0f} мс (макс. {health['max_latency_ms']:.0f} мс)
+⚠️ Последняя ошибка: {html.escape(health['last_error'] or '—')}
+⏳ В очереди записи: {health['pending_writes']}
+📦 Пакетов записано: {flushes} (ошибок: {metrics['errors']})
+✏️ Ячеек: {metrics['cells_written']}, строк: {metrics['rows_appended']}, схлопнуто: {metrics['coalesced']}
+📏 Размер пакета: последний {metrics['last_batch']}, максимум {metrics['max_batch']}
+⏱️ Запись пакета: последняя {metrics['last_flush_ms']:.0f} мс, средняя {avg_ms:.0f} мс, максимум {metrics['max_flush_ms']:.0f} мс
+🚦 Квота: запросов {quota.metrics['calls']}, 429: {quota.metrics['quota_errors']}, повторов {quota.metrics['retries']}, отказов {quota.metrics['gave_up']}, ожиданий токена {quota.reads.metrics['waited'] + quota.writes.metrics['waited']} ({quota.reads.metrics['wait_seconds'] + quota.writes.metrics['wait_seconds']:.1f} с)
+📖 Чтение: целиком {reads['full_reads']} (после правок {reads['edits_detected']}), дочитываний {reads['delta_reads']}, без изменений {reads['unchanged']}, строк {reads['rows_read']}
+
+📮 <b>Outbox</b>
+Ожидают доставки: {outbox['pending']} (с ошибками: {outbox['failing']}), самое старое: {outbox['oldest'] or '—'}
+Доставлено: {outbox_relay.stats['delivered']}, отложено после ошибок: {outbox_relay.stats['retried']}
+Последняя ошибка: {html.escape(outbox['last_error'] or '—')}
+    """
+    await message.answer(text)
+
+
+@dp.message(Command("reconcile"))
+async def reconcile_with_sheets(message: Message):
+    """Сверяет базу с Google Sheets; /reconcile dry - только отчет (только для админа)"""
+    if message.from_user.id != config.ADMIN_ID:
+        return
+
+    parts = message.text.split()
+    dry_run = len(parts) > 1 and parts[1] == "dry"
+    await message.answer("🔁 Сверяем базу с Google Sheets...")
+    report = await reconcile_sheets(sheets_worker, dry_run=dry_run)
+    await message.answer(html.escape(report.summary()))
+
+
 # 📍 ЗАПУСК БОТА
 
 async def start_schedulers():
     """Запускает все планировщики"""
+    # Подключение к Google Sheets идет в фоне и не задерживает запуск бота
+    sheets_worker.start()
+    outbox_relay.start()
     asyncio.create_task(reminder_system.start_reminder_scheduler(bot))
 
 
+async def on_shutdown():
+    """Дописывает отложенные изменения в Google Sheets и закрывает базу данных"""
+    await outbox_relay.stop()
+    await sheets_worker.stop()
+    await PaymentManager.close()
+    db_manager.close()
+
+
 async def main():
     logger.info("Бот Айви запущен!")
+
+    # Открываем общее подключение к базе один раз на весь процесс
+    db = db_manager.connect()
+
+    # Догенерируем рабочие дни на MONTHS_TO_SHOW месяцев вперед
+    await db.extend_work_days_horizon()
+
+    # Планы горячих запросов проверяет tests/test_query_plans.py; при отладке - и при запуске
+    if config.DB_CHECK_QUERY_PLANS:
+        await db.check_query_plans()
+
+    dp.shutdown.register(on_shutdown)
     await start_schedulers()
     await dp.start_polling(bot)
 
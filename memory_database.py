@@ -0,0 +1,618 @@
+from contextlib import contextmanager
+from dataclasses import replace
+from datetime import date, datetime, timedelta
+import json
+import logging
+import threading
+import config
+from availability import AvailabilityIndex
+from models import Booking, Payment, WorkDay, ChatSession, BookingCounters, OutboxEvent
+from repository import (BookingRepository, BOOKING_FLAG_FILTERS, BOOKING_STATUSES, check_booking_changes,
+                        OUTBOX_ADD_BOOKING, OUTBOX_BOOKING_STATUS, SHEET_PAYMENT_STATUSES,
+                        SHEET_PROJECT_COMPLETED, outbox_key)
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _now(delay_seconds=0):
+    """Текущее время UTC (плюс delay_seconds) в формате CURRENT_TIMESTAMP SQLite"""
+    return (datetime.utcnow() + timedelta(seconds=delay_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _counter_periods(booking_date):
+    """Периоды счетчиков бронирования - те же ключи, что у триггеров миграции 9"""
+    periods = ['all']
+    try:
+        day = date.fromisoformat(booking_date)
+    except (TypeError, ValueError):
+        return periods
+    year, week, _ = day.isocalendar()
+    return periods + [f"month:{booking_date[:7]}", f"week:{year}-W{week:02d}"]
+
+
+def _newest_first(rows):
+    return sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)
+
+
+class MemoryDatabase(BookingRepository):
+    """Хранилище целиком в памяти процесса, без SQLite и диска.
+
+    Повторяет поведение Database для тестов и нагрузочных прогонов.
+    Строки - те же объекты Booking, Payment..., и они не изменяются на месте:
+    каждое изменение записывает новую строку через _put/_pop. Это дает
+    дешевый откат транзакции по журналу отмены и безопасную выдачу строк
+    наружу. Бронирования дополнительно индексируются по пользователю и дате.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = {name: {} for name in (
+            'bookings', 'payments', 'work_days', 'date_holds', 'active_chats',
+            'settings', 'bookings_archive', 'payments_archive', 'sheets_outbox')}
+        self._outbox_keys = {}  # ключ идемпотентности -> id события
+        self._by_user = {}  # user_id -> множество id бронирований
+        self._by_date = {}  # booking_date -> множество id бронирований
+        self._next_id = {}
+        self._undo = None  # журнал отмены открытой транзакции
+        self._transaction_depth = 0
+        self._availability = None
+
+    # Низкоуровневые операции: только они меняют таблицы
+
+    def _put(self, table, key, row):
+        self._log(table, key)
+        rows = self._tables[table]
+        if table == 'bookings' and key in rows:
+            self._unindex(rows[key])
+        rows[key] = row
+        if table == 'bookings':
+            self._by_user.setdefault(row.user_id, set()).add(key)
+            self._by_date.setdefault(row.booking_date, set()).add(key)
+        elif table == 'sheets_outbox':
+            self._outbox_keys[row.idempotency_key] = key
+
+    def _pop(self, table, key):
+        rows = self._tables[table]
+        if key not in rows:
+            return None
+        self._log(table, key)
+        row = rows.pop(key)
+        if table == 'bookings':
+            self._unindex(row)
+        elif table == 'sheets_outbox':
+            self._outbox_keys.pop(row.idempotency_key, None)
+        return row
+
+    def _unindex(self, row):
+        self._by_user[row.user_id].discard(row.id)
+        self._by_date[row.booking_date].discard(row.id)
+
+    def _log(self, table, key):
+        if self._undo is not None:
+            self._undo.append((table, key, self._tables[table].get(key, _MISSING)))
+
+    def _new_id(self, table):
+        self._next_id[table] = self._next_id.get(table, 0) + 1
+        return self._next_id[table]
+
+    @contextmanager
+    def transaction(self):
+        """Объединяет операции в транзакцию; при ошибке изменения откатываются"""
+        with self._lock:
+            if self._transaction_depth == 0:
+                self._undo = []
+            self._transaction_depth += 1
+            try:
+                yield self
+            except Exception:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._rollback()
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._undo = None
+
+    def _rollback(self):
+        undo, self._undo = self._undo, None
+        for table, key, row in reversed(undo):
+            if row is _MISSING:
+                self._pop(table, key)
+            else:
+                self._put(table, key, row)
+        self._availability = None
+
+    def close(self):
+        """Данные в памяти закрывать не нужно"""
+
+    # Выборки бронирований
+
+    def _bookings(self, ids):
+        rows = self._tables['bookings']
+        return [rows[booking_id] for booking_id in ids]
+
+    def _user_bookings(self, user_id):
+        return self._bookings(self._by_user.get(user_id, ()))
+
+    def _date_bookings(self, booking_date):
+        return self._bookings(self._by_date.get(booking_date, ()))
+
+    def _update_bookings(self, bookings, **changes):
+        for booking in bookings:
+            self._put('bookings', booking.id, replace(booking, **changes))
+        return len(bookings)
+
+    @staticmethod
+    def _is_paid_active(booking):
+        return booking.status == 'active' and booking.deposit_paid
+
+    # Бронирования и платежи
+
+    def add_booking(self, user_id, username, full_name, booking_date, payment_id=None):
+        with self.transaction():
+            booking_id = self._new_id('bookings')
+            self._put('bookings', booking_id, Booking(
+                booking_id, user_id, username, full_name, booking_date, 'active',
+                False, False, False, None, _now()))
+            self.add_outbox_event(OUTBOX_ADD_BOOKING, user_id, booking_date, {
+                'username': username, 'full_name': full_name, 'payment_id': payment_id})
+            return booking_id
+
+    def save_deposit_booking(self, user_id, username, full_name, booking_date, payment_id):
+        with self.transaction():
+            pending = [booking for booking in self._date_bookings(booking_date)
+                       if booking.user_id == user_id and booking.status == 'active' and not booking.deposit_paid]
+            if pending:
+                booking = max(pending, key=lambda booking: booking.id)
+            else:
+                booking = self._tables['bookings'][
+                    self.add_booking(user_id, username, full_name, booking_date, payment_id)]
+            self._put('bookings', booking.id, replace(booking, payment_id=payment_id))
+            return booking.id
+
+    def save_payment_info(self, user_id, payment_id, amount, booking_date, payment_type):
+        with self._lock:
+            if payment_id in self._tables['payments']:
+                raise ValueError(f"Платеж {payment_id} уже существует")
+            self._put('payments', payment_id, Payment(
+                self._new_id('payments'), user_id, payment_id, amount, payment_type,
+                'pending', booking_date, _now()))
+
+    def update_payment_status(self, payment_id, status):
+        with self.transaction():
+            payment = self._tables['payments'].get(payment_id)
+            if payment is None:
+                return
+            payment = replace(payment, status=status)
+            self._put('payments', payment_id, payment)
+
+            if status == 'succeeded':
+                bookings = [booking for booking in self._date_bookings(payment.booking_date)
+                            if booking.user_id == payment.user_id]
+                if payment.payment_type == 'deposit':
+                    self._update_bookings(bookings, deposit_paid=True)
+                elif payment.payment_type == 'final':
+                    self._update_bookings(bookings, final_paid=True)
+                if payment.payment_type in SHEET_PAYMENT_STATUSES:
+                    self.add_outbox_event(OUTBOX_BOOKING_STATUS, payment.user_id, payment.booking_date,
+                                          {'status': SHEET_PAYMENT_STATUSES[payment.payment_type]})
+                self._pop('date_holds', payment.booking_date)
+                self._refresh_availability(payment.booking_date)
+
+            elif status in ('canceled', 'failed', 'refunded'):
+                for booking_date, hold in list(self._tables['date_holds'].items()):
+                    if hold['payment_id'] == payment_id:
+                        self._pop('date_holds', booking_date)
+
+    def get_payment_info(self, payment_id):
+        return self._tables['payments'].get(payment_id)
+
+    def get_pending_payments(self):
+        return [payment for payment in self._tables['payments'].values() if payment.status == 'pending']
+
+    def get_user_bookings(self, user_id):
+        return sorted(self._user_bookings(user_id), key=lambda booking: booking.booking_date, reverse=True)
+
+    def is_date_available(self, booking_date):
+        return not any(self._is_paid_active(booking) for booking in self._date_bookings(booking_date))
+
+    def delete_booking(self, user_id, booking_date):
+        with self._lock:
+            for booking in self._date_bookings(booking_date):
+                if booking.user_id == user_id:
+                    self._pop('bookings', booking.id)
+            self._refresh_availability(booking_date)
+
+    def get_booked_dates(self):
+        return [booking.booking_date for booking in self._tables['bookings'].values()
+                if self._is_paid_active(booking)]
+
+    def get_bookings_between(self, start=None, end=None, **filters):
+        for name, value in filters.items():
+            if name == 'status' and value not in BOOKING_STATUSES:
+                raise ValueError(f"Неизвестный статус бронирования: {value}")
+            if name not in BOOKING_FLAG_FILTERS and name not in ('status', 'user_id'):
+                raise ValueError(f"Неизвестный фильтр бронирований: {name}")
+
+        start = None if start is None else str(start)
+        end = None if end is None else str(end)
+        if 'user_id' in filters:
+            bookings = self._user_bookings(filters['user_id'])
+        else:
+            bookings = self._tables['bookings'].values()
+
+        result = []
+        for booking in bookings:
+            if start is not None and booking.booking_date < start:
+                continue
+            if end is not None and booking.booking_date > end:
+                continue
+            if any(bool(getattr(booking, name)) != bool(value) if name in BOOKING_FLAG_FILTERS
+                   else getattr(booking, name) != value for name, value in filters.items()):
+                continue
+            result.append(booking)
+        result.sort(key=lambda booking: booking.booking_date)
+        return result
+
+    def _all_user_bookings(self, user_id):
+        archived = [booking for booking in self._tables['bookings_archive'].values()
+                    if booking.user_id == user_id]
+        return _newest_first(self._user_bookings(user_id) + archived)
+
+    def get_project_status(self, user_id):
+        bookings = self._all_user_bookings(user_id)
+        return bookings[0] if bookings else None
+
+    def has_completed_project(self, user_id):
+        return any(booking.status == 'completed' for booking in self._all_user_bookings(user_id))
+
+    def is_final_paid(self, user_id, booking_date):
+        for booking in self._date_bookings(booking_date):
+            if booking.user_id == user_id:
+                return bool(booking.final_paid)
+        return False
+
+    def mark_project_completed(self, user_id, booking_date):
+        with self.transaction():
+            self._update_bookings([booking for booking in self._date_bookings(booking_date)
+                                   if booking.user_id == user_id], status='completed')
+            self.add_outbox_event(OUTBOX_BOOKING_STATUS, user_id, booking_date,
+                                  {'status': SHEET_PROJECT_COMPLETED})
+            self._refresh_availability(booking_date)
+        logger.info(f"Проект отмечен завершенным: user_id={user_id}, date={booking_date}")
+
+    def mark_brief_completed(self, user_id):
+        with self._lock:
+            self._update_bookings(self._user_bookings(user_id), brief_completed=True)
+
+    def mark_date_as_booked(self, booking_date):
+        with self._lock:
+            self._update_bookings([booking for booking in self._date_bookings(booking_date)
+                                   if booking.deposit_paid], status='booked')
+            self._refresh_availability(booking_date)
+
+    def get_user_booking_date(self, user_id):
+        for booking in _newest_first(self._user_bookings(user_id)):
+            if booking.deposit_paid:
+                return booking.booking_date
+        return None
+
+    def get_user_active_booking(self, user_id):
+        for booking in _newest_first(self._user_bookings(user_id)):
+            if booking.status == 'active':
+                return booking
+        return None
+
+    def set_sheet_row(self, user_id, booking_date, sheet_row):
+        with self._lock:
+            self._update_bookings([booking for booking in self._date_bookings(booking_date)
+                                   if booking.user_id == user_id], sheet_row=sheet_row)
+
+    def get_sheet_row(self, user_id, booking_date):
+        for booking in self._date_bookings(booking_date):
+            if booking.user_id == user_id:
+                return booking.sheet_row
+        return None
+
+    def get_all_user_bookings(self, user_id):
+        return self._all_user_bookings(user_id)
+
+    def get_archived_bookings(self):
+        return list(self._tables['bookings_archive'].values())
+
+    def update_booking(self, user_id, booking_date, **changes):
+        check_booking_changes(changes)
+        if not changes:
+            return
+        with self._lock:
+            self._update_bookings([booking for booking in self._date_bookings(booking_date)
+                                   if booking.user_id == user_id], **changes)
+            self._refresh_availability(booking_date)
+
+    def import_booking(self, user_id, username, full_name, booking_date, **changes):
+        check_booking_changes(changes)
+        with self._lock:
+            booking_id = self._new_id('bookings')
+            self._put('bookings', booking_id, replace(Booking(
+                booking_id, user_id, username, full_name, booking_date, 'active',
+                False, False, False, None, _now()), **changes))
+            self._refresh_availability(booking_date)
+            return booking_id
+
+    # Блокировки дат на время оплаты
+
+    def _hold_is_stale(self, hold, now):
+        """Истекшая блокировка без ожидающего или прошедшего платежа"""
+        payment = self._tables['payments'].get(hold['payment_id'])
+        return hold['expires_at'] <= now and (payment is None or payment.status not in ('pending', 'succeeded'))
+
+    def hold_date(self, booking_date, user_id, ttl_minutes=None):
+        ttl_minutes = config.DATE_HOLD_TTL_MINUTES if ttl_minutes is None else ttl_minutes
+        with self._lock:
+            if not self.is_date_available(booking_date):
+                return False
+            now = datetime.utcnow()
+            hold = self._tables['date_holds'].get(booking_date)
+            if hold is not None and hold['user_id'] != user_id and not self._hold_is_stale(hold, now):
+                logger.info(f"Дата {booking_date} уже заблокирована другим пользователем")
+                return False
+            # Свой платеж при продлении сохраняется, чужой - нет
+            payment_id = hold['payment_id'] if hold is not None and hold['user_id'] == user_id else None
+            self._put('date_holds', booking_date, {
+                'user_id': user_id, 'payment_id': payment_id,
+                'expires_at': now + timedelta(minutes=ttl_minutes)})
+        logger.info(f"Дата {booking_date} заблокирована для пользователя {user_id}")
+        return True
+
+    def attach_payment_to_hold(self, booking_date, user_id, payment_id):
+        with self._lock:
+            hold = self._tables['date_holds'].get(booking_date)
+            if hold is not None and hold['user_id'] == user_id:
+                self._put('date_holds', booking_date, dict(hold, payment_id=payment_id))
+
+    def get_hold_payment(self, booking_date, user_id):
+        with self._lock:
+            hold = self._tables['date_holds'].get(booking_date)
+            if hold is None or hold['user_id'] != user_id:
+                return None
+            payment = self._tables['payments'].get(hold['payment_id'])
+            return payment if payment is not None and payment.status == 'pending' else None
+
+    def release_hold(self, booking_date, user_id):
+        with self._lock:
+            hold = self._tables['date_holds'].get(booking_date)
+            if hold is not None and hold['user_id'] == user_id:
+                self._pop('date_holds', booking_date)
+
+    def release_expired_holds(self):
+        with self.transaction():
+            now = datetime.utcnow()
+            released = [booking_date for booking_date, hold in self._tables['date_holds'].items()
+                        if self._hold_is_stale(hold, now)]
+            for booking_date in released:
+                self._pop('date_holds', booking_date)
+        if released:
+            logger.info(f"Сняты истекшие блокировки дат: {released}")
+        return released
+
+    def get_date_holds(self):
+        with self._lock:
+            now = datetime.utcnow()
+            return {booking_date: hold['user_id'] for booking_date, hold in self._tables['date_holds'].items()
+                    if not self._hold_is_stale(hold, now)}
+
+    # Статистика и архив
+
+    def _count(self):
+        """Счетчики всех периодов; в памяти проще пересчитать, чем вести триггерами"""
+        counters = {}
+        for table in ('bookings', 'bookings_archive'):
+            for booking in self._tables[table].values():
+                for period in _counter_periods(booking.booking_date):
+                    row = counters.setdefault(period, [0, 0, 0, 0, 0])
+                    row[0] += 1
+                    row[1] += bool(self._is_paid_active(booking))
+                    row[2] += booking.status == 'completed'
+                    row[3] += bool(booking.deposit_paid)
+                    row[4] += bool(booking.final_paid)
+        return {period: BookingCounters(period, *row) for period, row in counters.items()}
+
+    def get_counters(self, period='all'):
+        return self._count().get(period) or BookingCounters(period, 0, 0, 0, 0, 0)
+
+    def get_stats(self):
+        counters = self.get_counters()
+        return {
+            'total_bookings': counters.total,
+            'active_bookings': counters.active_paid,
+            'completed_bookings': counters.completed,
+            'paid_deposit': counters.deposit_paid,
+            'paid_final': counters.final_paid,
+            'work_days': len(self._tables['work_days']),
+        }
+
+    def get_stats_by_period(self, kind='month', limit=6):
+        if kind not in ('month', 'week'):
+            raise ValueError(f"Неизвестный тип периода: {kind}")
+        rows = [counters for period, counters in self._count().items()
+                if period.startswith(f'{kind}:') and counters.total > 0]
+        rows.sort(key=lambda counters: counters.period, reverse=True)
+        return rows[:limit]
+
+    def archive_closed_records(self, older_than_days=None):
+        if older_than_days is None:
+            older_than_days = config.ARCHIVE_AFTER_DAYS
+        cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+
+        with self.transaction():
+            closed_bookings = [
+                booking for booking in self._tables['bookings'].values()
+                if booking.booking_date < cutoff
+                and (booking.status == 'cancelled'
+                     or (booking.status == 'completed' and booking.final_paid)
+                     or not booking.deposit_paid)]
+            for booking in closed_bookings:
+                self._pop('bookings', booking.id)
+                self._put('bookings_archive', booking.id, booking)
+
+            closed_payments = [
+                payment for payment in self._tables['payments'].values()
+                if payment.created_at < cutoff
+                and payment.status in ('succeeded', 'canceled', 'failed', 'refunded')]
+            for payment in closed_payments:
+                self._pop('payments', payment.payment_id)
+                self._put('payments_archive', payment.payment_id, payment)
+
+            sent_events = [event for event in self._tables['sheets_outbox'].values()
+                           if event.sent_at is not None and event.sent_at < cutoff]
+            for event in sent_events:
+                self._pop('sheets_outbox', event.id)
+
+        if closed_bookings or closed_payments:
+            logger.info(f"В архив перенесено бронирований: {len(closed_bookings)}, "
+                        f"платежей: {len(closed_payments)}")
+        if sent_events:
+            logger.info(f"Удалено доставленных событий для Google Sheets: {len(sent_events)}")
+        return len(closed_bookings), len(closed_payments)
+
+    # Исходящие события для Google Sheets
+
+    def add_outbox_event(self, operation, user_id, booking_date, payload=None):
+        with self._lock:
+            key = outbox_key(operation, user_id, booking_date, payload)
+            if key in self._outbox_keys:
+                return False
+            event_id = self._new_id('sheets_outbox')
+            now = _now()
+            self._put('sheets_outbox', event_id, OutboxEvent(
+                event_id, key, operation, user_id, booking_date,
+                json.dumps(payload or {}, ensure_ascii=False), 0, now, None, now, None))
+            return True
+
+    def get_due_outbox_events(self, limit=50):
+        now = _now()
+        pending = sorted((event for event in self._tables['sheets_outbox'].values() if event.sent_at is None),
+                         key=lambda event: event.id)
+        events, seen = [], set()
+        for event in pending:
+            booking = (event.user_id, event.booking_date)
+            if booking not in seen and event.next_attempt_at <= now:
+                events.append(event)
+            seen.add(booking)
+        events.sort(key=lambda event: (event.next_attempt_at, event.id))
+        return events[:limit]
+
+    def complete_outbox_event(self, event_id, sheet_row=None):
+        with self.transaction():
+            event = self._tables['sheets_outbox'].get(event_id)
+            if event is None:
+                return
+            self._put('sheets_outbox', event_id, replace(event, sent_at=_now(), last_error=None))
+            if sheet_row:
+                self.set_sheet_row(event.user_id, event.booking_date, sheet_row)
+
+    def retry_outbox_event(self, event_id, error, delay_seconds):
+        with self._lock:
+            event = self._tables['sheets_outbox'].get(event_id)
+            if event is not None:
+                self._put('sheets_outbox', event_id, replace(
+                    event, attempts=event.attempts + 1, last_error=str(error),
+                    next_attempt_at=_now(int(delay_seconds))))
+
+    def get_pending_outbox_bookings(self):
+        return {(event.user_id, event.booking_date) for event in self._tables['sheets_outbox'].values()
+                if event.sent_at is None}
+
+    def get_outbox_stats(self):
+        pending = sorted((event for event in self._tables['sheets_outbox'].values() if event.sent_at is None),
+                         key=lambda event: event.id)
+        errors = [event.last_error for event in pending if event.last_error is not None]
+        return {'pending': len(pending),
+                'failing': sum(1 for event in pending if event.attempts > 0),
+                'oldest': min((event.created_at for event in pending), default=None),
+                'last_error': errors[-1] if errors else None}
+
+    # Рабочие дни
+
+    def get_availability(self, year=None, month=None):
+        with self._lock:
+            if self._availability is None:
+                self._availability = AvailabilityIndex.load(self.get_available_work_days(),
+                                                            self.get_booked_dates())
+            return self._availability.snapshot(year, month)
+
+    def _refresh_availability(self, *dates):
+        if self._availability is None:
+            return
+        for date_iso in dates:
+            self._availability.set_work_day(date_iso, self.is_work_day(date_iso))
+            self._availability.set_booked(date_iso, not self.is_date_available(date_iso))
+
+    def add_work_day(self, work_date):
+        self.add_work_days([work_date])
+        logger.info(f"Добавлен рабочий день: {work_date}")
+        return True
+
+    def add_work_days(self, dates):
+        with self.transaction():
+            added = 0
+            for work_date in dates:
+                if work_date not in self._tables['work_days']:
+                    self._put('work_days', work_date, WorkDay(self._new_id('work_days'), work_date, True, _now()))
+                    added += 1
+            self._refresh_availability(*dates)
+        return added
+
+    def remove_work_day(self, work_date):
+        with self._lock:
+            if not self.is_date_available(work_date):
+                return False, "На эту дату есть активные бронирования"
+            self._pop('work_days', work_date)
+            self._refresh_availability(work_date)
+        logger.info(f"Удален рабочий день: {work_date}")
+        return True, "Рабочий день удален"
+
+    def get_available_work_days(self):
+        return sorted(work_date for work_date, work_day in self._tables['work_days'].items()
+                      if work_day.is_available)
+
+    def get_work_day(self, work_date):
+        return self._tables['work_days'].get(work_date)
+
+    def get_all_work_days(self):
+        return sorted(self._tables['work_days'])
+
+    def is_work_day(self, date_str):
+        work_day = self._tables['work_days'].get(date_str)
+        return work_day is not None and bool(work_day.is_available)
+
+    def get_setting(self, key, default=None):
+        return self._tables['settings'].get(key, default)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self._put('settings', key, value)
+
+    # Чаты со специалистом
+
+    def start_chat_session(self, user_id, admin_id, booking_date):
+        with self._lock:
+            self._put('active_chats', user_id, ChatSession(
+                self._new_id('active_chats'), user_id, admin_id, booking_date, _now(), True))
+        logger.info(f"Начат чат с пользователем {user_id}")
+        return True
+
+    def end_chat_session(self, user_id):
+        with self._lock:
+            chat = self._tables['active_chats'].get(user_id)
+            if chat is not None:
+                self._put('active_chats', user_id, replace(chat, is_active=False))
+        logger.info(f"Чат с пользователем {user_id} завершен")
+        return True
+
+    def get_active_chat(self, user_id):
+        chat = self._tables['active_chats'].get(user_id)
+        return chat if chat is not None and chat.is_active else None
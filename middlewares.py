@@ -0,0 +1,12 @@
+from aiogram import BaseMiddleware
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Передает общее подключение к базе в хендлеры как аргумент db"""
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    async def __call__(self, handler, event, data):
+        data['db'] = self.manager.database
+        return await handler(event, data)
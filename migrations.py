@@ -0,0 +1,426 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Исходные таблицы бота
+TABLES = [
+    '''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            full_name TEXT,
+            booking_date TEXT,
+            status TEXT DEFAULT 'active',
+            deposit_paid BOOLEAN DEFAULT FALSE,
+            final_paid BOOLEAN DEFAULT FALSE,
+            brief_completed BOOLEAN DEFAULT FALSE,
+            payment_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            payment_id TEXT UNIQUE,
+            amount REAL,
+            payment_type TEXT,
+            status TEXT DEFAULT 'pending',
+            booking_date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS support_chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            full_name TEXT,
+            active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    # Таблица для рабочих дней
+    '''
+        CREATE TABLE IF NOT EXISTS work_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            work_date TEXT UNIQUE,
+            is_available BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS active_chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            admin_id INTEGER,
+            booking_date TEXT,
+            chat_started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (user_id) REFERENCES bookings (user_id)
+        )
+    ''',
+]
+
+# Вторичные индексы под запросы, которые реально выполняет бот
+INDEXES = [
+    # Активные оплаченные бронирования по дате: is_date_available, get_booked_dates, /bookings
+    '''
+        CREATE INDEX IF NOT EXISTS idx_bookings_paid_active_date
+        ON bookings (booking_date) WHERE status = 'active' AND deposit_paid = TRUE
+    ''',
+    # Бронирования на конкретную дату: напоминания, mark_date_as_booked
+    '''
+        CREATE INDEX IF NOT EXISTS idx_bookings_date
+        ON bookings (booking_date)
+    ''',
+    # Бронирования пользователя по дате: get_user_bookings, is_final_paid, обновления статусов
+    '''
+        CREATE INDEX IF NOT EXISTS idx_bookings_user_date
+        ON bookings (user_id, booking_date)
+    ''',
+    # Последнее бронирование пользователя: ORDER BY created_at DESC LIMIT 1
+    '''
+        CREATE INDEX IF NOT EXISTS idx_bookings_user_created
+        ON bookings (user_id, created_at)
+    ''',
+    # Ожидающие платежи, которые опрашиваются каждые 2 минуты
+    '''
+        CREATE INDEX IF NOT EXISTS idx_payments_pending
+        ON payments (created_at) WHERE status = 'pending'
+    ''',
+]
+
+# Временные блокировки дат на время оплаты: одна дата - одна блокировка
+DATE_HOLDS = [
+    '''
+        CREATE TABLE IF NOT EXISTS date_holds (
+            booking_date TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            payment_id TEXT,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS idx_date_holds_expires
+        ON date_holds (expires_at)
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS idx_date_holds_payment
+        ON date_holds (payment_id)
+    ''',
+]
+
+
+def _week(date_expr):
+    """Неделя 'YYYY-Www' по %W (от первого понедельника года), как в миграции 4"""
+    return f"strftime('%Y-W%W', {date_expr})"
+
+
+def _iso_week(date_expr):
+    """Неделя ISO 8601 'YYYY-Www', как date.isocalendar() в Python.
+
+    В SQLite до 3.46 нет %G/%V, а %W считает недели от первого понедельника
+    года. Неделю ISO определяет ее четверг: его год - год недели, а номер
+    недели - номер семидневки этого года, в которую он попал.
+    """
+    thursday = f"date({date_expr}, '-3 days', 'weekday 4')"
+    return (f"strftime('%Y', {thursday}) || '-W' || "
+            f"substr('0' || ((strftime('%j', {thursday}) - 1) / 7 + 1), -2)")
+
+
+def _counter_periods(row, week=_week):
+    """Периоды счетчиков, в которые попадает бронирование: всё время, месяц, неделя"""
+    return ("'all'",
+            f"'month:' || substr({row}.booking_date, 1, 7)",
+            f"'week:' || {week(f'{row}.booking_date')}")
+
+
+def _counter_update(row, sign, week=_week):
+    """UPDATE, прибавляющий (sign='+') или вычитающий (sign='-') вклад строки в счетчики"""
+    return f'''
+            UPDATE booking_counters SET
+                total = total {sign} 1,
+                active_paid = active_paid {sign} IFNULL({row}.status = 'active' AND {row}.deposit_paid = TRUE, 0),
+                completed = completed {sign} IFNULL({row}.status = 'completed', 0),
+                deposit_paid = deposit_paid {sign} IFNULL({row}.deposit_paid = TRUE, 0),
+                final_paid = final_paid {sign} IFNULL({row}.final_paid = TRUE, 0)
+            WHERE period IN ({', '.join(_counter_periods(row, week))});'''
+
+
+def _counter_ensure(row, week=_week):
+    """INSERT, создающий недостающие строки счетчиков для периодов строки"""
+    values = ', '.join(f'({period})' for period in _counter_periods(row, week))
+    return f'''
+            INSERT OR IGNORE INTO booking_counters (period) VALUES {values};'''
+
+
+def _counter_backfill(period_expr, group_by='', source='bookings'):
+    """INSERT, пересчитывающий счетчики по существующим бронированиям"""
+    return f'''
+        INSERT OR REPLACE INTO booking_counters
+            (period, total, active_paid, completed, deposit_paid, final_paid)
+        SELECT {period_expr},
+               COUNT(*),
+               IFNULL(SUM(status = 'active' AND deposit_paid = TRUE), 0),
+               IFNULL(SUM(status = 'completed'), 0),
+               IFNULL(SUM(deposit_paid = TRUE), 0),
+               IFNULL(SUM(final_paid = TRUE), 0)
+        FROM {source} {group_by}
+    '''
+
+
+def _counter_triggers(week=_week):
+    """Триггеры вставки и изменения бронирования, которые ведут счетчики"""
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_counters_insert
+        AFTER INSERT ON bookings
+        BEGIN{_counter_ensure('NEW', week)}{_counter_update('NEW', '+', week)}
+        END
+    ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_counters_update
+        AFTER UPDATE OF booking_date, status, deposit_paid, final_paid ON bookings
+        BEGIN{_counter_update('OLD', '-', week)}{_counter_ensure('NEW', week)}{_counter_update('NEW', '+', week)}
+        END
+    ''',
+    ]
+
+
+def _counter_archived_delete_trigger(week=_week):
+    """Триггер удаления бронирования; перенос в архив счетчики не уменьшает"""
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_counters_delete
+        AFTER DELETE ON bookings
+        WHEN NOT EXISTS (SELECT 1 FROM bookings_archive WHERE id = OLD.id)
+        BEGIN{_counter_update('OLD', '-', week)}
+        END
+    '''
+
+
+# Счетчики для /stats: поддерживаются триггерами в той же транзакции,
+# что и изменение бронирования, поэтому чтение статистики не зависит от объема истории
+BOOKING_COUNTERS = [
+    '''
+        CREATE TABLE IF NOT EXISTS booking_counters (
+            period TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            active_paid INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            deposit_paid INTEGER NOT NULL DEFAULT 0,
+            final_paid INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    *_counter_triggers(),
+    f'''
+        CREATE TRIGGER IF NOT EXISTS trg_booking_counters_delete
+        AFTER DELETE ON bookings
+        BEGIN{_counter_update('OLD', '-')}
+        END
+    ''',
+    'DELETE FROM booking_counters',
+    _counter_backfill("'all'"),
+    _counter_backfill("'month:' || substr(booking_date, 1, 7)", 'GROUP BY 1'),
+    _counter_backfill("'week:' || strftime('%Y-W%W', booking_date)", 'GROUP BY 1'),
+]
+
+# Холодное хранилище: закрытые бронирования и платежи старше config.ARCHIVE_AFTER_DAYS
+# переносятся сюда, чтобы горячие таблицы оставались маленькими.
+# Отчеты читают обе части через представления all_bookings и all_payments
+ARCHIVE = [
+    '''
+        CREATE TABLE IF NOT EXISTS bookings_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            username TEXT,
+            full_name TEXT,
+            booking_date TEXT,
+            status TEXT,
+            deposit_paid BOOLEAN,
+            final_paid BOOLEAN,
+            brief_completed BOOLEAN,
+            payment_id TEXT,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS payments_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            payment_id TEXT UNIQUE,
+            amount REAL,
+            payment_type TEXT,
+            status TEXT,
+            booking_date TEXT,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_bookings_archive_user_created ON bookings_archive(user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_bookings_archive_date ON bookings_archive(booking_date)',
+    '''
+        CREATE VIEW IF NOT EXISTS all_bookings AS
+        SELECT id, user_id, username, full_name, booking_date, status, deposit_paid,
+               final_paid, brief_completed, payment_id, created_at
+        FROM bookings
+        UNION ALL
+        SELECT id, user_id, username, full_name, booking_date, status, deposit_paid,
+               final_paid, brief_completed, payment_id, created_at
+        FROM bookings_archive
+    ''',
+    '''
+        CREATE VIEW IF NOT EXISTS all_payments AS
+        SELECT id, user_id, payment_id, amount, payment_type, status, booking_date, created_at
+        FROM payments
+        UNION ALL
+        SELECT id, user_id, payment_id, amount, payment_type, status, booking_date, created_at
+        FROM payments_archive
+    ''',
+    # Перенос в архив не должен уменьшать счетчики статистики
+    'DROP TRIGGER IF EXISTS trg_booking_counters_delete',
+    _counter_archived_delete_trigger(),
+]
+
+# Служебные настройки приложения (ключ - значение)
+SETTINGS = [
+    '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''',
+]
+
+# Номер строки бронирования в Google Sheets: статус обновляется точечно, без чтения таблицы
+SHEET_ROWS = [
+    'ALTER TABLE bookings ADD COLUMN sheet_row INTEGER',
+    'ALTER TABLE bookings_archive ADD COLUMN sheet_row INTEGER',
+    'DROP VIEW IF EXISTS all_bookings',
+    '''
+        CREATE VIEW all_bookings AS
+        SELECT id, user_id, username, full_name, booking_date, status, deposit_paid,
+               final_paid, brief_completed, payment_id, created_at, sheet_row
+        FROM bookings
+        UNION ALL
+        SELECT id, user_id, username, full_name, booking_date, status, deposit_paid,
+               final_paid, brief_completed, payment_id, created_at, sheet_row
+        FROM bookings_archive
+    ''',
+]
+
+# Исходящие события для Google Sheets (transactional outbox): пишутся в той же
+# транзакции, что и изменение бронирования, и доставляются в таблицу реле
+# SheetsOutboxRelay. Ключ идемпотентности не дает поставить событие дважды
+SHEETS_OUTBOX = [
+    '''
+        CREATE TABLE IF NOT EXISTS sheets_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE NOT NULL,
+            operation TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            booking_date TEXT NOT NULL,
+            payload TEXT,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''',
+    # Реле выбирает только неотправленные события, их всегда немного
+    '''
+        CREATE INDEX IF NOT EXISTS idx_sheets_outbox_pending
+        ON sheets_outbox(next_attempt_at) WHERE sent_at IS NULL
+    ''',
+    # Порядок событий одного бронирования: следующее ждет доставки предыдущего
+    '''
+        CREATE INDEX IF NOT EXISTS idx_sheets_outbox_booking
+        ON sheets_outbox(user_id, booking_date, id) WHERE sent_at IS NULL
+    ''',
+]
+
+# Недели счетчиков по ISO 8601 вместо %W: триггеры миграций 4 и 5 пересоздаются
+# с неделей ISO, недельные счетчики пересчитываются по всем бронированиям, включая архив
+BOOKING_COUNTERS_ISO_WEEKS = [
+    'DROP TRIGGER IF EXISTS trg_booking_counters_insert',
+    'DROP TRIGGER IF EXISTS trg_booking_counters_update',
+    'DROP TRIGGER IF EXISTS trg_booking_counters_delete',
+    *_counter_triggers(_iso_week),
+    _counter_archived_delete_trigger(_iso_week),
+    "DELETE FROM booking_counters WHERE period >= 'week:' AND period < 'week;'",
+    _counter_backfill(f"'week:' || {_iso_week('booking_date')}", 'GROUP BY 1', 'all_bookings'),
+]
+
+# Пронумерованные шаги миграций: (версия, описание, SQL-запросы).
+# Новые изменения схемы добавляются только в конец списка с следующим номером,
+# уже выпущенные шаги не редактируются.
+MIGRATIONS = [
+    (1, "Исходные таблицы", TABLES),
+    (2, "Индексы для горячих запросов", INDEXES),
+    (3, "Блокировки дат на время оплаты", DATE_HOLDS),
+    (4, "Счетчики статистики бронирований", BOOKING_COUNTERS),
+    (5, "Архив закрытых бронирований и платежей", ARCHIVE),
+    (6, "Служебные настройки", SETTINGS),
+    (7, "Номер строки бронирования в Google Sheets", SHEET_ROWS),
+    (8, "Исходящие события для Google Sheets", SHEETS_OUTBOX),
+    (9, "Недели счетчиков по ISO 8601", BOOKING_COUNTERS_ISO_WEEKS),
+]
+
+# Базы, которые уже проверены в этом процессе
+_migrated = set()
+
+
+def get_schema_version(conn):
+    """Возвращает текущую версию схемы базы данных"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+
+
+def migrate(conn, path=None):
+    """Применяет недостающие миграции.
+
+    Выполняется один раз на процесс для каждой базы; если схема актуальна,
+    стоит одного SELECT. Каждая миграция применяется в своей транзакции.
+    """
+    if path is not None and path != ':memory:' and path in _migrated:
+        return 0
+
+    current = get_schema_version(conn)
+    applied = 0
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        try:
+            conn.execute('BEGIN')
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('''
+                INSERT INTO schema_version (version, description) VALUES (?, ?)
+            ''', (version, description))
+            conn.commit()
+            applied += 1
+            logger.info(f"Применена миграция {version}: {description}")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка миграции {version} ({description}): {e}")
+            raise
+
+    if applied:
+        # Обновляем статистику, чтобы планировщик выбирал новые индексы
+        conn.execute('PRAGMA optimize')
+
+    if path is not None:
+        _migrated.add(path)
+    return applied
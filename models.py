@@ -0,0 +1,102 @@
+from dataclasses import dataclass, fields
+
+
+class Row:
+    """Базовый класс записи: строка из базы превращается в объект по позиции.
+
+    Порядок полей совпадает с COLUMNS, поэтому запросы выбирают
+    SELECT {Model.COLUMNS}, а не SELECT * - новые колонки в таблице
+    не ломают чтение.
+    """
+    __slots__ = ()
+
+    COLUMNS = ''
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """row_factory для sqlite3: создает объект из кортежа"""
+        return cls(*row)
+
+
+def _columns(cls):
+    """Заполняет COLUMNS списком полей в порядке объявления"""
+    cls.COLUMNS = ', '.join(f.name for f in fields(cls))
+    return cls
+
+
+@_columns
+@dataclass(slots=True)
+class Booking(Row):
+    id: int
+    user_id: int
+    username: str
+    full_name: str
+    booking_date: str
+    status: str
+    deposit_paid: bool
+    final_paid: bool
+    brief_completed: bool
+    payment_id: str
+    created_at: str
+    sheet_row: int = None
+
+
+@_columns
+@dataclass(slots=True)
+class Payment(Row):
+    id: int
+    user_id: int
+    payment_id: str
+    amount: float
+    payment_type: str
+    status: str
+    booking_date: str
+    created_at: str
+
+
+@_columns
+@dataclass(slots=True)
+class WorkDay(Row):
+    id: int
+    work_date: str
+    is_available: bool
+    created_at: str
+
+
+@_columns
+@dataclass(slots=True)
+class ChatSession(Row):
+    id: int
+    user_id: int
+    admin_id: int
+    booking_date: str
+    chat_started_at: str
+    is_active: bool
+
+
+@_columns
+@dataclass(slots=True)
+class BookingCounters(Row):
+    period: str
+    total: int
+    active_paid: int
+    completed: int
+    deposit_paid: int
+    final_paid: int
+
+
+@_columns
+@dataclass(slots=True)
+class OutboxEvent(Row):
+    id: int
+    idempotency_key: str
+    operation: str
+    user_id: int
+    booking_date: str
+    payload: str
+    attempts: int
+    next_attempt_at: str
+    last_error: str
+    created_at: str
+    sent_at: str
+
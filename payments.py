@@ -1,15 +1,12 @@
 import uuid
-from yookassa import Payment, Configuration
-import config
 import logging
-from database import Database
+from database import db_manager
+from yookassa_client import YooKassaClient
 
 logger = logging.getLogger(__name__)
-db = Database()
 
-# Настройка ЮKassa
-Configuration.account_id = config.YKASSA_SHOP_ID
-Configuration.secret_key = config.YKASSA_SECRET_KEY
+# Клиент ЮKassa: одна сессия с пулом соединений на весь процесс
+yookassa = YooKassaClient()
 
 
 class PaymentManager:
@@ -37,11 +34,12 @@ class PaymentManager:
                 }
             }
 
-            payment = Payment.create(payment_data, idempotence_key)
+            payment = await yookassa.create_payment(payment_data, idempotence_key)
+            db = db_manager.database
 
             # Сохраняем в базу
             if booking_date and not is_final:
-                db.save_payment_info(
+                await db.save_payment_info(
                     user_id=user_id,
                     payment_id=payment.id,
                     amount=amount,
@@ -49,7 +47,7 @@ class PaymentManager:
                     payment_type="deposit"
                 )
             elif is_final:
-                db.save_payment_info(
+                await db.save_payment_info(
                     user_id=user_id,
                     payment_id=payment.id,
                     amount=amount,
@@ -68,12 +66,21 @@ class PaymentManager:
     async def check_payment_status(payment_id):
         """Проверяет статус платежа"""
         try:
-            payment = Payment.find_one(payment_id)
+            payment = await yookassa.find_payment(payment_id)
             return payment.status
         except Exception as e:
             logger.error(f"Ошибка проверки статуса платежа: {e}")
             return None
 
+    @staticmethod
+    async def get_payment(payment_id):
+        """Получает платеж из ЮKassa (со ссылкой на оплату, пока он не оплачен)"""
+        try:
+            return await yookassa.find_payment(payment_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения платежа {payment_id}: {e}")
+            return None
+
     @staticmethod
     async def process_webhook(payment_data):
         """Обрабатывает вебхук от ЮKassa"""
@@ -85,14 +92,15 @@ class PaymentManager:
 
             if status == 'succeeded':
                 # Получаем информацию о платеже из базы
-                payment_info = db.get_payment_info(payment_id)
+                db = db_manager.database
+                payment_info = await db.get_payment_info(payment_id)
 
                 if payment_info:
-                    user_id, amount, payment_type, booking_date = payment_info[0], payment_info[2], payment_info[3], \
-                    payment_info[4]
+                    user_id, amount = payment_info.user_id, payment_info.amount
+                    payment_type, booking_date = payment_info.payment_type, payment_info.booking_date
 
                     # Обновляем статус платежа в базе
-                    db.update_payment_status(payment_id, status)
+                    await db.update_payment_status(payment_id, status)
 
                     logger.info(f"Платеж подтвержден: user_id={user_id}, type={payment_type}, date={booking_date}")
 
@@ -114,8 +122,6 @@ class PaymentManager:
     async def process_refund(payment_id, amount=None):
         """Обрабатывает возврат средств"""
         try:
-            from yookassa import Refund
-
             refund_data = {
                 "payment_id": payment_id,
                 "amount": {
@@ -124,13 +130,18 @@ class PaymentManager:
                 }
             }
 
-            refund = Refund.create(refund_data, str(uuid.uuid4()))
+            refund = await yookassa.create_refund(refund_data, str(uuid.uuid4()))
 
             if refund.status == 'succeeded':
-                db.update_payment_status(payment_id, 'refunded')
+                await db_manager.database.update_payment_status(payment_id, 'refunded')
                 logger.info(f"Возврат успешен: {refund.id}")
                 return True
 
         except Exception as e:
             logger.error(f"Ошибка возврата: {e}")
             return False
+
+    @staticmethod
+    async def close():
+        """Закрывает соединения с ЮKassa"""
+        await yookassa.close()
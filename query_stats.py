@@ -0,0 +1,197 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+import logging
+import re
+import sqlite3
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних замеров хранить на запрос для расчета p99
+SAMPLES_PER_STATEMENT = 1000
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=512)
+def normalize_sql(sql):
+    """Приводит запрос к общему виду: одна строка, литералы заменены на ?"""
+    return _SPACES.sub(' ', _LITERALS.sub('?', sql)).strip()
+
+
+@dataclass(slots=True)
+class StatementStats:
+    sql: str
+    count: int = 0
+    total_time: float = 0.0
+    rows: int = 0
+    samples: deque = field(default_factory=lambda: deque(maxlen=SAMPLES_PER_STATEMENT))
+
+    @property
+    def avg_ms(self):
+        return self.total_time * 1000 / self.count if self.count else 0.0
+
+    @property
+    def p99_ms(self):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[int(0.99 * (len(ordered) - 1))] * 1000
+
+
+class QueryCounter:
+    """Счетчик запросов внутри блока count_queries()"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __repr__(self):
+        return f"QueryCounter(count={self.count})"
+
+
+class QueryStats:
+    """Статистика выполнения SQL по нормализованному тексту запроса.
+
+    Заполняется курсором InstrumentedCursor: число выполнений, суммарное
+    время и p99 (выполнение вместе с выборкой строк), число возвращенных строк.
+    Запросы дольше config.DB_SLOW_QUERY_MS пишутся в лог.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._counters = []
+
+    def record_execute(self, sql, elapsed):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.count += 1
+            stats.total_time += elapsed
+            stats.samples.append(elapsed)
+            for counter in self._counters:
+                counter.count += 1
+                counter.statements.append(key)
+
+    def record_fetch(self, sql, elapsed, rows):
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                return
+            stats.total_time += elapsed
+            stats.rows += rows
+            if stats.samples:
+                stats.samples[-1] += elapsed
+
+    def top(self, limit=10, key='total_time'):
+        """Самые тяжелые запросы: key - total_time, count, rows или p99_ms"""
+        with self._lock:
+            statements = list(self._statements.values())
+        return sorted(statements, key=lambda stats: getattr(stats, key), reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    @contextmanager
+    def count_queries(self):
+        """Считает запросы, выполненные внутри блока (в том числе в потоке базы).
+
+        with query_stats.count_queries() as counter:
+            ...
+        assert counter.count <= 3
+        """
+        counter = QueryCounter()
+        with self._lock:
+            self._counters.append(counter)
+        try:
+            yield counter
+        finally:
+            with self._lock:
+                self._counters.remove(counter)
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время выполнения запросов и выборки строк"""
+
+    _sql = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - started, len(rows))
+        return rows
+
+    def _start(self, sql, elapsed):
+        self._sql = sql
+        self._elapsed = elapsed
+        query_stats.record_execute(sql, elapsed)
+        self._check_slow(0.0)
+
+    def _fetched(self, elapsed, rows):
+        if self._sql is None:
+            return
+        before = self._elapsed
+        self._elapsed += elapsed
+        query_stats.record_fetch(self._sql, elapsed, rows)
+        self._check_slow(before)
+
+    def _check_slow(self, before):
+        # Пишем в лог один раз - в момент, когда запрос перешел порог
+        threshold = config.DB_SLOW_QUERY_MS / 1000
+        if before < threshold <= self._elapsed:
+            logger.warning(f"Медленный запрос ({self._elapsed * 1000:.1f} мс): {normalize_sql(self._sql)}")
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Подключение, все курсоры которого (и conn.execute) инструментированы"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        # Commit учитываем отдельной строкой: в нем запись журнала на диск
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            query_stats.record_execute('COMMIT', time.perf_counter() - started)
@@ -0,0 +1,309 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+import logging
+import time
+from database import db_manager
+from google_sheets import booking_row
+from repository import SHEET_PAYMENT_STATUSES, SHEET_PROJECT_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Статусы оплаты в таблице по порядку: бронирование движется только вперед
+SHEET_STATUSES = ("Предоплата ожидается", SHEET_PAYMENT_STATUSES['deposit'],
+                  SHEET_PAYMENT_STATUSES['final'], SHEET_PROJECT_COMPLETED)
+STATUS_RANKS = {status: rank for rank, status in enumerate(SHEET_STATUSES)}
+
+
+def booking_rank(booking):
+    """Место бронирования из базы в SHEET_STATUSES"""
+    if booking.status == 'completed':
+        return 3
+    if booking.final_paid:
+        return 2
+    if booking.deposit_paid:
+        return 1
+    return 0
+
+
+def rank_changes(rank):
+    """Поля бронирования в базе, соответствующие статусу таблицы с номером rank"""
+    changes = {}
+    if rank >= 1:
+        changes['deposit_paid'] = True
+    if rank >= 2:
+        changes['final_paid'] = True
+    if rank >= 3:
+        changes['status'] = 'completed'
+    return changes
+
+
+def record_key(record):
+    """Ключ строки таблицы (user_id, YYYY-MM-DD); None - если строка не разбирается"""
+    try:
+        user_id = int(str(record.get('ID пользователя', '')).strip())
+        booking_date = datetime.strptime(str(record.get('Дата брони', '')).strip(), "%d.%m.%Y")
+    except ValueError:
+        return None
+    return user_id, booking_date.strftime("%Y-%m-%d")
+
+
+@dataclass
+class ReconciliationReport:
+    """Итог сверки: списки ключей (user_id, дата) по видам расхождений"""
+    dry_run: bool = False
+    db_bookings: int = 0
+    sheet_rows: int = 0
+    matched: int = 0
+    skipped_pending: int = 0
+    appended_to_sheet: list = field(default_factory=list)
+    imported_to_db: list = field(default_factory=list)
+    sheet_statuses: list = field(default_factory=list)  # (ключ, было, стало)
+    db_statuses: list = field(default_factory=list)  # (ключ, было, стало)
+    sheet_rows_fixed: int = 0
+    duplicates: list = field(default_factory=list)
+    unpaid_sheet_only: list = field(default_factory=list)
+    conflicts: list = field(default_factory=list)  # оплачены в таблице, но дата в базе занята другим
+    invalid_rows: list = field(default_factory=list)  # номера строк таблицы
+    errors: list = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def changes(self):
+        """Сколько исправлений внесено (или было бы внесено при dry_run)"""
+        return (len(self.appended_to_sheet) + len(self.imported_to_db) + len(self.sheet_statuses)
+                + len(self.db_statuses) + self.sheet_rows_fixed)
+
+    def summary(self):
+        """Текст отчета для администратора"""
+        def keys(items, limit=10):
+            shown = [f"{item[0]} {item[1]}" if isinstance(item, tuple) else str(item) for item in items[:limit]]
+            return ', '.join(shown) + (' …' if len(items) > limit else '')
+
+        def moves(items, limit=10):
+            return ', '.join(f"{key[0]} {key[1]}: {old} → {new}" for key, old, new in items[:limit])
+
+        lines = [
+            f"🔁 Сверка базы и Google Sheets{' (без изменений, проверка)' if self.dry_run else ''}",
+            f"Бронирований в базе: {self.db_bookings}, строк в таблице: {self.sheet_rows}, совпало: {self.matched}",
+            f"Пропущено (ждут доставки из outbox): {self.skipped_pending}",
+            f"Добавлено в таблицу: {len(self.appended_to_sheet)} {keys(self.appended_to_sheet)}",
+            f"Добавлено в базу: {len(self.imported_to_db)} {keys(self.imported_to_db)}",
+            f"Статусов исправлено в таблице: {len(self.sheet_statuses)} {moves(self.sheet_statuses)}",
+            f"Статусов исправлено в базе: {len(self.db_statuses)} {moves(self.db_statuses)}",
+            f"Номеров строк исправлено в базе: {self.sheet_rows_fixed}",
+        ]
+        if self.duplicates:
+            lines.append(f"⚠️ Дубли строк в таблице: {len(self.duplicates)} {keys(self.duplicates)}")
+        if self.unpaid_sheet_only:
+            lines.append(f"⚠️ Неоплаченные строки только в таблице: {len(self.unpaid_sheet_only)} "
+                         f"{keys(self.unpaid_sheet_only)}")
+        if self.conflicts:
+            lines.append(f"⚠️ Дата уже занята другим клиентом, строка не перенесена в базу: "
+                         f"{len(self.conflicts)} {keys(self.conflicts)}")
+        if self.invalid_rows:
+            lines.append(f"⚠️ Неразборчивые строки таблицы: {len(self.invalid_rows)} {keys(self.invalid_rows)}")
+        for error in self.errors:
+            lines.append(f"❌ {error}")
+        lines.append(f"⏱️ {self.elapsed_ms:.0f} мс")
+        return '\n'.join(lines)
+
+
+@dataclass
+class ReconciliationPlan:
+    """Исправления, собранные diff(): что дописать в таблицу и что поменять в базе"""
+    sheet_rows: list = field(default_factory=list)  # новые строки таблицы
+    sheet_statuses: list = field(default_factory=list)  # (user_id, дата, статус, строка)
+    db_imports: list = field(default_factory=list)  # (user_id, username, full_name, дата, изменения)
+    db_updates: list = field(default_factory=list)  # (user_id, дата, изменения)
+
+    def __bool__(self):
+        return bool(self.sheet_rows or self.sheet_statuses or self.db_imports or self.db_updates)
+
+
+def date_taken(user_id, booking_date, taken, holds):
+    """Занята ли дата другим клиентом: оплаченной бронью (taken) или блокировкой на время оплаты (holds)"""
+    owner = taken.get(booking_date)
+    holder = holds.get(booking_date)
+    return (owner is not None and owner != user_id) or (holder is not None and holder != user_id)
+
+
+def diff(bookings, archived, pending, records, report, holds=None):
+    """Сравнивает базу и снимок таблицы в памяти и возвращает ReconciliationPlan.
+
+    bookings - бронирования из базы, archived - ключи архива (они уже закрыты
+    и не исправляются), pending - ключи с недоставленными событиями outbox:
+    их расхождение временное, реле его само устранит. records - снимок
+    таблицы, строка N таблицы - records[N - 2]. holds - действующие
+    блокировки дат {дата: user_id}: оплаченная строка только из таблицы
+    не переносится в базу, если дата уже занята другим клиентом.
+    """
+    holds = holds or {}
+    plan = ReconciliationPlan()
+
+    # Отмененные бронирования в таблице не нужны; из нескольких записей на ключ берем живую
+    db_index = {}
+    cancelled = set()
+    names = {}
+    for booking in bookings:
+        names.setdefault(booking.user_id, (booking.username, booking.full_name))
+        if booking.status == 'cancelled':
+            cancelled.add((booking.user_id, booking.booking_date))
+            continue
+        db_index[(booking.user_id, booking.booking_date)] = booking
+    report.db_bookings = len(db_index)
+    taken = {}
+    for booking in db_index.values():
+        if booking_rank(booking) >= 1:
+            taken.setdefault(booking.booking_date, booking.user_id)
+
+    sheet_index = {}
+    for row, record in enumerate(records, start=2):
+        key = record_key(record)
+        if key is None:
+            if any(str(value).strip() for value in record.values()):
+                report.invalid_rows.append(row)
+            continue
+        if key in sheet_index:
+            report.duplicates.append(key)
+            continue
+        sheet_index[key] = (row, record)
+    report.sheet_rows = len(records)
+
+    for key, booking in db_index.items():
+        if key in pending:
+            report.skipped_pending += 1
+            continue
+        db_rank = booking_rank(booking)
+        found = sheet_index.get(key)
+        if found is None:
+            user_data = {'user_id': booking.user_id, 'username': booking.username or '',
+                         'full_name': booking.full_name or ''}
+            plan.sheet_rows.append(booking_row(user_data, booking.booking_date, booking.payment_id,
+                                               SHEET_STATUSES[db_rank]))
+            report.appended_to_sheet.append(key)
+            continue
+
+        row, record = found
+        changes = {}
+        if booking.sheet_row != row:
+            changes['sheet_row'] = row
+            report.sheet_rows_fixed += 1
+
+        sheet_status = str(record.get('Статус оплаты', '')).strip()
+        sheet_rank = STATUS_RANKS.get(sheet_status)
+        if sheet_rank is None:
+            # Свой статус администратора не трогаем, но и статус из базы не теряем
+            report.invalid_rows.append(row)
+        elif sheet_rank < db_rank:
+            plan.sheet_statuses.append((booking.user_id, booking.booking_date, SHEET_STATUSES[db_rank], row))
+            report.sheet_statuses.append((key, sheet_status, SHEET_STATUSES[db_rank]))
+        elif sheet_rank > db_rank:
+            changes.update(rank_changes(sheet_rank))
+            report.db_statuses.append((key, SHEET_STATUSES[db_rank], sheet_status))
+        else:
+            report.matched += 1
+
+        if changes:
+            plan.db_updates.append((booking.user_id, booking.booking_date, changes))
+
+    for key, (row, record) in sheet_index.items():
+        if key in db_index or key in cancelled or key in archived or key in pending:
+            continue
+        rank = STATUS_RANKS.get(str(record.get('Статус оплаты', '')).strip(), 0)
+        if rank == 0:
+            # Неоплаченная строка могла быть добавлена вручную - только сообщаем
+            report.unpaid_sheet_only.append(key)
+            continue
+        if date_taken(key[0], key[1], taken, holds):
+            report.conflicts.append(key)
+            continue
+        # Вторая оплаченная строка на ту же дату тоже будет конфликтом
+        taken[key[1]] = key[0]
+        username, full_name = names.get(key[0], ('', ''))
+        plan.db_imports.append((key[0], username, full_name, key[1], {'sheet_row': row, **rank_changes(rank)}))
+        report.imported_to_db.append(key)
+
+    return plan
+
+
+def _apply_sheet(sheets, plan):
+    """Вносит исправления в таблицу одним пакетом (выполняется в потоке Google Sheets)"""
+    for user_id, booking_date, status, row in plan.sheet_statuses:
+        sheets.update_booking_status(user_id, booking_date, status, row)
+    if plan.sheet_rows:
+        sheets.writes.append_rows(plan.sheet_rows)
+    return sheets.writes.flush()
+
+
+def _apply_db(db, plan):
+    """Вносит исправления в базу (выполняется в одной транзакции), возвращает ключи конфликтов.
+
+    Занятость даты проверяется еще раз внутри транзакции: пока шла сверка,
+    дату мог заблокировать или оплатить другой клиент.
+    """
+    conflicts = []
+    holds = db.get_date_holds() if plan.db_imports else {}
+    for user_id, username, full_name, booking_date, changes in plan.db_imports:
+        taken = {booking.booking_date: booking.user_id
+                 for booking in db.get_bookings_between(booking_date, booking_date)
+                 if booking.status != 'cancelled' and booking_rank(booking) >= 1 and booking.user_id != user_id}
+        if date_taken(user_id, booking_date, taken, holds):
+            conflicts.append((user_id, booking_date))
+            continue
+        # Строка уже в таблице - событие для реле не нужно
+        db.import_booking(user_id, username, full_name, booking_date, **changes)
+    for user_id, booking_date, changes in plan.db_updates:
+        db.update_booking(user_id, booking_date, **changes)
+    return conflicts
+
+
+async def reconcile_sheets(worker, dry_run=False):
+    """Сверяет бронирования базы с Google Sheets и исправляет расхождения в обе стороны.
+
+    Обе стороны читаются целиком одним проходом, сравнение идет в памяти
+    по ключу (user_id, дата брони). Статусы только продвигаются вперед -
+    отстающая сторона догоняет другую. dry_run=True только строит отчет.
+    """
+    started = time.perf_counter()
+    report = ReconciliationReport(dry_run=dry_run)
+    sheets = worker.sheets
+    if not sheets.is_connected():
+        report.errors.append("Google Sheets не подключен")
+        return report
+
+    db = db_manager.database
+    try:
+        # База читается раньше таблицы: все, что реле допишет за это время, в таблице уже будет
+        bookings = await db.get_bookings_between()
+        archived = {(booking.user_id, booking.booking_date) for booking in await db.get_archived_bookings()}
+        pending = await db.get_pending_outbox_bookings()
+        holds = await db.get_date_holds()
+        records = await worker.call(sheets.read_all)
+    except Exception as e:
+        logger.error(f"Ошибка чтения данных для сверки с Google Sheets: {e}")
+        report.errors.append(f"чтение: {e}")
+        return report
+
+    plan = diff(bookings, archived, pending, records, report, holds)
+
+    if plan and not dry_run:
+        if plan.sheet_rows or plan.sheet_statuses:
+            try:
+                if not await worker.call(_apply_sheet, sheets, plan):
+                    report.errors.append("исправления не записаны в таблицу, повторим при следующей сверке")
+            except Exception as e:
+                logger.error(f"Ошибка записи исправлений в Google Sheets: {e}")
+                report.errors.append(f"таблица: {e}")
+        if plan.db_imports or plan.db_updates:
+            try:
+                for key in await db.in_transaction(_apply_db, plan):
+                    report.imported_to_db.remove(key)
+                    report.conflicts.append(key)
+            except Exception as e:
+                logger.error(f"Ошибка записи исправлений сверки в базу: {e}")
+                report.errors.append(f"база: {e}")
+
+    report.elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Сверка с Google Sheets: {report.changes} исправлений"
+                f"{' (проверка)' if dry_run else ''} за {report.elapsed_ms:.0f} мс")
+    return report
@@ -1,28 +1,30 @@
 import asyncio
 from datetime import datetime, timedelta
+import html
 import logging
-from database import Database
+from database import db_manager
 import config
 from payments import PaymentManager
+from backup import create_snapshot_async
+from reconciliation import reconcile_sheets
 
 logger = logging.getLogger(__name__)
-db = Database()
 
 
 class ReminderSystem:
-    def __init__(self, gsheets=None):
-        self.gsheets = gsheets
+    def __init__(self, outbox_relay=None):
+        self.outbox_relay = outbox_relay
 
     async def send_booking_reminders(self, bot):
         """Отправляет напоминания о бронированиях"""
         try:
             # Используем локальную базу данных вместо Google Sheets для напоминаний
-            today_bookings = db.get_today_bookings()
+            today_bookings = await db_manager.database.get_today_bookings()
 
             for booking in today_bookings:
-                user_id = booking[1]  # user_id field from database
-                booking_date = booking[4]  # booking_date field
-                final_paid = booking[7]  # final_paid field
+                user_id = booking.user_id
+                booking_date = booking.booking_date
+                final_paid = booking.final_paid
 
                 try:
                     # Если финальная оплата еще не произведена
@@ -53,23 +55,48 @@ class ReminderSystem:
         except Exception as e:
             logger.error(f"Ошибка отправки напоминаний: {e}")
 
+    async def send_brief_reminders(self, bot, days=None):
+        """Напоминает заполнить бриф тем, у кого проект в ближайшие дни"""
+        days = config.BRIEF_REMINDER_DAYS if days is None else days
+        try:
+            # Один запрос по диапазону дат вместо запроса на каждый день
+            upcoming_bookings = await db_manager.database.get_upcoming_bookings(days)
+
+            for booking in upcoming_bookings:
+                date_str = datetime.strptime(booking.booking_date, "%Y-%m-%d").strftime("%d.%m.%Y")
+                try:
+                    await bot.send_message(
+                        booking.user_id,
+                        f"📝 <b>Напоминание о брифе</b>\n\n"
+                        f"Ваш проект запланирован на {date_str}, а бриф еще не заполнен.\n\n"
+                        f"Заполните его, пожалуйста, до назначенной даты:\n{config.BRIEF_FORM_URL}\n\n"
+                        f"<i>Если бриф не будет заполнен до назначенного дня, проект закрывается, "
+                        f"предоплата не возвращается.</i>",
+                        parse_mode="HTML"
+                    )
+                    logger.info(f"Напоминание о брифе отправлено пользователю {booking.user_id}")
+                except Exception as e:
+                    logger.error(f"Ошибка отправки напоминания о брифе пользователю {booking.user_id}: {e}")
+
+            logger.info(f"Отправлены напоминания о брифе для {len(upcoming_bookings)} бронирований")
+
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминаний о брифе: {e}")
+
     async def check_pending_payments(self, bot):
         """Проверяет статусы ожидающих платежей каждые 2 минуты"""
         try:
             logger.info("Проверка статусов ожидающих платежей...")
 
-            # Получаем ожидающие платежи
-            cursor = db.conn.cursor()
-            cursor.execute('''
-                SELECT payment_id, user_id, payment_type, booking_date, amount 
-                FROM payments WHERE status = 'pending'
-            ''')
+            db = db_manager.database
 
-            pending_payments = cursor.fetchall()
+            # Получаем ожидающие платежи
+            pending_payments = await db.get_pending_payments()
             logger.info(f"Найдено {len(pending_payments)} ожидающих платежей")
 
             for payment in pending_payments:
-                payment_id, user_id, payment_type, booking_date, amount = payment
+                payment_id, user_id, payment_type = payment.payment_id, payment.user_id, payment.payment_type
+                booking_date, amount = payment.booking_date, payment.amount
 
                 try:
                     # Проверяем статус в ЮKassa
@@ -77,15 +104,10 @@ class ReminderSystem:
                     logger.info(f"Платеж {payment_id}: статус {status}")
 
                     if status == 'succeeded':
-                        # Обновляем статус платежа
-                        db.update_payment_status(payment_id, status)
-
-                        # Обновляем Google Sheets
-                        if self.gsheets:
-                            if payment_type == 'deposit':
-                                self.gsheets.update_booking_status(user_id, booking_date, "Предоплата получена")
-                            elif payment_type == 'final':
-                                self.gsheets.update_booking_status(user_id, booking_date, "Полная оплата")
+                        # Обновляем статус платежа, Google Sheets обновится из outbox
+                        await db.update_payment_status(payment_id, status)
+                        if self.outbox_relay:
+                            self.outbox_relay.notify()
 
                         # Отправляем уведомление пользователю
                         if payment_type == 'deposit':
@@ -144,7 +166,7 @@ class ReminderSystem:
 
                     elif status in ['canceled', 'failed']:
                         # Обновляем статус отмененного/неудачного платежа
-                        db.update_payment_status(payment_id, status)
+                        await db.update_payment_status(payment_id, status)
                         logger.info(f"Платеж {payment_id} отменен/неудачен")
 
                 except Exception as e:
@@ -154,6 +176,45 @@ class ReminderSystem:
         except Exception as e:
             logger.error(f"Ошибка проверки ожидающих платежей: {e}")
 
+    async def release_expired_holds(self):
+        """Снимает истекшие блокировки дат, чтобы дата снова стала доступна"""
+        try:
+            await db_manager.database.release_expired_holds()
+        except Exception as e:
+            logger.error(f"Ошибка снятия истекших блокировок дат: {e}")
+
+    async def archive_closed_records(self):
+        """Переносит закрытые бронирования и платежи в архив"""
+        try:
+            await db_manager.database.archive_closed_records()
+        except Exception as e:
+            logger.error(f"Ошибка переноса закрытых записей в архив: {e}")
+
+    async def extend_work_days_horizon(self):
+        """Продлевает горизонт рабочих дней, чтобы календарь не заканчивался"""
+        try:
+            await db_manager.database.extend_work_days_horizon()
+        except Exception as e:
+            logger.error(f"Ошибка продления горизонта рабочих дней: {e}")
+
+    async def backup_database(self):
+        """Делает ежедневный снимок базы"""
+        try:
+            await create_snapshot_async()
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования базы: {e}")
+
+    async def reconcile_sheets(self, bot):
+        """Сверяет базу с Google Sheets и присылает отчет админу, если что-то исправлено"""
+        if not self.outbox_relay:
+            return
+        try:
+            report = await reconcile_sheets(self.outbox_relay.worker)
+            if report.changes or report.errors:
+                await bot.send_message(config.ADMIN_ID, html.escape(report.summary()))
+        except Exception as e:
+            logger.error(f"Ошибка сверки с Google Sheets: {e}")
+
     async def start_reminder_scheduler(self, bot):
         """Запускает планировщик напоминаний и проверки платежей"""
         while True:
@@ -162,11 +223,26 @@ class ReminderSystem:
             # Проверяем каждый день в указанное время для напоминаний
             if now.hour == config.REMINDER_HOUR and now.minute == 00:
                 await self.send_booking_reminders(bot)
+                await self.send_brief_reminders(bot)
                 await asyncio.sleep(60)  # Ждем 1 минуту чтобы не запускать повторно
 
+            # Раз в сутки делаем снимок базы
+            if now.hour == config.BACKUP_HOUR and now.minute == 00:
+                await self.backup_database()
+
+            # Раз в сутки переносим закрытые записи в архив и продлеваем календарь
+            if now.hour == config.ARCHIVE_HOUR and now.minute == 00:
+                await self.archive_closed_records()
+                await self.extend_work_days_horizon()
+
+            # Раз в сутки сверяем базу с таблицей
+            if now.hour == config.RECONCILE_HOUR and now.minute == 00:
+                await self.reconcile_sheets(bot)
+
             # Проверяем платежи каждые 2 минуты
             if now.minute % 2 == 0:  # Каждые 2 минуты
                 await self.check_pending_payments(bot)
+                await self.release_expired_holds()
                 await asyncio.sleep(60)  # Ждем 1 минуту
 
             await asyncio.sleep(60)  # Проверяем каждую минуту
\ No newline at end of file
@@ -0,0 +1,393 @@
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+import calendar
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+# Фильтры get_bookings_between: булевы поля и допустимые статусы
+BOOKING_FLAG_FILTERS = ('deposit_paid', 'final_paid', 'brief_completed')
+BOOKING_STATUSES = ('active', 'booked', 'completed', 'cancelled')
+
+# Фильтры get_bookings_between для выборок админки и напоминаний
+ACTIVE_PAID_FILTERS = {'status': 'active', 'deposit_paid': True}
+TODAY_UNPAID_FILTERS = {'deposit_paid': True, 'final_paid': False}
+UPCOMING_NO_BRIEF_FILTERS = {'deposit_paid': True, 'brief_completed': False}
+
+# Поля, которые меняют update_booking и import_booking при сверке с таблицей
+BOOKING_UPDATE_FIELDS = ('deposit_paid', 'final_paid', 'status', 'sheet_row')
+
+# Ключ в settings: до какой даты включительно рабочие дни уже сгенерированы
+WORK_DAYS_GENERATED_UNTIL = 'work_days_generated_until'
+
+# Операции исходящих событий для Google Sheets
+OUTBOX_ADD_BOOKING = 'add_booking'
+OUTBOX_BOOKING_STATUS = 'booking_status'
+
+# Статус в таблице после успешного платежа каждого типа и после завершения проекта
+SHEET_PAYMENT_STATUSES = {'deposit': "Предоплата получена", 'final': "Полная оплата"}
+SHEET_PROJECT_COMPLETED = "Проект завершен"
+
+
+def check_booking_changes(changes):
+    """Проверяет поля для update_booking/import_booking, при ошибке бросает ValueError"""
+    for name, value in changes.items():
+        if name not in BOOKING_UPDATE_FIELDS:
+            raise ValueError(f"Поле бронирования нельзя менять: {name}")
+        if name == 'status' and value not in BOOKING_STATUSES:
+            raise ValueError(f"Неизвестный статус бронирования: {value}")
+
+
+def add_months(day, months):
+    """Первое число месяца, отстоящего от day на months месяцев"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_bounds(year, month):
+    """Первый и последний день месяца"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def generate_work_dates(start, end, weekdays=None):
+    """Даты YYYY-MM-DD с start по end включительно, попадающие в дни недели weekdays
+
+    weekdays - номера дней недели (0=пн), по умолчанию config.WORK_DAYS.
+    Идем сразу по нужным дням недели с шагом в неделю, без перебора всех дат.
+    """
+    weekdays = config.WORK_DAYS if weekdays is None else weekdays
+    dates = []
+    for weekday in set(weekdays):
+        day = start + timedelta(days=(weekday - start.weekday()) % 7)
+        while day <= end:
+            dates.append(day.isoformat())
+            day += timedelta(days=7)
+    dates.sort()
+    return dates
+
+
+def outbox_key(operation, user_id, booking_date, payload=None):
+    """Ключ идемпотентности: одно и то же изменение попадает в outbox один раз"""
+    if operation == OUTBOX_BOOKING_STATUS:
+        return f"{operation}:{user_id}:{booking_date}:{payload['status']}"
+    return f"{operation}:{user_id}:{booking_date}"
+
+
+class BookingRepository(ABC):
+    """Хранилище бронирований, платежей, рабочих дней и чатов.
+
+    Реализации: Database (SQLite, файл или ':memory:') и MemoryDatabase
+    (чистый Python, для тестов и нагрузочных прогонов без диска).
+    Нужная выбирается create_database() по config.DATABASE_BACKEND.
+    Методы, которые выражаются через другие методы, реализованы здесь один раз.
+    """
+
+    # Транзакции
+
+    @abstractmethod
+    def transaction(self):
+        """Контекстный менеджер: все операции внутри фиксируются или откатываются вместе"""
+
+    @abstractmethod
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+    def check_query_plans(self):
+        """Проверяет планы горячих запросов; без SQL проверять нечего"""
+        return {}
+
+    # Бронирования и платежи
+
+    @abstractmethod
+    def add_booking(self, user_id, username, full_name, booking_date, payment_id=None):
+        """Добавляет бронирование и событие для таблицы, возвращает id бронирования"""
+
+    @abstractmethod
+    def save_deposit_booking(self, user_id, username, full_name, booking_date, payment_id):
+        """Бронирование под платеж предоплаты, возвращает id бронирования.
+
+        Неоплаченная активная бронь пользователя на эту дату получает новый
+        payment_id; новая бронь (и событие для таблицы) добавляется, только если ее нет
+        """
+
+    @abstractmethod
+    def save_payment_info(self, user_id, payment_id, amount, booking_date, payment_type):
+        """Сохраняет информацию о платеже"""
+
+    @abstractmethod
+    def update_payment_status(self, payment_id, status):
+        """Обновляет статус платежа и связанного бронирования (и ставит событие для таблицы)"""
+
+    @abstractmethod
+    def get_payment_info(self, payment_id):
+        """Получает Payment по id платежа ЮKassa"""
+
+    @abstractmethod
+    def get_pending_payments(self):
+        """Получает ожидающие платежи"""
+
+    @abstractmethod
+    def get_user_bookings(self, user_id):
+        """Получает бронирования пользователя, новые даты первыми"""
+
+    @abstractmethod
+    def is_date_available(self, booking_date):
+        """Проверяет, что на дату нет оплаченного активного бронирования"""
+
+    @abstractmethod
+    def delete_booking(self, user_id, booking_date):
+        """Удаляет бронирование пользователя на дату"""
+
+    @abstractmethod
+    def get_booked_dates(self):
+        """Даты активных бронирований с предоплатой (YYYY-MM-DD)"""
+
+    @abstractmethod
+    def get_bookings_between(self, start=None, end=None, **filters):
+        """Бронирования с датой в диапазоне [start, end] с фильтрами по полям"""
+
+    def get_active_paid_bookings(self, start=None, end=None):
+        """Получает активные бронирования с предоплатой (для админки)"""
+        return self.get_bookings_between(start, end, **ACTIVE_PAID_FILTERS)
+
+    def get_today_bookings(self):
+        """Получает бронирования на сегодня с предоплатой но без финальной оплаты"""
+        today = date.today()
+        return self.get_bookings_between(today, today, **TODAY_UNPAID_FILTERS)
+
+    def get_upcoming_bookings(self, days=7):
+        """Получает предстоящие бронирования с предоплатой и незаполненным брифом"""
+        today = date.today()
+        return self.get_bookings_between(today, today + timedelta(days=days), **UPCOMING_NO_BRIEF_FILTERS)
+
+    @abstractmethod
+    def get_project_status(self, user_id):
+        """Последнее бронирование пользователя (с учетом архива)"""
+
+    @abstractmethod
+    def has_completed_project(self, user_id):
+        """Есть ли у пользователя завершенный проект (с учетом архива)"""
+
+    @abstractmethod
+    def is_final_paid(self, user_id, booking_date):
+        """Оплачена ли финальная часть бронирования"""
+
+    @abstractmethod
+    def mark_project_completed(self, user_id, booking_date):
+        """Отмечает проект как завершенный (и ставит событие для таблицы)"""
+
+    @abstractmethod
+    def mark_brief_completed(self, user_id):
+        """Отмечает бриф как заполненный"""
+
+    @abstractmethod
+    def mark_date_as_booked(self, booking_date):
+        """Отмечает оплаченные бронирования на дату статусом booked"""
+
+    @abstractmethod
+    def get_user_booking_date(self, user_id):
+        """Дата последнего оплаченного бронирования пользователя"""
+
+    @abstractmethod
+    def get_user_active_booking(self, user_id):
+        """Последнее активное бронирование пользователя"""
+
+    @abstractmethod
+    def set_sheet_row(self, user_id, booking_date, sheet_row):
+        """Сохраняет номер строки бронирования в Google Sheets"""
+
+    @abstractmethod
+    def get_sheet_row(self, user_id, booking_date):
+        """Номер строки бронирования в Google Sheets или None"""
+
+    @abstractmethod
+    def get_all_user_bookings(self, user_id):
+        """Все бронирования пользователя, включая архив"""
+
+    @abstractmethod
+    def get_archived_bookings(self):
+        """Все бронирования из архива"""
+
+    @abstractmethod
+    def update_booking(self, user_id, booking_date, **changes):
+        """Меняет поля BOOKING_UPDATE_FIELDS бронирования без событий для таблицы"""
+
+    @abstractmethod
+    def import_booking(self, user_id, username, full_name, booking_date, **changes):
+        """Добавляет бронирование, которое уже есть в таблице: без события outbox"""
+
+    # Блокировки дат на время оплаты
+
+    @abstractmethod
+    def hold_date(self, booking_date, user_id, ttl_minutes=None):
+        """Атомарно занимает дату на время оплаты"""
+
+    @abstractmethod
+    def attach_payment_to_hold(self, booking_date, user_id, payment_id):
+        """Привязывает платеж к блокировке даты"""
+
+    @abstractmethod
+    def get_hold_payment(self, booking_date, user_id):
+        """Ожидающий оплаты платеж блокировки пользователя или None"""
+
+    @abstractmethod
+    def release_hold(self, booking_date, user_id):
+        """Снимает блокировку даты пользователя"""
+
+    @abstractmethod
+    def release_expired_holds(self):
+        """Снимает истекшие блокировки и возвращает освобожденные даты"""
+
+    @abstractmethod
+    def get_date_holds(self):
+        """Действующие блокировки: {booking_date: user_id}"""
+
+    # Исходящие события для Google Sheets
+
+    @abstractmethod
+    def add_outbox_event(self, operation, user_id, booking_date, payload=None):
+        """Ставит событие в outbox; повтор с тем же ключом игнорируется. True - если добавлено"""
+
+    @abstractmethod
+    def get_due_outbox_events(self, limit=50):
+        """Неотправленные события, время попытки которых подошло, в порядке появления"""
+
+    @abstractmethod
+    def complete_outbox_event(self, event_id, sheet_row=None):
+        """Отмечает событие доставленным; sheet_row сохраняется в бронировании"""
+
+    @abstractmethod
+    def retry_outbox_event(self, event_id, error, delay_seconds):
+        """Откладывает событие на delay_seconds секунд после ошибки доставки"""
+
+    @abstractmethod
+    def get_pending_outbox_bookings(self):
+        """Множество (user_id, booking_date) бронирований с недоставленными событиями"""
+
+    @abstractmethod
+    def get_outbox_stats(self):
+        """Очередь outbox для /sheets: pending, failing, oldest, last_error"""
+
+    # Статистика и архив
+
+    @abstractmethod
+    def get_counters(self, period='all'):
+        """Счетчики бронирований за период"""
+
+    @abstractmethod
+    def get_stats(self):
+        """Сводная статистика для /stats"""
+
+    @abstractmethod
+    def get_stats_by_period(self, kind='month', limit=6):
+        """Счетчики по последним месяцам или неделям"""
+
+    @abstractmethod
+    def archive_closed_records(self, older_than_days=None):
+        """Переносит закрытые записи в архив и удаляет доставленные события outbox"""
+
+    # Рабочие дни
+
+    @abstractmethod
+    def get_availability(self, year=None, month=None):
+        """Неизменяемый снимок индекса доступности (AvailabilityIndex): весь или за месяц"""
+
+    @abstractmethod
+    def add_work_day(self, work_date):
+        """Добавляет рабочий день"""
+
+    @abstractmethod
+    def add_work_days(self, dates):
+        """Добавляет рабочие дни списком, возвращает число новых"""
+
+    def add_work_days_range(self, start, end, weekdays=None):
+        """Добавляет рабочие дни с start по end включительно по маске дней недели"""
+        return self.add_work_days(generate_work_dates(start, end, weekdays))
+
+    def add_work_days_for_month(self, year, month):
+        """Добавляет все рабочие дни для указанного месяца, возвращает число новых"""
+        try:
+            dates = generate_work_dates(*month_bounds(year, month))
+            added = self.add_work_days(dates)
+            logger.info(f"Добавлено {added} из {len(dates)} рабочих дней для {year}-{month:02d}")
+            return added
+        except Exception as e:
+            logger.error(f"Ошибка добавления рабочих дней для месяца {year}-{month:02d}: {e}")
+            return 0
+
+    @abstractmethod
+    def remove_work_day(self, work_date):
+        """Удаляет рабочий день, если на него нет оплаченных бронирований"""
+
+    @abstractmethod
+    def get_available_work_days(self):
+        """Доступные рабочие дни по возрастанию"""
+
+    @abstractmethod
+    def get_work_day(self, work_date):
+        """WorkDay со всеми полями"""
+
+    @abstractmethod
+    def get_all_work_days(self):
+        """Все рабочие дни по возрастанию"""
+
+    @abstractmethod
+    def is_work_day(self, date_str):
+        """Является ли день доступным рабочим"""
+
+    @abstractmethod
+    def get_setting(self, key, default=None):
+        """Читает служебную настройку"""
+
+    @abstractmethod
+    def set_setting(self, key, value):
+        """Сохраняет служебную настройку"""
+
+    def extend_work_days_horizon(self, months=None):
+        """Догенерирует рабочие дни до конца месяца, отстоящего на months месяцев
+
+        Граница уже сгенерированного хранится в settings, поэтому дни,
+        удаленные админом вручную, повторно не добавляются. Для базы без
+        этой отметки границей считается последний существующий рабочий день.
+        Возвращает количество добавленных дней.
+        """
+        months = config.MONTHS_TO_SHOW if months is None else months
+        today = date.today()
+        horizon = add_months(today, months) - timedelta(days=1)
+
+        with self.transaction():
+            generated_until = self.get_setting(WORK_DAYS_GENERATED_UNTIL)
+            if generated_until is None:
+                work_days = self.get_all_work_days()
+                generated_until = work_days[-1] if work_days else None
+
+            start = today
+            if generated_until:
+                start = max(start, date.fromisoformat(generated_until) + timedelta(days=1))
+            if start > horizon:
+                return 0
+
+            added = self.add_work_days_range(start, horizon)
+            self.set_setting(WORK_DAYS_GENERATED_UNTIL, horizon.isoformat())
+
+        logger.info(f"Добавлено {added} рабочих дней, горизонт продлен до {horizon}")
+        return added
+
+    # Чаты со специалистом
+
+    @abstractmethod
+    def start_chat_session(self, user_id, admin_id, booking_date):
+        """Начинает сессию чата"""
+
+    @abstractmethod
+    def end_chat_session(self, user_id):
+        """Завершает сессию чата"""
+
+    @abstractmethod
+    def get_active_chat(self, user_id):
+        """Активный чат пользователя (ChatSession)"""
+
+    def is_chat_active(self, user_id):
+        """Проверяет, активен ли чат с пользователем"""
+        return self.get_active_chat(user_id) is not None
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime
+import json
+import logging
+import config
+from database import db_manager
+from repository import OUTBOX_ADD_BOOKING, OUTBOX_BOOKING_STATUS
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: удваивается с каждой ошибкой, но не больше SHEETS_OUTBOX_RETRY_MAX"""
+    return min(config.SHEETS_OUTBOX_RETRY_BASE * 2 ** attempts, config.SHEETS_OUTBOX_RETRY_MAX)
+
+
+class SheetsOutboxRelay:
+    """Доставляет события из outbox базы в Google Sheets.
+
+    База - источник правды: хендлер записывает изменение бронирования и
+    событие для таблицы одной транзакцией и Google не ждет. Реле по порядку
+    выполняет подошедшие события через SheetsWorker и отмечает их
+    доставленными только после того, как изменения записаны в таблицу.
+    Ошибка откладывает событие с экспоненциальной задержкой, события не
+    теряются и не выбрасываются. Повтор безопасен: статус просто
+    записывается еще раз, а строка перед добавлением ищется в таблице.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.sheets = worker.sheets
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.stats = {'delivered': 0, 'retried': 0, 'last_run_at': None}
+
+    def start(self):
+        """Запускает доставку событий (вызывать из работающего event loop)"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("Доставка событий в Google Sheets запущена")
+
+    def notify(self):
+        """Будит реле сразу после записи нового события, не дожидаясь интервала"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                # Пока события есть, идем без паузы; отложенные после ошибки не выбираются
+                while not self._stopping and await self.relay_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Ошибка доставки событий в Google Sheets: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), config.SHEETS_OUTBOX_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def relay_once(self):
+        """Один проход по outbox, возвращает количество обработанных событий"""
+        if not self.sheets.is_connected():
+            # Без подключения попытки не тратим - события дождутся переподключения
+            return 0
+        db = db_manager.database
+        events = await db.get_due_outbox_events(config.SHEETS_OUTBOX_BATCH)
+        self.stats['last_run_at'] = datetime.now()
+        if not events:
+            return 0
+
+        applied = []
+        for event in events:
+            try:
+                sheet_row = await db.get_sheet_row(event.user_id, event.booking_date)
+                applied.append((event, await self.worker.call(self._apply, event, sheet_row)))
+            except Exception as e:
+                await self._retry(event, e)
+
+        if applied:
+            # Изменения статусов лежат в очереди записи - событие доставлено, когда она записана
+            try:
+                flushed = await self.worker.call(self.sheets.writes.flush)
+            except Exception as e:
+                logger.error(f"Ошибка записи изменений в Google Sheets: {e}")
+                flushed = False
+
+            for event, sheet_row in applied:
+                if flushed:
+                    await db.complete_outbox_event(event.id, sheet_row)
+                    self.stats['delivered'] += 1
+                else:
+                    await self._retry(event, "изменения не записаны в таблицу")
+
+        return len(events)
+
+    async def _retry(self, event, error):
+        error = str(error) or type(error).__name__
+        delay = retry_delay(event.attempts)
+        self.stats['retried'] += 1
+        logger.warning(f"Событие {event.idempotency_key} не доставлено (попытка {event.attempts + 1}), "
+                       f"повтор через {delay} с: {error}")
+        await db_manager.database.retry_outbox_event(event.id, error, delay)
+
+    def _apply(self, event, sheet_row):
+        """Выполняет событие в потоке Google Sheets и возвращает номер строки бронирования"""
+        if not self.sheets.is_connected():
+            raise ConnectionError("Google Sheets не подключен")
+        payload = json.loads(event.payload or '{}')
+
+        if event.operation == OUTBOX_ADD_BOOKING:
+            if event.attempts:
+                # Прошлая попытка могла дойти до Google - ищем строку в перечитанной таблице
+                self.sheets.invalidate_cache()
+            row_index = sheet_row or self.sheets.find_row(event.user_id, event.booking_date)
+            if row_index:
+                return row_index
+            user_data = {
+                'user_id': event.user_id,
+                'username': payload.get('username'),
+                'full_name': payload.get('full_name'),
+            }
+            row_index = self.sheets.add_booking(user_data, datetime.strptime(event.booking_date, "%Y-%m-%d"),
+                                                payload.get('payment_id'))
+            if row_index is None:
+                raise RuntimeError("строка не добавлена")
+            return row_index
+
+        if event.operation == OUTBOX_BOOKING_STATUS:
+            if not self.sheets.update_booking_status(event.user_id, event.booking_date,
+                                                     payload['status'], sheet_row):
+                raise LookupError("строка бронирования не найдена")
+            return sheet_row
+
+        raise ValueError(f"Неизвестная операция outbox: {event.operation}")
+
+    async def stop(self):
+        """Дожидается текущего прохода и останавливает реле; недоставленное остается в базе"""
+        if self._task is not None:
+            self._stopping = True
+            self.notify()
+            await self._task
+            self._task = None
+            logger.info("Доставка событий в Google Sheets остановлена")
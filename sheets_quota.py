@@ -0,0 +1,142 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов к Google Sheets: меньше - раньше
+PRIORITY_WRITE = 0  # запись изменений и доставка событий outbox
+PRIORITY_READ = 1  # обновление снимка таблицы
+PRIORITY_STOP = 9  # сигнал остановки обработчика - после всех команд
+
+# HTTP-статусы, после которых запрос стоит повторить
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _status_code(error):
+    """HTTP-статус ошибки gspread (APIError хранит ответ в response)"""
+    return getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def is_retryable(error):
+    """Превышение квоты, ошибка сервера Google или сетевая ошибка"""
+    # Ошибки requests наследуют OSError, как и встроенные ConnectionError/TimeoutError
+    return _status_code(error) in RETRY_STATUSES or isinstance(error, OSError)
+
+
+def retry_delay(attempt):
+    """Пауза перед повтором: случайная от 0 до удваивающегося предела (full jitter)"""
+    return random.uniform(0, min(config.SHEETS_RETRY_MAX_DELAY, config.SHEETS_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class TokenBucket:
+    """Ведро токенов с очередью по приоритету.
+
+    Пополняется на per_minute токенов в минуту и вмещает не больше burst.
+    acquire() ждет токен; из нескольких ожидающих потоков первым его
+    получает запрос с меньшим приоритетом, при равном - пришедший раньше.
+    """
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._order = itertools.count()
+        self.metrics = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0}
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, priority=PRIORITY_READ):
+        """Забирает токен, дождавшись его; возвращает время ожидания в секундах"""
+        started = time.monotonic()
+        ticket = (priority, next(self._order))
+        with self._condition:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    if self._waiters[0] != ticket:
+                        # Впереди запрос важнее или раньше - ждем, пока он получит токен
+                        self._condition.wait()
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    else:
+                        self._condition.wait((1 - self.tokens) / self.rate)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+        waited = time.monotonic() - started
+        self.metrics['acquired'] += 1
+        if waited >= 0.001:
+            self.metrics['waited'] += 1
+            self.metrics['wait_seconds'] += waited
+        return waited
+
+    def drain(self):
+        """Обнуляет запас токенов: после 429 Google просит сбавить темп всем"""
+        with self._condition:
+            self._refill(time.monotonic())
+            self.tokens = 0.0
+
+
+class SheetsQuota:
+    """Общий лимит запросов к Sheets API для всех методов GoogleSheets.
+
+    Чтение и запись ограничиваются отдельными ведрами, как и квоты Google
+    (SHEETS_READS_PER_MINUTE, SHEETS_WRITES_PER_MINUTE). Ошибки квоты, сервера
+    и сети повторяются до SHEETS_RETRY_ATTEMPTS раз со случайной растущей паузой.
+    Добавление строк не повторяется: если ответ потерялся, а строка дошла,
+    повтор добавил бы ее второй раз.
+    """
+
+    def __init__(self):
+        self.reads = TokenBucket(config.SHEETS_READS_PER_MINUTE, config.SHEETS_QUOTA_BURST)
+        self.writes = TokenBucket(config.SHEETS_WRITES_PER_MINUTE, config.SHEETS_QUOTA_BURST)
+        self.metrics = {'calls': 0, 'retries': 0, 'quota_errors': 0, 'gave_up': 0}
+
+    def read(self, func, *args, priority=PRIORITY_READ, **kwargs):
+        """Выполняет запрос на чтение в пределах квоты"""
+        return self._call(self.reads, priority, True, func, *args, **kwargs)
+
+    def write(self, func, *args, priority=PRIORITY_WRITE, **kwargs):
+        """Выполняет идемпотентную запись (batch_update, update) в пределах квоты"""
+        return self._call(self.writes, priority, True, func, *args, **kwargs)
+
+    def append(self, func, *args, priority=PRIORITY_WRITE, **kwargs):
+        """Добавляет строки в пределах квоты, без повторов: ошибку разбирает вызывающий"""
+        return self._call(self.writes, priority, False, func, *args, **kwargs)
+
+    def _call(self, bucket, priority, retry, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            bucket.acquire(priority)
+            self.metrics['calls'] += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if _status_code(e) == 429:
+                    self.metrics['quota_errors'] += 1
+                    bucket.drain()
+                if not retry or attempt >= config.SHEETS_RETRY_ATTEMPTS:
+                    self.metrics['gave_up'] += 1
+                    raise
+                delay = retry_delay(attempt)
+                attempt += 1
+                self.metrics['retries'] += 1
+                logger.warning(f"Google Sheets {getattr(func, '__name__', func)}: {e}, "
+                               f"повтор {attempt} через {delay:.1f} с")
+                time.sleep(delay)
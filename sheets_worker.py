@@ -0,0 +1,231 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
+import itertools
+import logging
+import time
+import config
+from sheets_quota import PRIORITY_READ, PRIORITY_STOP, PRIORITY_WRITE
+
+logger = logging.getLogger(__name__)
+
+
+class SheetsWorker:
+    """Выполняет все обращения к Google Sheets в отдельном потоке.
+
+    gspread синхронный, поэтому хендлеры не вызывают его напрямую: команды
+    кладутся в asyncio-очередь и по одной выполняются в потоке "sheets".
+    Очередь приоритетная: запись идет раньше обновления снимка таблицы.
+    submit() не ждет Google вовсе, call() - для редких вызовов, которым нужен
+    результат. Тот же поток раз в SHEETS_FLUSH_INTERVAL отправляет
+    накопленные изменения очереди записи, так что gspread используется
+    только из одного потока.
+
+    Подключение к таблице тоже идет в этом потоке и в фоне: start() не
+    ждет Google, бот начинает работу сразу. Если подключиться не удалось
+    или подряд упало SHEETS_RECONNECT_AFTER_FAILURES команд, обработчик
+    переподключается с растущей паузой.
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self._queue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets")
+        self._task = None
+        self._connector = None
+        self._disconnected = asyncio.Event()
+        self._failures_in_row = 0
+        self._followups = set()
+        self._refresh_pending = False
+        self.stats = {
+            'processed': 0, 'failed': 0, 'last_error': None,
+            'last_success_at': None, 'last_latency_ms': 0.0, 'max_latency_ms': 0.0,
+            'connects': 0, 'connect_attempts': 0,
+        }
+
+    def start(self):
+        """Запускает обработку команд и подключение (вызывать из работающего event loop)"""
+        if self._task is None:
+            # Запись теперь отправляет этот поток, а не отдельный поток очереди
+            self.sheets.writes.auto_flush = False
+            self._task = asyncio.create_task(self._run())
+            self._connector = asyncio.create_task(self._keep_connected())
+            logger.info("Обработчик Google Sheets запущен")
+
+    def reconnect(self):
+        """Сбрасывает подключение; фоновая задача подключится заново"""
+        self.sheets.disconnect()
+        self._disconnected.set()
+
+    async def _keep_connected(self):
+        """Подключается к таблице и переподключается после потери связи"""
+        loop = asyncio.get_running_loop()
+        delay = config.SHEETS_RECONNECT_MIN
+        while True:
+            self._disconnected.clear()
+            if self.sheets.is_connected():
+                await self._disconnected.wait()
+                continue
+
+            self.stats['connect_attempts'] += 1
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self.sheets.connect)
+            except Exception:
+                logger.warning(f"Повторное подключение к Google Sheets через {delay} с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, config.SHEETS_RECONNECT_MAX)
+                continue
+
+            self.stats['connects'] += 1
+            self._failures_in_row = 0
+            delay = config.SHEETS_RECONNECT_MIN
+            logger.info(f"Подключение к Google Sheets заняло {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    def submit(self, func, *args, on_result=None, priority=PRIORITY_WRITE, **kwargs):
+        """Ставит вызов в очередь и сразу возвращает asyncio.Future с результатом.
+
+        on_result - необязательная корутина-функция, которой передается
+        результат (например, чтобы сохранить номер строки в базе).
+        priority - PRIORITY_WRITE или PRIORITY_READ (выполняется после записей).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._put(priority, functools.partial(func, *args, **kwargs), future, on_result)
+        return future
+
+    def _put(self, priority, func, future, on_result):
+        # Номер по порядку: при равном приоритете команды идут в порядке поступления
+        self._queue.put_nowait((priority, next(self._order), (func, future, on_result)))
+
+    async def call(self, func, *args, timeout=None, priority=PRIORITY_WRITE, **kwargs):
+        """Выполняет вызов через очередь и возвращает его результат"""
+        future = self.submit(func, *args, priority=priority, **kwargs)
+        return await asyncio.wait_for(future, timeout or config.SHEETS_CALL_TIMEOUT)
+
+    async def get_booked_dates(self):
+        """Занятые даты из снимка таблицы, не дожидаясь Google.
+
+        Пока снимок не устарел, ответ берется из памяти. Устаревший снимок
+        отдается как есть, а обновление ставится в очередь один раз.
+        Ждать приходится только самое первое чтение таблицы.
+        """
+        booked_dates, fresh = self.sheets.cached_booked_dates()
+        if fresh:
+            return booked_dates
+
+        if not self.sheets.is_connected():
+            # Чтение встало бы в очередь за подключением - отдаем то, что есть
+            return booked_dates or []
+
+        if booked_dates is None:
+            try:
+                return await self.call(self.sheets.get_booked_dates, priority=PRIORITY_READ)
+            except Exception as e:
+                logger.error(f"Не удалось получить занятые даты из Google Sheets: {e}")
+                return []
+
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.submit(self.sheets.get_booked_dates, priority=PRIORITY_READ).add_done_callback(self._refresh_done)
+        return booked_dates
+
+    def _refresh_done(self, future):
+        self._refresh_pending = False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                _, _, command = await asyncio.wait_for(self._queue.get(), config.SHEETS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                command = None
+
+            if command is None:
+                if len(self.sheets.writes) and self.sheets.is_connected():
+                    await self._flush(loop)
+                continue
+
+            func, future, on_result = command
+            if func is None:
+                # Сигнал остановки от stop()
+                future.set_result(None)
+                return
+
+            await self._execute(loop, func, future, on_result)
+            if len(self.sheets.writes) >= config.SHEETS_FLUSH_BATCH and self.sheets.is_connected():
+                await self._flush(loop)
+
+    async def _flush(self, loop):
+        if await loop.run_in_executor(self._executor, self.sheets.writes.flush):
+            self._failures_in_row = 0
+        else:
+            self._failed()
+
+    def _failed(self):
+        """Считает ошибки подряд: после SHEETS_RECONNECT_AFTER_FAILURES подключение пересоздается"""
+        self._failures_in_row += 1
+        if self._failures_in_row >= config.SHEETS_RECONNECT_AFTER_FAILURES and self.sheets.is_connected():
+            logger.warning(f"{self._failures_in_row} ошибок Google Sheets подряд, переподключаемся")
+            self._failures_in_row = 0
+            self.reconnect()
+
+    async def _execute(self, loop, func, future, on_result):
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self._executor, func)
+        except Exception as e:
+            self.stats['failed'] += 1
+            self.stats['last_error'] = f"{datetime.now():%d.%m %H:%M:%S} {e}"
+            logger.error(f"Ошибка команды Google Sheets {getattr(func, 'func', func).__name__}: {e}")
+            if not future.done():
+                future.set_exception(e)
+            # Исключение уже записано в лог - не даем asyncio ругаться на неполученную ошибку
+            future.exception()
+            self._failed()
+            return
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._failures_in_row = 0
+        self.stats['processed'] += 1
+        self.stats['last_success_at'] = datetime.now()
+        self.stats['last_latency_ms'] = latency_ms
+        self.stats['max_latency_ms'] = max(self.stats['max_latency_ms'], latency_ms)
+        if not future.done():
+            future.set_result(result)
+
+        if on_result is not None:
+            task = asyncio.create_task(on_result(result))
+            self._followups.add(task)
+            task.add_done_callback(self._followups.discard)
+
+    def health(self):
+        """Состояние обработчика для /sheets"""
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'connected': self.sheets.is_connected(),
+            'state': self.sheets.state,
+            'connected_at': self.sheets.connected_at,
+            'last_connect_error': self.sheets.last_connect_error,
+            'queued': self._queue.qsize(),
+            'pending_writes': len(self.sheets.writes),
+            **self.stats,
+        }
+
+    async def stop(self):
+        """Выполняет оставшиеся команды, дописывает изменения и останавливает поток"""
+        if self._connector is not None:
+            self._connector.cancel()
+            self._connector = None
+        if self._task is not None:
+            stopped = asyncio.get_running_loop().create_future()
+            self._put(PRIORITY_STOP, None, stopped, None)
+            await self._task
+            self._task = None
+        if self._followups:
+            await asyncio.gather(*self._followups, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.sheets.close)
+        self._executor.shutdown(wait=True)
+        logger.info("Обработчик Google Sheets остановлен")
+
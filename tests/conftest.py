@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import sheets_quota  # noqa: E402
+from database import create_database  # noqa: E402
+from tests.fakes import FakeYooKassa  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_real_database(tmp_path, monkeypatch):
+    """Тесты никогда не открывают рабочий bookings.db и каталог снимков"""
+    monkeypatch.setattr(config, 'DATABASE_PATH', str(tmp_path / 'bookings.db'))
+    monkeypatch.setattr(config, 'BACKUP_DIR', str(tmp_path / 'backups'))
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def db(request):
+    """Пустое хранилище каждого бэкенда: SQLite в памяти и MemoryDatabase"""
+    database = create_database(request.param, ':memory:')
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def yookassa_server(monkeypatch):
+    """Заглушка API ЮKassa; повторы без пауз, таймаут короче timeout_delay заглушки"""
+    monkeypatch.setattr(config, 'YKASSA_RETRY_BASE_DELAY', 0)
+    monkeypatch.setattr(config, 'YKASSA_TIMEOUT', 0.3)
+    server = FakeYooKassa().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Паузы между повторами записываются, а не выдерживаются; ведра пополняются быстро"""
+    monkeypatch.setattr(config, 'SHEETS_READS_PER_MINUTE', 60000)
+    monkeypatch.setattr(config, 'SHEETS_WRITES_PER_MINUTE', 60000)
+    delays = []
+    monkeypatch.setattr(sheets_quota.time, 'sleep', delays.append)
+    monkeypatch.setattr(sheets_quota.random, 'uniform', lambda low, high: high)
+    return delays
@@ -0,0 +1,232 @@
+"""Заглушки внешних сервисов для тестов: лист gspread, клиент Drive и сервер ЮKassa"""
+import asyncio
+import re
+import threading
+from types import SimpleNamespace
+
+from aiohttp import web
+
+
+class APIError(Exception):
+    """Ошибка API как у gspread: HTTP-статус лежит в response.status_code"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+def _parse_a1(address):
+    match = re.match(r'([A-Z]+)(\d+)', address)
+    col = 0
+    for letter in match.group(1):
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return int(match.group(2)), col
+
+
+class FakeSheet:
+    """Лист gspread поверх списка строк; calls - имена вызванных методов.
+
+    fail - словарь {метод: [исключения]}: очередной вызов метода бросает
+    следующее исключение. Для append_* строка при этом все равно добавляется,
+    если lost_response=True - так выглядит ответ, потерянный по дороге.
+    input_options - value_input_option каждой записи (None - не передан).
+    """
+
+    def __init__(self, headers):
+        self.rows = [list(headers)]
+        self.calls = []
+        self.fail = {}
+        self.lost_response = False
+        self.input_options = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        errors = self.fail.get(name)
+        return errors.pop(0) if errors else None
+
+    def get_all_values(self):
+        error = self._call('get_all_values')
+        if error:
+            raise error
+        return [[str(value) for value in row] for row in self.rows]
+
+    def row_values(self, row, value_render_option=None):
+        error = self._call('row_values')
+        if error:
+            raise error
+        return [str(value) for value in self.rows[row - 1]] if row <= len(self.rows) else []
+
+    def append_row(self, values, value_input_option=None, **kwargs):
+        self.input_options.append(value_input_option)
+        error = self._call('append_row')
+        if error and not self.lost_response:
+            raise error
+        self.rows.append(list(values))
+        if error:
+            raise error
+        n = len(self.rows)
+        return {'updates': {'updatedRange': f"'Sheet1'!A{n}:M{n}"}}
+
+    def append_rows(self, values, value_input_option=None, **kwargs):
+        self.input_options.append(value_input_option)
+        error = self._call('append_rows')
+        if error and not self.lost_response:
+            raise error
+        self.rows.extend(list(row) for row in values)
+        if error:
+            raise error
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        self.input_options.append(value_input_option)
+        error = self._call('batch_update')
+        if error:
+            raise error
+        for item in data:
+            row, col = _parse_a1(item['range'].split(':')[0])
+            for i, value in enumerate(item['values'][0]):
+                self._set(row, col + i, value)
+
+    def batch_get(self, ranges, **kwargs):
+        error = self._call('batch_get')
+        if error:
+            raise error
+        result = []
+        for address in ranges:
+            row, col = _parse_a1(address.split(':')[0])
+            column = []
+            for values in self.rows[row - 1:]:
+                value = values[col - 1] if col - 1 < len(values) else ''
+                column.append([str(value)] if value != '' else [])
+            while column and not column[-1]:
+                column.pop()
+            result.append(column)
+        return result
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        values = self.rows[row - 1]
+        while len(values) < col:
+            values.append('')
+        values[col - 1] = value
+
+
+class FakeClient:
+    """Клиент gspread: modifiedTime файла меняется вместе со строками листа"""
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def request(self, method, url, params=None):
+        modified = str(hash(repr(self.sheet.rows)))
+        return SimpleNamespace(json=lambda: {'modifiedTime': modified})
+
+
+def connected_sheets(sheet=None):
+    """GoogleSheets, подключенный к FakeSheet без обращения к Google"""
+    from google_sheets import GoogleSheets, HEADERS
+
+    sheets = GoogleSheets()
+    sheets.sheet = sheet or FakeSheet(HEADERS)
+    sheets.client = FakeClient(sheets.sheet)
+    sheets.state = 'connected'
+    sheets.writes.auto_flush = False
+    return sheets
+
+
+class FakeYooKassa:
+    """HTTP-заглушка API ЮKassa на 127.0.0.1 в отдельном потоке со своим event loop.
+
+    requests - список (method, path, headers, body) всех принятых запросов,
+    peers - адреса клиентских соединений. fail - очередь ответов перед
+    успешным: HTTP-статус или 'timeout' (ответ позже config.YKASSA_TIMEOUT).
+    Платежи создаются идемпотентно: повтор с тем же Idempotence-Key
+    возвращает уже созданный платеж.
+    """
+
+    def __init__(self, latency=0.0, timeout_delay=1.0):
+        self.latency = latency
+        self.timeout_delay = timeout_delay
+        self.requests = []
+        self.peers = set()
+        self.fail = []
+        self.payments = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner = None
+        self.url = None
+
+    def start(self):
+        self._thread.start()
+        port = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        self.url = f'http://127.0.0.1:{port}/v3'
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/v3/payments', self._create_payment)
+        app.router.add_get('/v3/payments/{payment_id}', self._find_payment)
+        app.router.add_post('/v3/refunds', self._create_refund)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        await self._runner.cleanup()
+        # Обработчики, которые еще ждут (ответ после таймаута клиента), отменяем
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _accept(self, request):
+        """Записывает запрос и возвращает ответ-ошибку из fail, если он есть"""
+        body = await request.json() if request.can_read_body else None
+        self.requests.append((request.method, request.path, dict(request.headers), body))
+        self.peers.add(request.transport.get_extra_info('peername'))
+        await asyncio.sleep(self.latency)
+        if not self.fail:
+            return None, body
+        failure = self.fail.pop(0)
+        if failure == 'timeout':
+            await asyncio.sleep(self.timeout_delay)
+            failure = 503
+        return web.json_response({'type': 'error', 'code': f'http_{failure}'}, status=failure), body
+
+    async def _create_payment(self, request):
+        error, body = await self._accept(request)
+        if error is not None:
+            return error
+        key = request.headers['Idempotence-Key']
+        if key not in self.payments:
+            self.payments[key] = {
+                'id': f'pay-{len(self.payments) + 1}', 'status': 'pending', 'amount': body['amount'],
+                'metadata': body.get('metadata', {}),
+                'confirmation': {'type': 'redirect', 'confirmation_url': f'https://yoomoney.ru/checkout/{key}'},
+            }
+        return web.json_response(self.payments[key])
+
+    async def _find_payment(self, request):
+        error, _ = await self._accept(request)
+        if error is not None:
+            return error
+        payment_id = request.match_info['payment_id']
+        for payment in self.payments.values():
+            if payment['id'] == payment_id:
+                return web.json_response(payment)
+        return web.json_response({'id': payment_id, 'status': 'succeeded'})
+
+    async def _create_refund(self, request):
+        error, body = await self._accept(request)
+        if error is not None:
+            return error
+        return web.json_response({'id': f'refund-{body["payment_id"]}', 'status': 'succeeded',
+                                  'payment_id': body['payment_id'], 'amount': body['amount']})
@@ -0,0 +1,50 @@
+import pytest
+
+from availability import AvailabilityIndex
+from repository import generate_work_dates, month_bounds
+
+
+@pytest.fixture
+def db(db):
+    for day in ('2031-01-05', '2031-01-06', '2031-02-03'):
+        db.add_work_day(day)
+    return db
+
+
+def test_snapshot_is_frozen():
+    index = AvailabilityIndex.load(['2031-01-05'], [])
+    snapshot = index.snapshot()
+
+    with pytest.raises(TypeError):
+        snapshot.set_booked('2031-01-05', True)
+
+
+def test_snapshot_does_not_see_later_writes(db):
+    snapshot = db.get_availability()
+
+    db.add_booking(1, 'u', 'User', '2031-01-05')
+    db.update_booking(1, '2031-01-05', deposit_paid=True)
+    db.add_work_day('2031-03-02')
+
+    assert snapshot.free_days(2031, 1) == [5, 6]
+    assert snapshot.months() == [(2031, 1), (2031, 2)]
+    assert db.get_availability().free_days(2031, 1) == [6]
+    assert db.get_availability().months() == [(2031, 1), (2031, 2), (2031, 3)]
+
+
+def test_month_snapshot_copies_only_that_month(db):
+    snapshot = db.get_availability(2031, 1)
+
+    assert snapshot.work_days(2031, 1) == [5, 6]
+    assert snapshot.months() == [(2031, 1)]
+
+
+def test_add_month_counts_only_new_days(db):
+    dates = generate_work_dates(*month_bounds(2031, 1))
+    existing = {'2031-01-05', '2031-01-06'} & set(dates)
+    db.add_work_day(dates[0])
+    existing.add(dates[0])
+
+    assert db.add_work_days_for_month(2031, 1) == len(dates) - len(existing)
+    assert db.add_work_days_for_month(2031, 1) == 0
+    assert set(dates) <= set(db.get_available_work_days())
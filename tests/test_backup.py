@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+import backup
+import config
+from backup import create_snapshot
+from database import Database
+
+# Дольше этого писатель не должен ждать, пока идет снимок
+MAX_WRITER_STALL_SECONDS = 0.5
+
+
+def test_snapshot_during_concurrent_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BACKUP_STEP_SLEEP', 0.001)
+    path = str(tmp_path / 'bookings.db')
+    db = Database(path)
+    with db.transaction():
+        for i in range(2000):
+            db.add_booking(i, f'user{i}', f'Имя {i}', f'2031-{i % 12 + 1:02d}-{i % 28 + 1:02d}')
+
+    stop = threading.Event()
+    stalls = []
+
+    def write():
+        # Отдельное подключение, как у бота, пока снимок читает файл
+        writer = Database(path)
+        user_id = 100000
+        while not stop.is_set():
+            started = time.perf_counter()
+            writer.add_booking(user_id, 'writer', 'Писатель', '2031-06-15')
+            stalls.append(time.perf_counter() - started)
+            user_id += 1
+        writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        time.sleep(0.05)
+        snapshot = create_snapshot(path, str(tmp_path / 'backups'), keep=3, pages=4)
+        writes_before = len(stalls)
+        time.sleep(0.05)
+    finally:
+        stop.set()
+        thread.join()
+    db.close()
+
+    assert writes_before > 0 and len(stalls) > writes_before
+    assert max(stalls) < MAX_WRITER_STALL_SECONDS
+
+    copy = sqlite3.connect(snapshot)
+    try:
+        assert copy.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        bookings = copy.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+        counted = copy.execute("SELECT total FROM booking_counters WHERE period = 'all'").fetchone()[0]
+        assert counted == bookings >= 2000
+        # Снимок согласован: у каждой брони есть событие outbox из той же транзакции
+        events = copy.execute('SELECT COUNT(*) FROM sheets_outbox').fetchone()[0]
+        assert events == bookings
+    finally:
+        copy.close()
+
+
+def test_snapshot_pauses_between_steps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'bookings.db')
+    db = Database(path)
+    with db.transaction():
+        for i in range(500):
+            db.add_booking(i, f'user{i}', f'Имя {i}', '2031-01-05')
+    db.close()
+    conn = sqlite3.connect(path)
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    conn.close()
+    pauses = []
+    monkeypatch.setattr(backup.time, 'sleep', pauses.append)
+
+    create_snapshot(path, str(tmp_path / 'backups'), pages=4)
+
+    # После каждого шага, кроме последнего
+    assert pauses == [config.BACKUP_STEP_SLEEP] * ((pages + 3) // 4 - 1)
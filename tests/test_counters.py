@@ -0,0 +1,65 @@
+import sqlite3
+
+import migrations
+
+
+def test_week_counters_use_iso_weeks(db):
+    # 30.12.2030 (пн) и 05.01.2031 (вс) - одна неделя ISO 2031-W01; по %W это 2030-W52 и 2031-W00
+    db.add_booking(1, 'u1', 'User 1', '2030-12-30')
+    db.add_booking(2, 'u2', 'User 2', '2031-01-05')
+    db.add_booking(3, 'u3', 'User 3', '2031-01-06')
+
+    assert db.get_counters('week:2031-W01').total == 2
+    assert db.get_counters('week:2031-W02').total == 1
+    assert db.get_counters('week:2031-W00').total == 0
+    assert [counters.period for counters in db.get_stats_by_period('week')] == ['week:2031-W02', 'week:2031-W01']
+
+
+def test_update_changes_iso_week_counter(db):
+    db.add_booking(1, 'u1', 'User 1', '2031-01-05')
+    db.update_booking(1, '2031-01-05', deposit_paid=True)
+
+    week = db.get_counters('week:2031-W01')
+    assert (week.total, week.deposit_paid, week.active_paid) == (1, 1, 1)
+
+
+def test_archiving_keeps_counters(db):
+    # 06.01.2020 - понедельник недели ISO 2020-W02
+    db.add_booking(1, 'u1', 'User 1', '2020-01-06')
+    db.update_booking(1, '2020-01-06', status='cancelled')
+
+    assert db.archive_closed_records()[0] == 1
+    assert db.get_user_bookings(1) == []
+    assert db.get_counters().total == 1
+    assert [(counters.period, counters.total) for counters in db.get_stats_by_period('week')] == [
+        ('week:2020-W02', 1)]
+
+
+def test_migration_recounts_old_week_counters(monkeypatch):
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    all_migrations = migrations.MIGRATIONS
+    # База до миграции 9: недели по %W, одна бронь уже в архиве
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [step for step in all_migrations if step[0] < 9])
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO bookings (user_id, booking_date, status) VALUES (1, '2031-01-05', 'cancelled')")
+    conn.execute("INSERT INTO bookings (user_id, booking_date) VALUES (2, '2031-01-06')")
+    conn.execute('''
+        INSERT INTO bookings_archive (id, user_id, booking_date, status)
+        SELECT id, user_id, booking_date, status FROM bookings WHERE user_id = 1
+    ''')
+    conn.execute('DELETE FROM bookings WHERE user_id = 1')
+    assert conn.execute("SELECT period, total FROM booking_counters WHERE period LIKE 'week:%'").fetchall() == [
+        ('week:2031-W00', 1), ('week:2031-W01', 1)]
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', all_migrations)
+    assert migrations.migrate(conn) == 1
+    assert conn.execute("SELECT period, total FROM booking_counters WHERE period LIKE 'week:%'").fetchall() == [
+        ('week:2031-W01', 1), ('week:2031-W02', 1)]
+    assert conn.execute("SELECT total FROM booking_counters WHERE period = 'all'").fetchone() == (2,)
+
+    # Новые триггеры: перенос в архив счетчики не уменьшает, неделя - ISO
+    conn.execute('INSERT INTO bookings_archive (id, user_id, booking_date) SELECT id, user_id, booking_date FROM bookings')
+    conn.execute('DELETE FROM bookings')
+    conn.execute("INSERT INTO bookings (user_id, booking_date) VALUES (3, '2030-12-30')")
+    assert conn.execute("SELECT period, total FROM booking_counters WHERE period LIKE 'week:%'").fetchall() == [
+        ('week:2031-W01', 2), ('week:2031-W02', 1)]
@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.fixture
+def db(db):
+    db.add_work_day('2031-01-05')
+    return db
+
+
+def test_refreshing_own_hold_keeps_pending_payment(db):
+    assert db.hold_date('2031-01-05', 1)
+    db.save_payment_info(1, 'pay-1', 4000, '2031-01-05', 'deposit')
+    db.attach_payment_to_hold('2031-01-05', 1, 'pay-1')
+
+    # Повторное нажатие "Оплатить" продлевает блокировку, платеж остается
+    assert db.hold_date('2031-01-05', 1)
+    assert db.get_hold_payment('2031-01-05', 1).payment_id == 'pay-1'
+
+
+def test_hold_payment_only_while_pending(db):
+    assert db.hold_date('2031-01-05', 1)
+    db.save_payment_info(1, 'pay-1', 4000, '2031-01-05', 'deposit')
+    db.attach_payment_to_hold('2031-01-05', 1, 'pay-1')
+    db.update_payment_status('pay-1', 'canceled')
+
+    assert db.get_hold_payment('2031-01-05', 1) is None
+
+
+def test_other_user_does_not_see_hold_payment(db):
+    assert db.hold_date('2031-01-05', 1)
+    db.save_payment_info(1, 'pay-1', 4000, '2031-01-05', 'deposit')
+    db.attach_payment_to_hold('2031-01-05', 1, 'pay-1')
+
+    assert not db.hold_date('2031-01-05', 2)
+    assert db.get_hold_payment('2031-01-05', 2) is None
+
+
+def test_new_deposit_payment_reuses_pending_booking(db):
+    assert db.hold_date('2031-01-05', 1)
+    db.save_payment_info(1, 'pay-1', 4000, '2031-01-05', 'deposit')
+    db.attach_payment_to_hold('2031-01-05', 1, 'pay-1')
+    first = db.save_deposit_booking(1, 'u', 'User', '2031-01-05', 'pay-1')
+
+    # Первый платеж отменен - повторное нажатие создает второй для той же брони
+    db.update_payment_status('pay-1', 'canceled')
+    assert db.hold_date('2031-01-05', 1)
+    db.save_payment_info(1, 'pay-2', 4000, '2031-01-05', 'deposit')
+    db.attach_payment_to_hold('2031-01-05', 1, 'pay-2')
+    assert db.save_deposit_booking(1, 'u', 'User', '2031-01-05', 'pay-2') == first
+
+    [booking] = db.get_user_bookings(1)
+    assert booking.payment_id == 'pay-2'
+    assert len(db.get_due_outbox_events()) == 1
+
+    db.update_payment_status('pay-2', 'succeeded')
+    assert db.get_user_bookings(1)[0].deposit_paid
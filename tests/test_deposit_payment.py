@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from database import AsyncDatabase, Database
+
+DATE = '2031-01-05'
+
+
+class FakeCallback:
+    """CallbackQuery с пользователем и сообщением, которое запоминает тексты"""
+
+    def __init__(self, user_id=1):
+        self.from_user = SimpleNamespace(id=user_id, username='u', full_name='User')
+        self.texts = []
+        self.message = SimpleNamespace(edit_text=self._edit_text)
+
+    async def _edit_text(self, text, reply_markup=None):
+        self.texts.append(text)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+
+class FakePayments:
+    """PaymentManager: создает платежи pay-1, pay-2... и сохраняет их в базу, как настоящий"""
+
+    def __init__(self, db):
+        self.db = db
+        self.statuses = {}
+
+    async def create_payment(self, amount, description, user_id, booking_date=None, is_final=False):
+        payment_id = f'pay-{len(self.statuses) + 1}'
+        self.statuses[payment_id] = 'pending'
+        await self.db.save_payment_info(user_id, payment_id, amount, booking_date, 'deposit')
+        return self._payment(payment_id)
+
+    async def get_payment(self, payment_id):
+        return self._payment(payment_id)
+
+    def _payment(self, payment_id):
+        return SimpleNamespace(id=payment_id, status=self.statuses[payment_id], confirmation=SimpleNamespace(
+            confirmation_url=f'https://yoomoney.ru/checkout/{payment_id}'))
+
+
+@pytest.fixture
+def async_db():
+    database = AsyncDatabase(Database(':memory:'))
+    database.db.add_work_day(DATE)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def payments(async_db, monkeypatch):
+    fake = FakePayments(async_db)
+    monkeypatch.setattr(main, 'payment_manager', fake)
+    monkeypatch.setattr(main, 'outbox_relay', SimpleNamespace(notify=lambda: None))
+    return fake
+
+
+def test_repeated_click_shows_same_payment(async_db, payments):
+    callback = FakeCallback()
+
+    asyncio.run(main.start_deposit_payment(callback, async_db, DATE))
+    asyncio.run(main.start_deposit_payment(callback, async_db, DATE))
+
+    assert list(payments.statuses) == ['pay-1']
+    assert all('checkout/pay-1' in text for text in callback.texts)
+    assert len(async_db.db.get_user_bookings(1)) == 1
+
+
+def test_new_payment_after_unusable_one_keeps_single_booking(async_db, payments):
+    callback = FakeCallback()
+    asyncio.run(main.start_deposit_payment(callback, async_db, DATE))
+
+    # Первый платеж ЮKassa отменила - показать его повторно нельзя
+    payments.statuses['pay-1'] = 'canceled'
+    asyncio.run(main.start_deposit_payment(callback, async_db, DATE))
+
+    assert list(payments.statuses) == ['pay-1', 'pay-2']
+    assert 'checkout/pay-2' in callback.texts[-1]
+    [booking] = async_db.db.get_user_bookings(1)
+    assert booking.payment_id == 'pay-2'
+    assert len(async_db.db.get_due_outbox_events()) == 1
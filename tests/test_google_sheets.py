@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from google_sheets import HEADERS, VALUE_INPUT_OPTION
+from tests.fakes import APIError, FakeSheet, connected_sheets
+
+
+def test_every_write_path_uses_raw_input(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.rows.clear()
+    sheets = connected_sheets(sheet)
+
+    sheets._initialize_headers()
+    sheets.add_booking({'user_id': 7, 'username': 'u', 'full_name': 'User'}, datetime(2031, 1, 5))
+    sheets.writes.append_rows([['a'] * len(HEADERS)])
+    sheets.writes.update_cells(2, {7: 'Полная оплата'})
+    assert sheets.writes.flush() is True
+
+    assert sheet.calls.count('append_row') == 2
+    assert sheet.input_options == [VALUE_INPUT_OPTION] * 4
+    assert VALUE_INPUT_OPTION == 'RAW'
+    # Дата осталась строкой в том же виде, в каком ее ищет find_row
+    assert sheet.rows[1][HEADERS.index('Дата брони')] == '05.01.2031'
+
+
+def test_headers_check_reads_only_first_row(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.rows.append(['1', 'user', 'Имя', '05.01.2031'])
+    sheets = connected_sheets(sheet)
+
+    sheets._initialize_headers()
+
+    assert sheet.calls == ['row_values']
+    assert len(sheet.rows) == 2
+
+
+def test_headers_written_to_empty_sheet(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.rows.clear()
+
+    connected_sheets(sheet)._initialize_headers()
+
+    assert sheet.rows == [HEADERS]
+
+
+def test_headers_not_appended_blindly_after_read_error(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.fail['row_values'] = [APIError(400)]
+
+    connected_sheets(sheet)._initialize_headers()
+
+    assert 'append_row' not in sheet.calls
+    assert sheet.rows == [HEADERS]
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from database import AsyncDatabase, Database
+from keyboards import get_admin_days_keyboard, get_days_keyboard, get_months_keyboard
+from query_stats import query_stats
+
+YEAR = date.today().year + 1
+
+
+def seed(db, bookings):
+    """Рабочие дни на год вперед и оплаченные брони на первые из них"""
+    for month in range(1, 13):
+        db.add_work_days_for_month(YEAR, month)
+    for user_id, work_date in enumerate(db.get_available_work_days()[:bookings]):
+        db.add_booking(user_id, f'user{user_id}', f'Имя {user_id}', work_date)
+        db.update_booking(user_id, work_date, deposit_paid=True)
+
+
+@pytest.fixture
+def async_db():
+    database = AsyncDatabase(Database(':memory:'))
+    yield database
+    database.close()
+
+
+def build_calendar(async_db):
+    """Клавиатуры, как их строят хендлеры: месяцы, затем дни каждого месяца"""
+    async def scenario():
+        with query_stats.count_queries() as counter:
+            availability = await async_db.get_availability()
+            get_months_keyboard(availability)
+            for year, month in availability.months():
+                month_key = f'{year}-{month:02d}'
+                get_days_keyboard(month_key, [], await async_db.get_availability(year, month))
+                get_admin_days_keyboard(month_key, await async_db.get_availability(year, month))
+        return counter
+
+    return asyncio.run(scenario())
+
+
+def load_admin_bookings(async_db):
+    """Запросы /bookings: список активных оплаченных броней"""
+    async def scenario():
+        with query_stats.count_queries() as counter:
+            bookings = await async_db.get_active_paid_bookings()
+        return counter, bookings
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize('bookings', [5, 50])
+def test_keyboards_do_not_query_per_day(async_db, bookings):
+    seed(async_db.db, bookings)
+
+    # Первое обращение загружает индекс: рабочие дни и занятые даты
+    assert build_calendar(async_db).count <= 2
+    # Дальше клавиатуры строятся по индексу в памяти без запросов
+    assert build_calendar(async_db).count == 0
+
+
+@pytest.mark.parametrize('bookings', [5, 50])
+def test_admin_booking_list_is_one_query(async_db, bookings):
+    seed(async_db.db, bookings)
+
+    counter, loaded = load_admin_bookings(async_db)
+
+    assert len(loaded) == bookings
+    assert counter.count <= 1, counter.statements
@@ -0,0 +1,67 @@
+import pytest
+
+from database import Database, HOT_QUERIES
+from query_stats import normalize_sql, query_stats
+
+# Индекс, по которому должен идти каждый горячий запрос
+EXPECTED_INDEXES = {
+    'is_date_available': 'idx_bookings_date',
+    'get_booked_dates': 'idx_bookings_paid_active_date',
+    'get_active_paid_bookings': 'idx_bookings_paid_active_date',
+    'get_upcoming_bookings': 'idx_bookings_date',
+    'get_today_bookings': 'idx_bookings_date',
+    'get_user_bookings': 'idx_bookings_user_date',
+    'get_user_booking_date': 'idx_bookings_user_created',
+    'get_pending_payments': 'idx_payments_pending',
+    'get_due_outbox_events': 'idx_sheets_outbox_pending',
+}
+
+# Вызов метода, который выполняет горячий запрос
+HOT_METHOD_CALLS = {
+    'is_date_available': ('2025-01-01',),
+    'get_booked_dates': (),
+    'get_active_paid_bookings': (),
+    'get_upcoming_bookings': (),
+    'get_today_bookings': (),
+    'get_user_bookings': (1,),
+    'get_user_booking_date': (1,),
+    'get_pending_payments': (),
+    'get_due_outbox_events': (),
+}
+
+
+@pytest.fixture(scope='module')
+def db():
+    database = Database(':memory:')
+    yield database
+    database.close()
+
+
+def test_every_hot_query_has_expected_index():
+    assert set(EXPECTED_INDEXES) == set(HOT_QUERIES)
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(db, name):
+    query, params = HOT_QUERIES[name]
+    plan = db.explain(query, params)
+
+    assert any(f'USING INDEX {EXPECTED_INDEXES[name]}' in step
+               or f'USING COVERING INDEX {EXPECTED_INDEXES[name]}' in step for step in plan), plan
+    # Полный просмотр таблицы - SCAN без индекса
+    assert not [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step], plan
+
+
+def test_check_query_plans_finds_no_full_scans(db):
+    assert db.check_query_plans() == {}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_method_executes_checked_query(db, name):
+    query, _ = HOT_QUERIES[name]
+
+    with query_stats.count_queries() as counter:
+        getattr(db, name)(*HOT_METHOD_CALLS[name])
+
+    # Проверяется план того же запроса, который выполняет метод
+    assert normalize_sql(query) in counter.statements
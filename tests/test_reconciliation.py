@@ -0,0 +1,69 @@
+from google_sheets import HEADERS, booking_row
+from reconciliation import ReconciliationReport, _apply_db, diff
+
+
+def sheet_record(user_id, booking_date, status):
+    row = booking_row({'user_id': user_id}, booking_date, None, status)
+    return {name: str(row[HEADERS.index(name)]) for name in ('ID пользователя', 'Дата брони', 'Статус оплаты')}
+
+
+def reconcile(db, records):
+    report = ReconciliationReport()
+    plan = diff(db.get_bookings_between(), set(), db.get_pending_outbox_bookings(), records, report,
+                db.get_date_holds())
+    with db.transaction():
+        conflicts = _apply_db(db, plan)
+    return report, conflicts
+
+
+def test_paid_sheet_row_is_imported_without_outbox_event(db):
+    report, conflicts = reconcile(db, [sheet_record(5, '2031-01-05', 'Предоплата получена')])
+
+    assert report.imported_to_db == [(5, '2031-01-05')] and not conflicts
+    booking, = db.get_bookings_between()
+    assert (booking.user_id, booking.deposit_paid, booking.sheet_row) == (5, True, 2)
+    assert db.get_outbox_stats()['pending'] == 0
+
+
+def test_paid_sheet_row_on_date_paid_by_other_user_is_conflict(db):
+    db.add_booking(1, 'u1', 'User 1', '2031-01-05')
+    db.update_booking(1, '2031-01-05', deposit_paid=True)
+    for event in db.get_due_outbox_events():
+        db.complete_outbox_event(event.id, 2)
+
+    report, _ = reconcile(db, [sheet_record(1, '2031-01-05', 'Предоплата получена'),
+                               sheet_record(5, '2031-01-05', 'Предоплата получена')])
+
+    assert report.conflicts == [(5, '2031-01-05')]
+    assert not report.imported_to_db
+    assert [booking.user_id for booking in db.get_bookings_between()] == [1]
+
+
+def test_paid_sheet_row_on_date_held_by_other_user_is_conflict(db):
+    db.add_work_day('2031-01-05')
+    assert db.hold_date('2031-01-05', 1)
+
+    report, _ = reconcile(db, [sheet_record(5, '2031-01-05', 'Полная оплата')])
+
+    assert report.conflicts == [(5, '2031-01-05')]
+    assert db.get_bookings_between() == []
+
+
+def test_two_paid_sheet_rows_on_one_date_import_only_first(db):
+    report, _ = reconcile(db, [sheet_record(5, '2031-01-05', 'Предоплата получена'),
+                               sheet_record(6, '2031-01-05', 'Предоплата получена')])
+
+    assert report.imported_to_db == [(5, '2031-01-05')]
+    assert report.conflicts == [(6, '2031-01-05')]
+
+
+def test_date_taken_after_diff_is_rechecked_in_transaction(db):
+    report = ReconciliationReport()
+    plan = diff([], set(), set(), [sheet_record(5, '2031-01-05', 'Предоплата получена')], report, {})
+    # Пока шла сверка, дату оплатил другой клиент
+    db.add_booking(1, 'u1', 'User 1', '2031-01-05')
+    db.update_booking(1, '2031-01-05', deposit_paid=True)
+
+    with db.transaction():
+        assert _apply_db(db, plan) == [(5, '2031-01-05')]
+    assert [booking.user_id for booking in db.get_bookings_between()] == [1]
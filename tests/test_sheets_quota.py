@@ -0,0 +1,145 @@
+from datetime import datetime
+import threading
+import time
+
+import pytest
+
+import config
+from tests.fakes import APIError, FakeSheet, connected_sheets
+from google_sheets import HEADERS, SheetWriteQueue
+from sheets_quota import PRIORITY_READ, PRIORITY_WRITE, SheetsQuota, TokenBucket
+
+
+def failing(*errors, result='ok'):
+    """Функция, которая сначала бросает errors по одной, потом возвращает result"""
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    func.calls = calls
+    return func
+
+
+def test_retry_backoff_doubles_up_to_max(sleeps, monkeypatch):
+    monkeypatch.setattr(config, 'SHEETS_RETRY_BASE_DELAY', 1)
+    monkeypatch.setattr(config, 'SHEETS_RETRY_MAX_DELAY', 4)
+    quota = SheetsQuota()
+    func = failing(APIError(429), APIError(503), APIError(500), APIError(502))
+
+    assert quota.read(func) == 'ok'
+    assert sleeps == [1, 2, 4, 4]
+    assert quota.metrics['retries'] == 4
+    assert quota.metrics['quota_errors'] == 1
+
+
+def test_gives_up_after_retry_budget(sleeps, monkeypatch):
+    monkeypatch.setattr(config, 'SHEETS_RETRY_ATTEMPTS', 2)
+    quota = SheetsQuota()
+    func = failing(*[APIError(503)] * 5)
+
+    with pytest.raises(APIError):
+        quota.write(func)
+    assert len(func.calls) == 3
+    assert quota.metrics['gave_up'] == 1
+
+
+def test_client_errors_are_not_retried(sleeps):
+    quota = SheetsQuota()
+    func = failing(APIError(400))
+
+    with pytest.raises(APIError):
+        quota.write(func)
+    assert len(func.calls) == 1
+    assert sleeps == []
+
+
+def test_quota_error_drains_bucket(sleeps):
+    quota = SheetsQuota()
+    quota.read(failing(APIError(429)))
+    assert quota.reads.tokens < 1
+
+
+def test_append_is_not_retried(sleeps):
+    quota = SheetsQuota()
+    func = failing(APIError(503))
+
+    with pytest.raises(APIError):
+        quota.append(func)
+    assert len(func.calls) == 1
+    assert quota.metrics['retries'] == 0
+
+
+def test_bucket_serves_writes_before_earlier_reads():
+    bucket = TokenBucket(per_minute=600, burst=1)
+    bucket.acquire()
+    order = []
+
+    def take(priority, name):
+        bucket.acquire(priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=take, args=(PRIORITY_READ, f'read{i}')) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    # Запись приходит последней, пока чтения ждут токен, но получает его первой
+    writer = threading.Thread(target=take, args=(PRIORITY_WRITE, 'write'))
+    writer.start()
+    for thread in threads + [writer]:
+        thread.join(5)
+
+    assert order[0] == 'write'
+    assert sorted(order[1:]) == ['read0', 'read1', 'read2']
+
+
+def test_bucket_rate_limits_calls():
+    bucket = TokenBucket(per_minute=1200, burst=2)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Два токена из запаса, еще четыре - по 50 мс
+    assert time.monotonic() - started >= 0.18
+    assert bucket.metrics['waited'] >= 3
+
+
+def test_failed_append_row_is_not_duplicated(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.lost_response = True
+    sheet.fail['append_row'] = [APIError(503)]
+    sheets = connected_sheets(sheet)
+    user = {'user_id': 7, 'username': 'u', 'full_name': 'User'}
+
+    assert sheets.add_booking(user, datetime(2031, 1, 5)) is None
+    assert len(sheet.rows) == 2
+    assert sheet.calls.count('append_row') == 1
+
+    # Повтор события outbox перечитывает таблицу и находит строку, а не добавляет вторую
+    sheets.invalidate_cache()
+    assert sheets.find_row(7, '2031-01-05') == 2
+    assert len(sheet.rows) == 2
+
+
+def test_failed_append_rows_is_not_requeued(sleeps):
+    sheet = FakeSheet(HEADERS)
+    sheet.lost_response = True
+    sheet.fail['append_rows'] = [APIError(500)]
+    sheets = connected_sheets(sheet)
+    writes = sheets.writes
+    assert isinstance(writes, SheetWriteQueue)
+
+    writes.append_rows([['a'] * len(HEADERS)])
+    writes.update_cells(2, {7: 'Полная оплата'})
+    assert writes.flush() is False
+    assert len(sheet.rows) == 2
+
+    # Ячейки повторяются, а строка - нет
+    assert len(writes) == 1
+    assert writes.flush() is True
+    assert sheet.calls.count('append_rows') == 1
+    assert len(sheet.rows) == 2
+    assert sheet.rows[1][6] == 'Полная оплата'
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+import time
+
+from google_sheets import GoogleSheets, HEADERS
+from sheets_worker import SheetsWorker
+from tests.fakes import FakeClient, FakeSheet
+
+# Медленное подключение к Google: авторизация и открытие таблицы
+CONNECT_SECONDS = 0.3
+
+
+def slow_sheets():
+    """GoogleSheets, чей connect() занимает CONNECT_SECONDS секунд"""
+    sheets = GoogleSheets()
+    sheet = FakeSheet(HEADERS)
+
+    def connect():
+        sheets.state = 'connecting'
+        time.sleep(CONNECT_SECONDS)
+        sheets.sheet = sheet
+        sheets.client = FakeClient(sheet)
+        sheets.state = 'connected'
+        sheets.connected_at = datetime.now()
+
+    sheets.connect = connect
+    return sheets, sheet
+
+
+async def startup_timings():
+    sheets, sheet = slow_sheets()
+    worker = SheetsWorker(sheets)
+
+    started = time.perf_counter()
+    worker.start()
+    await asyncio.sleep(0)
+    start_seconds = time.perf_counter() - started
+
+    calendar_started = time.perf_counter()
+    booked_dates = await worker.get_booked_dates()
+    calendar_seconds = time.perf_counter() - calendar_started
+
+    # Первое изменение таблицы - как только готово фоновое подключение
+    while not sheets.is_connected():
+        await asyncio.sleep(0.01)
+    row = await worker.call(sheets.add_booking, {'user_id': 7, 'username': 'u', 'full_name': 'User'},
+                            datetime(2031, 1, 5))
+    first_update_seconds = time.perf_counter() - started
+
+    await worker.stop()
+    return start_seconds, calendar_seconds, booked_dates, first_update_seconds, row, sheet
+
+
+def test_startup_does_not_wait_for_google():
+    start_seconds, calendar_seconds, booked_dates, first_update_seconds, row, sheet = asyncio.run(startup_timings())
+
+    assert start_seconds < 0.05
+    # Пока подключения нет, календарь строится по базе, без ожидания таблицы
+    assert calendar_seconds < 0.05
+    assert booked_dates == []
+    assert CONNECT_SECONDS <= first_update_seconds < CONNECT_SECONDS + 1
+    assert row == 2 and len(sheet.rows) == 2
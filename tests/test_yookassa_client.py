@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+import config
+import payments
+from payments import PaymentManager
+from yookassa_client import YooKassaClient, YooKassaError
+
+AMOUNT = {'value': '100.00', 'currency': 'RUB'}
+
+
+def run(server, scenario):
+    """Выполняет scenario(client) с клиентом заглушки и закрывает его сессию"""
+    async def main():
+        client = YooKassaClient(server.url, 'shop', 'secret')
+        try:
+            return await scenario(client), client
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_create_find_and_refund(yookassa_server):
+    async def scenario(client):
+        payment = await client.create_payment({'amount': AMOUNT, 'metadata': {'user_id': 1}})
+        found = await client.find_payment(payment.id)
+        refund = await client.create_refund({'payment_id': payment.id, 'amount': AMOUNT})
+        return payment, found, refund
+
+    (payment, found, refund), _ = run(yookassa_server, scenario)
+
+    assert payment.status == 'pending'
+    assert payment.confirmation.confirmation_url.startswith('https://yoomoney.ru/checkout/')
+    assert found.id == payment.id and found.amount.value == '100.00'
+    assert refund.status == 'succeeded' and refund.payment_id == payment.id
+    assert [(method, path) for method, path, _, _ in yookassa_server.requests] == [
+        ('POST', '/v3/payments'), ('GET', f'/v3/payments/{payment.id}'), ('POST', '/v3/refunds')]
+
+
+def test_idempotence_key_header(yookassa_server):
+    async def scenario(client):
+        await client.create_payment({'amount': AMOUNT}, 'key-1')
+        await client.create_payment({'amount': AMOUNT})
+        await client.find_payment('pay-1')
+
+    run(yookassa_server, scenario)
+
+    (_, _, given, _), (_, _, generated, _), (_, _, get, _) = yookassa_server.requests
+    assert given['Idempotence-Key'] == 'key-1'
+    assert generated['Idempotence-Key'] not in ('', 'key-1')
+    assert 'Idempotence-Key' not in get
+    assert given['Authorization'].startswith('Basic ')
+
+
+@pytest.mark.parametrize('failures', [[503], [500, 502], ['timeout']])
+def test_retries_temporary_errors_with_same_key(yookassa_server, failures):
+    yookassa_server.fail = list(failures)
+
+    payment, client = run(yookassa_server, lambda client: client.create_payment({'amount': AMOUNT}, 'key-1'))
+
+    assert payment.id == 'pay-1'
+    assert client.metrics['retries'] == len(failures)
+    assert len(yookassa_server.requests) == len(failures) + 1
+    # Повтор идет с тем же ключом, второй платеж не создается
+    assert {headers['Idempotence-Key'] for _, _, headers, _ in yookassa_server.requests} == {'key-1'}
+    assert len(yookassa_server.payments) == 1
+
+
+def test_gives_up_after_retry_attempts(yookassa_server):
+    yookassa_server.fail = [503] * (config.YKASSA_RETRY_ATTEMPTS + 1)
+
+    with pytest.raises(YooKassaError) as error:
+        run(yookassa_server, lambda client: client.find_payment('pay-1'))
+
+    assert error.value.status == 503
+    assert len(yookassa_server.requests) == config.YKASSA_RETRY_ATTEMPTS + 1
+
+
+@pytest.mark.parametrize('status', [400, 401, 404])
+def test_does_not_retry_client_errors(yookassa_server, status):
+    yookassa_server.fail = [status]
+
+    with pytest.raises(YooKassaError) as error:
+        run(yookassa_server, lambda client: client.create_payment({'amount': AMOUNT}))
+
+    assert error.value.status == status
+    assert len(yookassa_server.requests) == 1
+
+
+def test_concurrent_requests_share_pool(yookassa_server, monkeypatch):
+    monkeypatch.setattr(config, 'YKASSA_POOL_SIZE', 4)
+    yookassa_server.latency = 0.05
+
+    async def scenario(client):
+        return await asyncio.gather(*(client.find_payment(f'p{i}') for i in range(20)))
+
+    statuses, _ = run(yookassa_server, scenario)
+
+    assert all(payment.status == 'succeeded' for payment in statuses)
+    assert len(yookassa_server.peers) <= 4
+
+
+def test_payment_manager_close_releases_session(yookassa_server, monkeypatch):
+    monkeypatch.setattr(payments, 'yookassa', YooKassaClient(yookassa_server.url, 'shop', 'secret'))
+
+    async def scenario():
+        payment = await PaymentManager.get_payment('pay-1')
+        session = payments.yookassa._session
+        await PaymentManager.close()
+        return payment, session
+
+    payment, session = asyncio.run(scenario())
+
+    assert payment.status == 'succeeded'
+    assert session.closed
+    assert payments.yookassa._session is None
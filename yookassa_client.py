@@ -0,0 +1,124 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from types import SimpleNamespace
+import uuid
+import aiohttp
+import config
+
+logger = logging.getLogger(__name__)
+
+# HTTP-статусы ЮKassa, после которых запрос повторяется с тем же ключом идемпотентности.
+# 202 - запрос еще обрабатывается, ответ надо запросить повторно
+RETRY_STATUSES = (202, 429, 500, 502, 503, 504)
+
+
+class YooKassaError(Exception):
+    """Ошибка API ЮKassa: HTTP-статус и описание из ответа"""
+
+    def __init__(self, status, description):
+        super().__init__(f"ЮKassa ответила {status}: {description}")
+        self.status = status
+        self.description = description
+
+
+def _loads(text):
+    """JSON ответа как объекты с атрибутами: payment.confirmation.confirmation_url"""
+    return json.loads(text, object_hook=lambda fields: SimpleNamespace(**fields))
+
+
+def is_retryable(error):
+    """Временная ошибка: перегрузка или сбой ЮKassa, сеть, таймаут"""
+    if isinstance(error, YooKassaError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def retry_delay(attempt):
+    """Пауза перед повтором: случайная от 0 до удваивающегося предела"""
+    return random.uniform(0, min(config.YKASSA_RETRY_MAX_DELAY, config.YKASSA_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class YooKassaClient:
+    """Асинхронный клиент API ЮKassa поверх одной aiohttp-сессии.
+
+    SDK yookassa синхронный: каждый запрос останавливал event loop бота на
+    время HTTPS-запроса. Сессия держит пул из YKASSA_POOL_SIZE соединений
+    с keep-alive, так что TLS-рукопожатие не повторяется на каждый платеж.
+    Временные ошибки повторяются до YKASSA_RETRY_ATTEMPTS раз; POST-запросы
+    повторяются с тем же Idempotence-Key, и второй платеж не создается.
+    """
+
+    def __init__(self, base_url=None, shop_id=None, secret_key=None):
+        self.base_url = (base_url or config.YKASSA_API_URL).rstrip('/')
+        self._auth = aiohttp.BasicAuth(str(shop_id or config.YKASSA_SHOP_ID),
+                                       secret_key or config.YKASSA_SECRET_KEY)
+        self._session = None
+        self.metrics = {'requests': 0, 'retries': 0, 'errors': 0, 'last_latency_ms': 0.0, 'max_latency_ms': 0.0}
+
+    def _get_session(self):
+        # Сессия создается при первом запросе - уже внутри работающего event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=self._auth,
+                connector=aiohttp.TCPConnector(limit=config.YKASSA_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=config.YKASSA_TIMEOUT,
+                                              connect=config.YKASSA_CONNECT_TIMEOUT),
+            )
+        return self._session
+
+    async def request(self, method, path, payload=None, idempotence_key=None):
+        """Выполняет запрос к API с повторами и возвращает ответ как объект"""
+        headers = {}
+        if method == 'POST':
+            headers['Idempotence-Key'] = idempotence_key or str(uuid.uuid4())
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            self.metrics['requests'] += 1
+            try:
+                async with self._get_session().request(method, self.base_url + path,
+                                                       json=payload, headers=headers) as response:
+                    if response.status == 200:
+                        result = await response.json(loads=_loads, content_type=None)
+                        latency_ms = (time.perf_counter() - started) * 1000
+                        self.metrics['last_latency_ms'] = latency_ms
+                        self.metrics['max_latency_ms'] = max(self.metrics['max_latency_ms'], latency_ms)
+                        return result
+                    error = YooKassaError(response.status, await response.text())
+            except asyncio.TimeoutError:
+                error = asyncio.TimeoutError(f"нет ответа ЮKassa за {config.YKASSA_TIMEOUT} с")
+            except aiohttp.ClientError as e:
+                error = e
+
+            if not is_retryable(error) or attempt >= config.YKASSA_RETRY_ATTEMPTS:
+                self.metrics['errors'] += 1
+                raise error
+            delay = retry_delay(attempt)
+            attempt += 1
+            self.metrics['retries'] += 1
+            logger.warning(f"ЮKassa {method} {path}: {error}, "
+                           f"повтор {attempt} через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+    async def create_payment(self, payment_data, idempotence_key=None):
+        """Создает платеж (аналог Payment.create)"""
+        return await self.request('POST', '/payments', payment_data, idempotence_key)
+
+    async def find_payment(self, payment_id):
+        """Получает платеж по ID (аналог Payment.find_one)"""
+        return await self.request('GET', f'/payments/{payment_id}')
+
+    async def create_refund(self, refund_data, idempotence_key=None):
+        """Создает возврат (аналог Refund.create)"""
+        return await self.request('POST', '/refunds', refund_data, idempotence_key)
+
+    async def close(self):
+        """Закрывает сессию и пул соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+